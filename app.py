@@ -5,9 +5,22 @@ import numpy as np  # Numerical computations
 import plotly.express as px  # Data visualization library
 import plotly.graph_objects as go  # Advanced graph creation
 from datetime import datetime, timedelta  # Date and time manipulation
-import time  # For adding delays in the UI
-import hashlib  # For password hashing (security)
 import base64  # For encoding/decoding (available but not currently used)
+import os  # For reading configuration from environment variables
+from storage import MemoryStore, SQLiteStore, seed_sample_data  # Shared data store
+from overlay import OverlayStore  # Per-session copy-on-write view of the shared snapshot
+import journal  # Append-only journal behind the durable in-memory store
+import snapshot  # Memory-mapped snapshots the durable in-memory store starts from
+import export  # Streaming CSV/Parquet/Arrow exports
+from figure_cache import VersionedCache  # Cache for dashboard figures
+from ingest import IngestWorker  # Background usage record ingestion
+from lifecycle import LifecycleScheduler, LifecycleWorker  # Automatic expiry and renewal reminders
+import auth  # Password hashing and login throttling
+import plan_scoring  # Scores catalog plans against customer needs
+import bulk_ops  # Plan migrations, repricing and bulk status changes
+
+# Page sizes offered in Customer Management
+CUSTOMER_PAGE_SIZES = [10, 25, 50, 100]
 
 # Configure the Streamlit page settings
 st.set_page_config(
@@ -177,74 +190,76 @@ def set_bg_image():
         unsafe_allow_html=True  # Allow HTML rendering in markdown
     )
 
-# Initialize application data
+# Open the process-wide data store once and share it across all sessions
+@st.cache_resource
+def get_store():
+    if os.environ.get('BROADBAND_STORE') == 'journal':
+        # In-memory store made durable by an append-only journal (BROADBAND_JOURNAL; BROADBAND_FSYNC=0
+        # leaves flushing to disk to the operating system), loaded from its newest snapshot plus the log tail
+        path = os.environ.get('BROADBAND_JOURNAL', 'broadband.journal')
+        store = journal.open_store(path, fsync=os.environ.get('BROADBAND_FSYNC', '1') != '0')
+        # Snapshot it every BROADBAND_SNAPSHOT_INTERVAL seconds (when something changed)
+        snapshot.SnapshotWorker(store, f'{path}-snapshots',
+                                interval=int(os.environ.get('BROADBAND_SNAPSHOT_INTERVAL', 600))).start()
+    else:
+        # Database file location (override with the BROADBAND_DB environment variable)
+        store = SQLiteStore(os.environ.get('BROADBAND_DB', 'broadband.db'))
+    # Seed demo data the first time the database is created
+    if store.is_empty():
+        seed_sample_data(store)
+    # Ingest usage record files dropped into BROADBAND_INGEST_DIR in the background
+    if os.environ.get('BROADBAND_INGEST_DIR'):
+        IngestWorker(store, os.environ['BROADBAND_INGEST_DIR']).start()
+    return store
+
+# Sandbox mode (BROADBAND_STORE=memory): no database; every session starts from the same demo
+# data and its changes stay private to it
+def sandbox_mode():
+    return os.environ.get('BROADBAND_STORE') == 'memory'
+
+# Build the process-wide read-only snapshot sandbox sessions start from
+@st.cache_resource
+def get_snapshot():
+    snapshot = MemoryStore()
+    seed_sample_data(snapshot)
+    # Expire what has already ended (the snapshot is read-only from here on)
+    LifecycleScheduler(snapshot).tick()
+    # Freeze the shared arrays so no session can modify them in place
+    snapshot.freeze()
+    return snapshot
+
+# Process-wide lifecycle scheduler: expires ended subscriptions and raises renewal reminders in the background
+@st.cache_resource
+def get_scheduler():
+    scheduler = LifecycleScheduler(get_store())
+    # Catch up on everything that ended while the portal was down, then tick every minute
+    scheduler.tick()
+    LifecycleWorker(scheduler).start()
+    return scheduler
+
+# Process-wide login verifier (bounded hashing pool and throttling shared by all sessions)
+@st.cache_resource
+def get_authenticator():
+    # Cost parameters for new hashes come from BROADBAND_SCRYPT_N/_R/_P
+    return auth.Authenticator(get_snapshot() if sandbox_mode() else get_store(), cost=auth.cost_from_env())
+
+# Process-wide cache of computed views (aggregates and figures), keyed by data version
+@st.cache_resource
+def get_view_cache():
+    return VersionedCache(max_entries=128)
+
+# Initialize per-session UI state (application data lives in the shared store)
 def init_data():
-    # Create users dictionary if it doesn't exist in session state
-    if 'users' not in st.session_state:
-        st.session_state.users = {
-            # Pre-defined admin user
-            'admin': {'password': 'admin123', 'role': 'admin', 'name': 'System Administrator'},
-            # Pre-defined customer user with sample data
-            'customer1': {'password': 'customer1', 'role': 'customer', 'name': 'John Doe', 
-                         'subscriptions': [{'plan': 'Premium', 'status': 'active', 'start_date': '2023-01-15', 'end_date': '2024-01-14', 'data_used': 850, 'data_limit': 1000}],
-                         'usage': {'daily': np.random.randint(5, 20, 30).tolist()},
-                         'personal_details': {'email': 'john@example.com', 'phone': '123-456-7890', 'address': '123 Main St'}},
-            # Additional sample customers
-            'customer2': {'password': 'customer2', 'role': 'customer', 'name': 'Alice Smith', 
-                         'subscriptions': [{'plan': 'Standard', 'status': 'active', 'start_date': '2023-03-10', 'end_date': '2024-03-09', 'data_used': 450, 'data_limit': 1000}],
-                         'usage': {'daily': np.random.randint(3, 15, 30).tolist()},
-                         'personal_details': {'email': 'alice@example.com', 'phone': '234-567-8901', 'address': '456 Oak St'}},
-            'customer3': {'password': 'customer3', 'role': 'customer', 'name': 'Bob Johnson', 
-                         'subscriptions': [{'plan': 'Basic', 'status': 'active', 'start_date': '2023-05-20', 'end_date': '2024-05-19', 'data_used': 300, 'data_limit': 500}],
-                         'usage': {'daily': np.random.randint(2, 10, 30).tolist()},
-                         'personal_details': {'email': 'bob@example.com', 'phone': '345-678-9012', 'address': '789 Pine St'}}
-        }
-    
-    # Create plans list if it doesn't exist in session state
-    if 'plans' not in st.session_state:
-        st.session_state.plans = [
-            # Basic plan
-            {'name': 'Basic', 'speed': '50 Mbps', 'price': 29.99, 'data_cap': '500 GB', 'description': 'For light browsing and streaming'},
-            # Standard plan
-            {'name': 'Standard', 'speed': '100 Mbps', 'price': 49.99, 'data_cap': '1 TB', 'description': 'For families and remote work'},
-            # Premium plan
-            {'name': 'Premium', 'speed': '1 Gbps', 'price': 79.99, 'data_cap': 'Unlimited', 'description': 'For gaming and 4K streaming'}
-        ]
+    if sandbox_mode():
+        # Give the session its own overlay over the shared snapshot (it holds only the session's changes)
+        if 'store' not in st.session_state:
+            st.session_state.store = OverlayStore(get_snapshot())
+    else:
+        # Attach the shared store to this session (O(1) after the first session)
+        st.session_state.store = get_store()
+        # Make sure the lifecycle scheduler is running
+        get_scheduler()
     
-    # Create subscriptions list if it doesn't exist in session state
-    if 'subscriptions' not in st.session_state:
-        # Generate sample subscription data
-        subscriptions = []  # Empty list to store subscriptions
-        statuses = ['active', 'expired', 'cancelled']  # Possible subscription statuses
-        plans = ['Basic', 'Standard', 'Premium']  # Available plans
-        
-        # Create 100 sample subscriptions
-        for i in range(100):
-            # Random start date within the past year
-            sub_date = datetime.now() - timedelta(days=np.random.randint(1, 365))
-            # End date one year after start date
-            end_date = sub_date + timedelta(days=365)
-            # Random status with weighted probabilities
-            status = np.random.choice(statuses, p=[0.7, 0.2, 0.1])
-            # Random plan selection
-            plan_name = np.random.choice(plans)
-            
-            # Get the price for the selected plan
-            plan_price = next((p['price'] for p in st.session_state.plans if p['name'] == plan_name), 29.99)
-            
-            # Add subscription to list
-            subscriptions.append({
-                'user_id': f'user_{i}',  # Unique user ID
-                'plan': plan_name,  # Plan name
-                'status': status,  # Subscription status
-                'start_date': sub_date.strftime('%Y-%m-%d'),  # Formatted start date
-                'end_date': end_date.strftime('%Y-%m-%d'),  # Formatted end date
-                'price': plan_price  # Plan price
-            })
-        
-        # Store subscriptions in session state
-        st.session_state.subscriptions = subscriptions
-        
     # Initialize admin tab state if it doesn't exist
     if 'admin_tab' not in st.session_state:
         st.session_state.admin_tab = "Dashboard"  # Default to Dashboard tab
@@ -260,64 +275,50 @@ def init_data():
     # Initialize renew subscription index state if it doesn't exist
     if 'renew_sub_index' not in st.session_state:
         st.session_state.renew_sub_index = None  # No renewal in progress
-    
-    # Initialize revenue data if it doesn't exist
-    if 'revenue_data' not in st.session_state:
-        st.session_state.revenue_data = calculate_revenue()  # Calculate initial revenue
 
-# Calculate revenue from all active subscriptions
-def calculate_revenue():
-    revenue_data = {}  # Empty dictionary to store revenue by plan
-    
-    # Calculate revenue for each plan
-    for plan in st.session_state.plans:
-        # Find all active subscriptions for this plan
-        plan_subs = [s for s in st.session_state.subscriptions if s['plan'] == plan['name'] and s['status'] == 'active']
-        # Calculate total revenue for this plan
-        revenue = len(plan_subs) * plan['price']
-        # Store revenue for this plan
-        revenue_data[plan['name']] = revenue
-    
-    # Calculate total revenue across all plans
-    revenue_data['Total'] = sum(revenue_data.values())
-    # Return the revenue data
-    return revenue_data
+# Queue a message for this session to show on the next run, so handlers can rerun immediately
+# kind is the Streamlit status element to use: 'success', 'info', 'warning' or 'error'
+def flash(message, kind='success'):
+    st.session_state.setdefault('flash_messages', []).append((kind, message))
 
-# Hash a password for security
-def make_hashes(password):
-    # Create SHA256 hash of the password
-    return hashlib.sha256(str.encode(password)).hexdigest()
+# Show and clear the messages queued by flash()
+def show_flash_messages():
+    for kind, message in st.session_state.pop('flash_messages', []):
+        getattr(st, kind)(message)
 
-# Check if a password matches its hash
-def check_hashes(password, hashed_text):
-    # Compare hash of input password with stored hash
-    return make_hashes(password) == hashed_text
+# Count a run of the page or of one of its panels and, if enabled in the sidebar, show the count
+# Panels are fragments, so their counts grow while the page count stays put
+def panel_stamp(name):
+    runs = st.session_state.setdefault('panel_runs', {})
+    runs[name] = runs.get(name, 0) + 1
+    if st.session_state.get('show_panel_runs'):
+        st.caption(f"⟳ {name} run #{runs[name]} at {datetime.now():%H:%M:%S}")
 
-# Authenticate a user login attempt
+# Verify a login through the shared authenticator; returns (auth.OK | INVALID | THROTTLED | BUSY, retry seconds)
 def login_user(username, password):
-    # Check if username exists in users dictionary
-    if username in st.session_state.users:
-        # Check if password matches
-        if st.session_state.users[username]['password'] == password:
-            return True  # Authentication successful
-    return False  # Authentication failed
+    # Client address for per-client throttling (None when not served over HTTP)
+    client = st.context.ip_address
+    # Check against this session's store (its overlay in sandbox mode)
+    return get_authenticator().login(username, password, client, st.session_state.store)
 
 # Register a new user
+# Returns auth.OK, auth.INVALID if the username is already taken, or auth.BUSY when logins are saturated
 def signup_user(username, password, role='customer'):
-    # Check if username already exists
-    if username in st.session_state.users:
-        return False  # Username already taken
-        
-    # Create new user account
-    st.session_state.users[username] = {
-        'password': password,  # Store password (in plain text for demo - not secure for production)
+    # Skip the hashing cost for names that are obviously taken
+    if st.session_state.store.get_user(username) is not None:
+        return auth.INVALID
+    # Salted scrypt hash of the password (computed on the bounded hashing pool)
+    hashed = get_authenticator().hash(password)
+    if hashed == auth.BUSY:
+        return auth.BUSY
+    # Create new user account (returns False if the username is already taken)
+    created = st.session_state.store.add_user(username, {
+        'password': hashed,  # Only the hash is stored
         'role': role,  # User role (default is customer)
         'name': username,  # User's name (defaults to username)
-        'subscriptions': [],  # Empty subscriptions list
-        'usage': {'daily': []},  # Empty usage data
         'personal_details': {}  # Empty personal details
-    }
-    return True  # Registration successful
+    })
+    return auth.OK if created else auth.INVALID
 
 # Create a custom tab navigation component
 def custom_tabs(tabs, key_prefix, default_index=0):
@@ -353,6 +354,58 @@ def custom_tabs(tabs, key_prefix, default_index=0):
     # Return the index of the selected tab
     return selected_index
 
+# Return the cursor of the current page for a paged view
+# The visited page cursors are kept as a stack in session state and reset whenever reset_token changes
+def page_cursor(key, reset_token):
+    if st.session_state.get(f"{key}_token") != reset_token:
+        st.session_state[f"{key}_token"] = reset_token  # Remember what the stack belongs to
+        st.session_state[f"{key}_cursors"] = [None]  # First page starts at no cursor
+    return st.session_state[f"{key}_cursors"][-1]
+
+# Display Previous/Next buttons for a paged view (next_cursor is None on the last page)
+# The cursor stack is changed in the click callbacks, before the panel reruns, so no extra rerun is needed
+def page_nav(key, next_cursor, total_pages=None):
+    cursors = st.session_state[f"{key}_cursors"]
+    col1, col2, col3 = st.columns([1, 2, 1])
+    # Go back one page
+    col1.button("Previous", key=f"{key}_prev", disabled=len(cursors) == 1, on_click=cursors.pop)
+    # Current page number
+    col2.markdown(f"Page {len(cursors)}" + (f" of {total_pages}" if total_pages else ""))
+    # Go forward one page
+    col3.button("Next", key=f"{key}_next", disabled=next_cursor is None, on_click=cursors.append, args=(next_cursor,))
+
+# Display the data export options; the file is generated only when Download is clicked
+# A fragment of its own, so choosing a dataset or format reruns only the export options
+@st.fragment
+def export_panel(store):
+    with st.expander("Export Data"):
+        panel_stamp("Export")
+        col1, col2 = st.columns(2)
+        # Dataset and output format
+        dataset = col1.selectbox("Dataset", list(export.DATASETS), key="export_dataset")
+        fmt = col2.selectbox("Format", list(export.FORMATS), key="export_format")
+        # Columns to include
+        columns = st.multiselect("Columns", export.DATASETS[dataset], default=export.DATASETS[dataset], key=f"export_columns_{dataset}")
+        # Row filters (subscriptions only)
+        filters = {}
+        if dataset == 'subscriptions':
+            col1, col2 = st.columns(2)
+            statuses = col1.multiselect("Status", store.ledger.statuses.labels, key="export_status")
+            plans = col2.multiselect("Plan", [plan.name for plan in store.plans()], key="export_plan")
+            if statuses:
+                filters['status'] = statuses
+            if plans:
+                filters['plan'] = plans
+        extension, mime = export.FORMATS[fmt]
+        # Deferred download: the callable runs only when the button is clicked
+        # (rows are streamed chunk by chunk into a file on disk, which Streamlit reads once to serve it)
+        st.download_button(
+            label=f"Download {dataset.title()} ({fmt})",
+            data=lambda: export.export(store, dataset, fmt, columns or None, filters),
+            file_name=f"{dataset}.{extension}",
+            mime=mime
+        )
+
 # Display the login/signup page
 def login_page():
     set_bg_image()  # Apply background image and styles
@@ -375,14 +428,18 @@ def login_page():
         # When login button is clicked
         if login_form.form_submit_button("Login"):
             # Attempt to authenticate user
-            if login_user(username, password):
+            status, retry_after = login_user(username, password)
+            if status == auth.OK:
                 # Set login state and user information
                 st.session_state.logged_in = True
                 st.session_state.username = username
-                st.session_state.role = st.session_state.users[username]['role']
-                st.success("Logged in successfully!")  # Success message
-                time.sleep(1)  # Brief delay
+                st.session_state.role = st.session_state.store.get_user(username)['role']
+                flash("Logged in successfully!")  # Success message (shown after the rerun)
                 st.rerun()  # Refresh the page
+            elif status == auth.THROTTLED:
+                st.error(f"Too many login attempts. Try again in {int(retry_after) + 1} seconds.")  # Throttled
+            elif status == auth.BUSY:
+                st.error("The portal is busy. Please try again in a moment.")  # Hashing pool saturated
             else:
                 st.error("Invalid username or password")  # Error message
         
@@ -405,18 +462,391 @@ def login_page():
             # Check if passwords match
             if new_password != confirm_password:
                 st.error("Passwords don't match")  # Error message
-            # Attempt to create new account
-            elif signup_user(new_username, new_password):
-                st.success("Account created successfully! Please log in.")  # Success message
             else:
-                st.error("Username already exists")  # Error message
+                # Attempt to create new account
+                status = signup_user(new_username, new_password)
+                if status == auth.OK:
+                    st.success("Account created successfully! Please log in.")  # Success message
+                elif status == auth.BUSY:
+                    st.error("The portal is busy. Please try again in a moment.")  # Hashing pool saturated
+                else:
+                    st.error("Username already exists")  # Error message
                 
         st.markdown('</div>', unsafe_allow_html=True)  # End login container
 
+# Compute the admin dashboard metrics and figures
+def build_admin_dashboard(store):
+    ledger = store.ledger  # Columnar subscription ledger
+    # Count subscriptions by status (active, expired, cancelled) from the status index
+    status_counts = store.index.counts(ledger, 'status')
+    
+    # Update revenue data
+    revenue_data = store.revenue.revenue_data()
+    
+    # Count total customers (users with customer role)
+    total_customers = store.count_users('customer')
+    
+    view = {}  # Metrics and figures for the dashboard
+    # Metric labels and values, one per column
+    view['metrics'] = [
+        ("Total Subscriptions", len(ledger)),
+        ("Active Subscriptions", int(status_counts['active'])),
+        ("Expired Subscriptions", int(status_counts['expired'])),
+        ("Cancelled Subscriptions", int(status_counts['cancelled'])),
+        ("Total Customers", total_customers),
+        ("Total Revenue", f"${revenue_data['Total']:,.2f}")  # Formatted as currency
+    ]
+    
+    # Create DataFrame for revenue data
+    revenue_df = pd.DataFrame({
+        'Plan': [plan for plan in revenue_data.keys() if plan != 'Total'],
+        'Revenue': [revenue_data[plan] for plan in revenue_data.keys() if plan != 'Total']
+    })
+    # Create bar chart of revenue by plan
+    view['fig_rev'] = px.bar(revenue_df, x='Plan', y='Revenue', title="Revenue by Plan")
+    
+    # Count subscriptions by plan
+    plan_counts = store.index.counts(ledger, 'plan')
+    plan_counts = plan_counts[plan_counts > 0]  # Skip plans nobody subscribes to
+    # Create pie chart of subscription distribution
+    view['fig1'] = px.pie(values=plan_counts.values, names=plan_counts.index, title="Subscription Distribution by Plan")
+    
+    # Statuses that occur at least once (counted above)
+    status_counts = status_counts[status_counts > 0]
+    # Create bar chart of status distribution
+    view['fig2'] = px.bar(x=status_counts.index, y=status_counts.values, 
+                          labels={'x': 'Status', 'y': 'Count'}, title="Subscription Status")
+    
+    # New subscriptions per day over the last 30 days, read from the day buckets of the rollups
+    new_subs = store.rollups.series('new', 'day')
+    # Create line chart of daily new subscriptions
+    view['fig3'] = px.line(x=new_subs.index, y=new_subs.values, labels={'x': 'Date', 'y': 'New Subscriptions'})
+    
+    # Create pie chart of revenue distribution (reusing the per-plan revenue DataFrame)
+    view['fig4'] = px.pie(revenue_df, values='Revenue', names='Plan', title="Revenue Distribution by Plan")
+    return view
+
+# Customer Management panel: search, paging, export and per-customer details
+# A fragment, so its widgets rerun only this panel instead of the whole page
+@st.fragment
+def customer_management_panel(store):
+    panel_stamp("Customer Management")
+    # Search box and page size selector
+    search_col, size_col = st.columns([3, 1])
+    search_term = search_col.text_input("Search Customers", placeholder="Search by username, name, email, phone or address")
+    page_size = size_col.selectbox("Customers per page", CUSTOMER_PAGE_SIZES, index=1)
+    # Cursor of the current page (back to the first page when the search or page size changes)
+    cursor = page_cursor("customer_page", (search_term, page_size))
+
+    # Filter customers based on search term
+    if search_term:
+        # Ranked lookup in the customer search index (capped at search.MAX_RESULTS matches)
+        ranked = store.search.rank(search_term)
+        # Cursor is the offset into the ranked matches
+        offset = cursor or 0
+        customers = store.get_users(ranked[offset:offset + page_size])
+        next_cursor = offset + page_size if offset + page_size < len(ranked) else None
+        total_count = len(ranked)
+        # Display match count
+        st.markdown(f"**Matching Customers: {total_count}**")
+    else:
+        # Fetch only the current page of customers (cursor is the last row seen)
+        customers, next_cursor = store.users_page('customer', cursor, page_size)
+        total_count = store.count_users('customer')
+        # Display customer count
+        st.markdown(f"**Total Customers: {total_count}**")
+
+    # Page navigation
+    page_nav("customer_page", next_cursor, -(-total_count // page_size))
+
+    # Check if there are any customers
+    if not customers:
+        st.info("No customers found matching your search criteria.")
+    else:
+        # Summary rows of the page's customers (plan, dates, days remaining, usage) as one ready-made frame
+        customer_df = store.summary.frame(store.ledger, list(customers))
+
+        # Display customer table
+        st.markdown("### Customer Details")
+        st.dataframe(customer_df, use_container_width=True, hide_index=True)
+
+        # Export panel (output is only generated when the download is requested)
+        export_panel(store)
+
+        # Display customer details in expandable sections
+        st.markdown("### Detailed Customer View")
+        # Summary rows by username
+        summaries = customer_df.set_index('Username', drop=False)
+        for username, user in customers.items():
+            # Summary row of the customer
+            summary = summaries.loc[username]
+
+            # Get personal details
+            personal_details = user.get('personal_details', {})
+
+            # Create expandable section for each customer
+            with st.expander(f"{user.get('name', '')} ({username})"):
+                # Two-column layout for customer details
+                col1, col2 = st.columns(2)
+
+                with col1:
+                    st.markdown("#### Personal Information")
+                    st.write(f"**Name:** {user.get('name', '')}")
+                    st.write(f"**Email:** {personal_details.get('email', 'Not provided')}")
+                    st.write(f"**Phone:** {personal_details.get('phone', 'Not provided')}")
+                    st.write(f"**Address:** {personal_details.get('address', 'Not provided')}")
+
+                with col2:
+                    st.markdown("#### Subscription Information")
+                    if summary['Current Plan'] != 'None':
+                        st.write(f"**Current Plan:** {summary['Current Plan']}")
+                        st.write(f"**Status:** {summary['Plan Status']}")
+                        st.write(f"**Start Date:** {summary['Start Date']}")
+                        st.write(f"**End Date:** {summary['End Date']}")
+
+                        # Days remaining (precomputed in the summary)
+                        days_remaining = summary['Days Remaining']
+                        status_color = "green" if days_remaining > 30 else "orange" if days_remaining > 7 else "red"
+                        st.write(f"**Days Remaining:** <span style='color:{status_color};'>{days_remaining}</span>", unsafe_allow_html=True)
+                    else:
+                        st.warning("No active subscription")
+
+                # Action buttons for customer management
+                st.markdown("#### Actions")
+                action_col1, action_col2, action_col3 = st.columns(3)
+
+                with action_col1:
+                    if st.button("View Usage", key=f"usage_{username}"):
+                        st.session_state.selected_customer = username
+                        st.info(f"Viewing usage data for {user.get('name', '')}")
+
+                with action_col2:
+                    if st.button("Contact", key=f"contact_{username}"):
+                        st.info(f"Contacting {user.get('name', '')} at {personal_details.get('email', 'No email available')}")
+
+                with action_col3:
+                    if st.button("Suspend Account", key=f"suspend_{username}"):
+                        # Suspend the customer's active subscriptions (suspended ones earn nothing and do not expire)
+                        active_ids = bulk_ops.select(store, users=[username], statuses=['active'])
+                        if len(active_ids):
+                            changed = bulk_ops.set_status(store, active_ids, 'suspended')
+                            flash(f"Suspended {changed} subscriptions of {username}", 'warning')
+                            st.rerun()  # Refresh the page
+                        else:
+                            st.info(f"{username} has no active subscriptions to suspend")
+
+# Manage Plans panel: current plans with delete buttons and the add-plan form
+@st.fragment
+def plan_management_panel(store):
+    panel_stamp("Manage Plans")
+    # Plans in the database that could not be read are left out of the catalog; tell the admin
+    for name, error in store.skipped_plans:
+        st.warning(f"Plan {name!r} could not be loaded and is hidden from the catalog: {error}")
+    # Display current plans
+    st.markdown("#### Current Plans")
+    # Loop through each plan
+    for i, plan in enumerate(store.plans()):
+        # Create expandable section for each plan
+        with st.expander(f"{plan.name} - ${plan.price}/month"):
+            # Two-column layout for plan details
+            col1, col2 = st.columns(2)
+            with col1:
+                # Display plan speed
+                st.write(f"**Speed:** {plan.speed}")
+                # Display data cap
+                st.write(f"**Data Cap:** {plan.data_cap}")
+            with col2:
+                # Display plan price
+                st.write(f"**Price:** ${plan.price}")
+                # Display plan description
+                st.write(f"**Description:** {plan.description}")
+
+            # Delete plan button
+            if st.button(f"Delete {plan.name}", key=f"del_{i}"):
+                # Plans with active or suspended subscribers must be migrated first
+                if bulk_ops.plan_holders(store, plan.name):
+                    st.error(f"{plan.name} still has active or suspended subscribers; "
+                             "migrate them to another plan first")
+                else:
+                    # Remove plan from the catalog
+                    store.delete_plan(plan.name)
+                    # Success message (shown after the rerun)
+                    flash(f"Removed {plan.name} plan")
+                    st.rerun()  # Refresh the page
+
+    # Add new plan form
+    st.markdown("#### Add New Plan")
+    # Create form for adding new plans
+    with st.form("add_plan_form"):
+        # Two-column layout for form fields
+        col1, col2 = st.columns(2)
+        with col1:
+            # Plan name input
+            new_name = st.text_input("Plan Name")
+            # Plan speed input
+            new_speed = st.text_input("Speed")
+        with col2:
+            # Plan price input (numeric)
+            new_price = st.number_input("Price ($)", min_value=0.0, step=0.01)
+            # Data cap input
+            new_data_cap = st.text_input("Data Cap")
+
+        # Plan description text area
+        new_description = st.text_area("Description")
+
+        # When Add Plan button is clicked
+        if st.form_submit_button("Add Plan"):
+            # Validate that all required fields are filled
+            if new_name and new_speed and new_price and new_data_cap:
+                # Plan names must be unique
+                if new_name in store.catalog:
+                    st.error(f"A plan named {new_name} already exists")
+                else:
+                    try:
+                        # Add new plan to the catalog (speed and data cap are parsed and validated)
+                        store.add_plan({
+                            'name': new_name,
+                            'speed': new_speed,
+                            'price': new_price,
+                            'data_cap': new_data_cap,
+                            'description': new_description
+                        })
+                    except ValueError as error:
+                        # Error message if the speed or data cap cannot be read
+                        st.error(str(error))
+                    else:
+                        # Success message (shown after the rerun)
+                        flash(f"Added {new_name} plan")
+                        st.rerun()  # Refresh the page
+            else:
+                # Error message if validation fails
+                st.error("Please fill all required fields")
+
+# Bulk operations: plan migration, repricing and status changes or renewals by filter
+# Each action is one vectorized store update, however many subscriptions it touches
+@st.fragment
+def bulk_operations_panel(store):
+    panel_stamp("Bulk Operations")
+    # Catalog plan names
+    plan_names = [plan.name for plan in store.plans()]
+    # Plans subscriptions are on (includes plans since removed from the catalog)
+    ledger_plans = sorted(set(store.ledger.plans.labels))
+
+    # Migrate every active subscriber of one plan to another
+    st.markdown("#### Migrate Subscribers")
+    # Three-column layout for the migration
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        # Plan to move subscribers off
+        source = st.selectbox("From plan", ledger_plans, key="bulk_source")
+    with col2:
+        # Catalog plan to move them to
+        target = st.selectbox("To plan", plan_names, key="bulk_target")
+    with col3:
+        # Spacer for alignment
+        st.write("")
+        st.write("")
+        # Confirm migration button
+        if st.button("Migrate", key="bulk_migrate"):
+            if source == target:
+                # Error message if both plans are the same
+                st.error("Choose two different plans")
+            else:
+                # Move the subscribers at the target's price and data limit
+                moved = bulk_ops.migrate_plan(store, source, target)
+                # Success message (shown after the rerun)
+                flash(f"Moved {moved} subscriptions from {source} to {target}")
+                st.rerun()  # Refresh the page
+
+    # Change a plan's price now or from a later date
+    st.markdown("#### Reprice Plan")
+    # Four-column layout for repricing
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        # Plan to reprice
+        reprice_name = st.selectbox("Plan", plan_names, key="bulk_reprice_plan")
+    with col2:
+        # New monthly price
+        new_price = st.number_input("New price ($)", min_value=0.0, step=0.01, key="bulk_reprice_price")
+    with col3:
+        # Date the price takes effect (today applies it at once)
+        effective = st.date_input("Effective from", datetime.now().date(), key="bulk_reprice_date")
+    with col4:
+        # Spacer for alignment
+        st.write("")
+        st.write("")
+        # Confirm repricing button
+        if st.button("Reprice", key="bulk_reprice"):
+            # Reprice the plan and its active subscriptions, or schedule the change
+            repriced = bulk_ops.reprice_plan(store, reprice_name, new_price, effective)
+            if effective > datetime.now().date():
+                # Success message for a scheduled change (shown after the rerun)
+                flash(f"{reprice_name} will cost ${new_price:.2f} from {effective}")
+            else:
+                # Success message for an immediate change (shown after the rerun)
+                flash(f"Repriced {reprice_name} and {repriced} active subscriptions to ${new_price:.2f}")
+            st.rerun()  # Refresh the page
+
+    # Scheduled price changes, applied by the lifecycle scheduler on their effective dates
+    pending = store.price_changes()
+    if pending:
+        st.dataframe(pd.DataFrame(pending).rename(columns={'plan': 'Plan', 'price': 'New Price',
+                                                           'effective': 'Effective From'}),
+                     hide_index=True)
+
+    # Status changes and renewals for every subscription matching a filter
+    st.markdown("#### Suspend, Cancel or Renew by Filter")
+    # Two-column layout for the filters
+    col1, col2 = st.columns(2)
+    with col1:
+        # Plans to match (none selected = every plan)
+        filter_plans = st.multiselect("Plans", ledger_plans, key="bulk_plans")
+        # Statuses to match
+        filter_statuses = st.multiselect("Statuses", list(bulk_ops.BULK_STATUSES) + ['expired'],
+                                         default=['active'], key="bulk_statuses")
+    with col2:
+        # End date range to match (empty = no range)
+        ends = st.date_input("Ending between", [], key="bulk_ends")
+        # Minimum share of the data limit used (0 = no filter)
+        min_usage = st.slider("Minimum data used (%)", 0, 100, 0, key="bulk_usage")
+
+    # Subscriptions matching the filters
+    matched = bulk_ops.select(store, plans=filter_plans or None, statuses=filter_statuses or None,
+                              ends_from=ends[0] if len(ends) > 0 else None,
+                              ends_to=ends[1] if len(ends) > 1 else None,
+                              min_usage=min_usage / 100 if min_usage else None)
+    # Preview count
+    st.write(f"**Matching subscriptions:** {len(matched)}")
+
+    # Four-column layout for the actions
+    col1, col2, col3, col4 = st.columns(4)
+    # Status actions (button label, status, past tense, message kind)
+    actions = [("Suspend", 'suspended', "Suspended", 'warning'), ("Cancel", 'cancelled', "Cancelled", 'warning'),
+               ("Reactivate", 'active', "Reactivated", 'success')]
+    for col, (label, status, done, kind) in zip((col1, col2, col3), actions):
+        with col:
+            if st.button(label, key=f"bulk_{status}", disabled=not len(matched)):
+                # Set the status of every matching subscription
+                changed = bulk_ops.set_status(store, matched, status)
+                # Message (shown after the rerun)
+                flash(f"{done} {changed} subscriptions", kind)
+                st.rerun()  # Refresh the page
+    with col4:
+        # Months to renew the matching subscriptions for
+        months = st.number_input("Months", min_value=1, max_value=24, value=12, key="bulk_months")
+        if st.button("Renew", key="bulk_renew", disabled=not len(matched)):
+            # Extend the end date of every matching subscription
+            renewed = bulk_ops.renew(store, matched, 30 * months)
+            # Success message (shown after the rerun)
+            flash(f"Renewed {renewed} subscriptions for {months} months")
+            st.rerun()  # Refresh the page
+
 # Display the admin dashboard
 def admin_dashboard():
+    # Shared data store
+    store = st.session_state.store
     # Welcome message in sidebar
-    st.sidebar.markdown(f"### Welcome, {st.session_state.users[st.session_state.username]['name']}")
+    st.sidebar.markdown(f"### Welcome, {store.get_user(st.session_state.username)['name']}")
     # Logout button in sidebar
     if st.sidebar.button("Logout"):
         # Clear session state and return to login page
@@ -442,294 +872,127 @@ def admin_dashboard():
         # Dashboard header
         st.markdown("<h2 class='sub-header'>Admin Dashboard</h2>", unsafe_allow_html=True)
         
-        # Calculate metrics for dashboard
-        # Count active subscriptions
-        active_subs = [s for s in st.session_state.subscriptions if s['status'] == 'active']
-        # Count expired subscriptions
-        expired_subs = [s for s in st.session_state.subscriptions if s['status'] == 'expired']
-        # Count cancelled subscriptions
-        cancelled_subs = [s for s in st.session_state.subscriptions if s['status'] == 'cancelled']
-        
-        # Update revenue data
-        st.session_state.revenue_data = calculate_revenue()
-        
-        # Count total customers (users with customer role)
-        total_customers = len([user for username, user in st.session_state.users.items() if user.get('role') == 'customer'])
+        # Metrics and figures, rebuilt only when the data version changes
+        view = get_view_cache().get(('admin_dashboard', datetime.now().date()), store.version,
+                                    lambda: build_admin_dashboard(store))
         
         # Display metrics in columns
-        col1, col2, col3, col4, col5, col6 = st.columns(6)
-        # Total subscriptions metric
-        col1.metric("Total Subscriptions", len(st.session_state.subscriptions))
-        # Active subscriptions metric
-        col2.metric("Active Subscriptions", len(active_subs))
-        # Expired subscriptions metric
-        col3.metric("Expired Subscriptions", len(expired_subs))
-        # Cancelled subscriptions metric
-        col4.metric("Cancelled Subscriptions", len(cancelled_subs))
-        # Total customers metric
-        col5.metric("Total Customers", total_customers)
-        # Total revenue metric (formatted as currency)
-        col6.metric("Total Revenue", f"${st.session_state.revenue_data['Total']:,.2f}")
+        for col, (label, value) in zip(st.columns(6), view['metrics']):
+            col.metric(label, value)
         
         # Revenue by plan chart
         st.markdown("#### Revenue by Plan")
-        # Create DataFrame for revenue data
-        revenue_df = pd.DataFrame({
-            'Plan': [plan for plan in st.session_state.revenue_data.keys() if plan != 'Total'],
-            'Revenue': [st.session_state.revenue_data[plan] for plan in st.session_state.revenue_data.keys() if plan != 'Total']
-        })
-        
-        # Create bar chart of revenue by plan
-        fig_rev = px.bar(revenue_df, x='Plan', y='Revenue', title="Revenue by Plan")
-        # Display the chart
-        st.plotly_chart(fig_rev, use_container_width=True)
+        st.plotly_chart(view['fig_rev'], use_container_width=True)
         
         # Subscription distribution by plan chart
         st.markdown("#### Subscriptions by Plan")
-        # Count subscriptions by plan
-        plan_counts = pd.DataFrame(st.session_state.subscriptions)['plan'].value_counts()
-        # Create pie chart of subscription distribution
-        fig1 = px.pie(values=plan_counts.values, names=plan_counts.index, title="Subscription Distribution by Plan")
-        # Display the chart
-        st.plotly_chart(fig1, use_container_width=True)
+        st.plotly_chart(view['fig1'], use_container_width=True)
         
         # Subscription status distribution chart
         st.markdown("#### Subscription Status Distribution")
-        # Count subscriptions by status
-        status_counts = pd.DataFrame(st.session_state.subscriptions)['status'].value_counts()
-        # Create bar chart of status distribution
-        fig2 = px.bar(x=status_counts.index, y=status_counts.values, 
-                     labels={'x': 'Status', 'y': 'Count'}, title="Subscription Status")
-        # Display the chart
-        st.plotly_chart(fig2, use_container_width=True)
+        st.plotly_chart(view['fig2'], use_container_width=True)
         
         # Daily new subscriptions chart
         st.markdown("#### Daily New Subscriptions (Last 30 Days)")
-        # Generate dates for the last 30 days
-        dates = [datetime.now() - timedelta(days=i) for i in range(30, 0, -1)]
-        # Generate random new subscription counts
-        new_subs = np.random.randint(0, 10, 30).tolist()
-        # Create line chart of daily new subscriptions
-        fig3 = px.line(x=dates, y=new_subs, labels={'x': 'Date', 'y': 'New Subscriptions'})
-        # Display the chart
-        st.plotly_chart(fig3, use_container_width=True)
+        st.plotly_chart(view['fig3'], use_container_width=True)
         
         # Revenue distribution by plan chart
         st.markdown("#### Revenue Distribution by Plan")
-        revenue_data = []  # Empty list to store revenue data
-        # Calculate revenue for each plan
-        for plan in st.session_state.plans:
-            # Find active subscriptions for this plan
-            plan_subs = [s for s in st.session_state.subscriptions if s['plan'] == plan['name'] and s['status'] == 'active']
-            # Calculate total revenue
-            revenue = len(plan_subs) * plan['price']
-            # Add to revenue data list
-            revenue_data.append({'Plan': plan['name'], 'Revenue': revenue})
-        
-        # Create DataFrame from revenue data
-        revenue_df = pd.DataFrame(revenue_data)
-        # Create pie chart of revenue distribution
-        fig4 = px.pie(revenue_df, values='Revenue', names='Plan', title="Revenue Distribution by Plan")
-        # Display the chart
-        st.plotly_chart(fig4, use_container_width=True)
+        st.plotly_chart(view['fig4'], use_container_width=True)
     
     # Customer Management tab content
     elif tabs[selected_index] == "Customer Management":
         # Customer Management header
         st.markdown("<h2 class='sub-header'>Customer Management</h2>", unsafe_allow_html=True)
         
-        # Search box for filtering customers
-        search_term = st.text_input("Search Customers", placeholder="Enter customer name or username")
-        
-        # Get all customer users
-        customers = {username: user for username, user in st.session_state.users.items() if user.get('role') == 'customer'}
-        
-        # Filter customers based on search term
-        if search_term:
-            customers = {username: user for username, user in customers.items() 
-                        if search_term.lower() in username.lower() or 
-                        search_term.lower() in user.get('name', '').lower()}
-        
-        # Display customer count
-        st.markdown(f"**Total Customers: {len(customers)}**")
-        
-        # Check if there are any customers
-        if not customers:
-            st.info("No customers found matching your search criteria.")
-        else:
-            # Create a list to store customer data for the table
-            customer_data = []
-            
-            # Process each customer
-            for username, user in customers.items():
-                # Get active subscription if exists
-                active_sub = next((sub for sub in user.get('subscriptions', []) if sub['status'] == 'active'), None)
-                
-                # Get personal details
-                personal_details = user.get('personal_details', {})
-                
-                # Add customer data to list
-                customer_data.append({
-                    'Username': username,
-                    'Name': user.get('name', ''),
-                    'Email': personal_details.get('email', ''),
-                    'Phone': personal_details.get('phone', ''),
-                    'Address': personal_details.get('address', ''),
-                    'Current Plan': active_sub['plan'] if active_sub else 'None',
-                    'Plan Status': active_sub['status'] if active_sub else 'None',
-                    'Start Date': active_sub['start_date'] if active_sub else 'N/A',
-                    'End Date': active_sub['end_date'] if active_sub else 'N/A'
-                })
-            
-            # Create DataFrame from customer data
-            customer_df = pd.DataFrame(customer_data)
-            
-            # Display customer table
-            st.markdown("### Customer Details")
-            st.dataframe(customer_df, use_container_width=True)
-            
-            # Option to download customer data as CSV
-            csv = customer_df.to_csv(index=False)
-            st.download_button(
-                label="Download Customer Data as CSV",
-                data=csv,
-                file_name="customers.csv",
-                mime="text/csv"
-            )
-            
-            # Display customer details in expandable sections
-            st.markdown("### Detailed Customer View")
-            for username, user in customers.items():
-                # Get active subscription if exists
-                active_sub = next((sub for sub in user.get('subscriptions', []) if sub['status'] == 'active'), None)
-                
-                # Get personal details
-                personal_details = user.get('personal_details', {})
-                
-                # Create expandable section for each customer
-                with st.expander(f"{user.get('name', '')} ({username})"):
-                    # Two-column layout for customer details
-                    col1, col2 = st.columns(2)
-                    
-                    with col1:
-                        st.markdown("#### Personal Information")
-                        st.write(f"**Name:** {user.get('name', '')}")
-                        st.write(f"**Email:** {personal_details.get('email', 'Not provided')}")
-                        st.write(f"**Phone:** {personal_details.get('phone', 'Not provided')}")
-                        st.write(f"**Address:** {personal_details.get('address', 'Not provided')}")
-                    
-                    with col2:
-                        st.markdown("#### Subscription Information")
-                        if active_sub:
-                            st.write(f"**Current Plan:** {active_sub['plan']}")
-                            st.write(f"**Status:** {active_sub['status']}")
-                            st.write(f"**Start Date:** {active_sub['start_date']}")
-                            st.write(f"**End Date:** {active_sub['end_date']}")
-                            
-                            # Calculate days remaining
-                            end_date = datetime.strptime(active_sub['end_date'], '%Y-%m-%d')
-                            days_remaining = (end_date - datetime.now()).days
-                            status_color = "green" if days_remaining > 30 else "orange" if days_remaining > 7 else "red"
-                            st.write(f"**Days Remaining:** <span style='color:{status_color};'>{days_remaining}</span>", unsafe_allow_html=True)
-                        else:
-                            st.warning("No active subscription")
-                    
-                    # Action buttons for customer management
-                    st.markdown("#### Actions")
-                    action_col1, action_col2, action_col3 = st.columns(3)
-                    
-                    with action_col1:
-                        if st.button("View Usage", key=f"usage_{username}"):
-                            st.session_state.selected_customer = username
-                            st.info(f"Viewing usage data for {user.get('name', '')}")
-                    
-                    with action_col2:
-                        if st.button("Contact", key=f"contact_{username}"):
-                            st.info(f"Contacting {user.get('name', '')} at {personal_details.get('email', 'No email available')}")
-                    
-                    with action_col3:
-                        if st.button("Suspend Account", key=f"suspend_{username}"):
-                            st.warning(f"Account suspension functionality would be implemented here for {username}")
+        # Search, paging and customer details (reruns on its own when its widgets change)
+        customer_management_panel(store)
     
     # Manage Plans tab content
     elif tabs[selected_index] == "Manage Plans":
         # Manage Plans header
         st.markdown("<h2 class='sub-header'>Manage Subscription Plans</h2>", unsafe_allow_html=True)
         
-        # Display current plans
-        st.markdown("#### Current Plans")
-        # Loop through each plan
-        for i, plan in enumerate(st.session_state.plans):
-            # Create expandable section for each plan
-            with st.expander(f"{plan['name']} - ${plan['price']}/month"):
-                # Two-column layout for plan details
-                col1, col2 = st.columns(2)
-                with col1:
-                    # Display plan speed
-                    st.write(f"**Speed:** {plan['speed']}")
-                    # Display data cap
-                    st.write(f"**Data Cap:** {plan['data_cap']}")
-                with col2:
-                    # Display plan price
-                    st.write(f"**Price:** ${plan['price']}")
-                    # Display plan description
-                    st.write(f"**Description:** {plan['description']}")
-                
-                # Delete plan button
-                if st.button(f"Delete {plan['name']}", key=f"del_{i}"):
-                    # Remove plan from list
-                    st.session_state.plans.pop(i)
-                    # Success message
-                    st.success(f"Removed {plan['name']} plan")
-                    # Update revenue after deletion
-                    st.session_state.revenue_data = calculate_revenue()
-                    st.rerun()  # Refresh the page
-        
-        # Add new plan form
-        st.markdown("#### Add New Plan")
-        # Create form for adding new plans
-        with st.form("add_plan_form"):
-            # Two-column layout for form fields
-            col1, col2 = st.columns(2)
-            with col1:
-                # Plan name input
-                new_name = st.text_input("Plan Name")
-                # Plan speed input
-                new_speed = st.text_input("Speed")
-            with col2:
-                # Plan price input (numeric)
-                new_price = st.number_input("Price ($)", min_value=0.0, step=0.01)
-                # Data cap input
-                new_data_cap = st.text_input("Data Cap")
-            
-            # Plan description text area
-            new_description = st.text_area("Description")
-            
-            # When Add Plan button is clicked
-            if st.form_submit_button("Add Plan"):
-                # Validate that all required fields are filled
-                if new_name and new_speed and new_price and new_data_cap:
-                    # Add new plan to the list
-                    st.session_state.plans.append({
-                        'name': new_name,
-                        'speed': new_speed,
-                        'price': new_price,
-                        'data_cap': new_data_cap,
-                        'description': new_description
-                    })
-                    # Success message
-                    st.success(f"Added {new_name} plan")
-                    # Update revenue after adding new plan
-                    st.session_state.revenue_data = calculate_revenue()
-                    st.rerun()  # Refresh the page
-                else:
-                    # Error message if validation fails
-                    st.error("Please fill all required fields")
+        # Plan list and add-plan form (reruns on its own when its widgets change)
+        plan_management_panel(store)
+
+        # Migrations, repricing and bulk status changes (reruns on its own when its widgets change)
+        st.markdown("<h2 class='sub-header'>Bulk Operations</h2>", unsafe_allow_html=True)
+        bulk_operations_panel(store)
+
+# Create the daily usage line chart for the Usage Analytics tab
+def build_usage_figure(usage_data):
+    # Generate dates for the last 30 days
+    dates = [datetime.now() - timedelta(days=i) for i in range(30, 0, -1)]
+    # Create line chart of daily usage
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=dates, y=usage_data, mode='lines+markers', name='Daily Usage (GB)'))
+    fig.update_layout(title="Your Data Usage (Last 30 Days)", xaxis_title="Date", yaxis_title="Data Used (GB)")
+    return fig
+
+# Renewal options for a subscription: duration slider and confirmation
+@st.fragment
+def renewal_panel(store, current_sub):
+    panel_stamp("Renewal")
+    # Two-column layout for renewal options
+    col1, col2 = st.columns(2)
+    with col1:
+        # Slider for selecting renewal duration
+        months = st.slider("Months to renew", 1, 24, 12)
+    with col2:
+        # Spacer for alignment
+        st.write("")  
+        st.write("")  
+        # Confirm renewal button
+        if st.button("Confirm Renewal"):
+            # Calculate new end date
+            current_end = datetime.strptime(current_sub['end_date'], '%Y-%m-%d')
+            new_end = current_end + timedelta(days=30*months)
+            # Update subscription end date
+            store.update_subscription(current_sub['id'], end_date=new_end.strftime('%Y-%m-%d'))
+            # Success message (shown after the rerun)
+            flash(f"Renewed your plan for {months} months!")
+            # Exit renewal mode
+            st.session_state.renew_sub_index = None
+            st.rerun()  # Refresh the page
+
+# Plan finder: scores the catalog against the customer's answers and recent usage (observed_gb)
+@st.fragment
+def plan_finder_panel(store, observed_gb):
+    panel_stamp("Plan Finder")
+    st.markdown("#### Find the Right Plan for You")
+    # Two-column layout for plan finder inputs
+    col1, col2 = st.columns(2)
+    with col1:
+        # Usage intensity selector
+        usage = st.select_slider("Usage Intensity", options=["Light", "Moderate", "Heavy"])
+        # Number of devices slider
+        devices = st.slider("Number of devices", 1, 10, 3)
+    with col2:
+        # Budget slider
+        budget = st.slider("Budget ($/month)", 20, 100, 50)
+        # Primary activities multi-select
+        activities = st.multiselect("Primary activities", ["Browsing", "Streaming", "Gaming", "Working"])
+
+    # Find My Plan button
+    if st.button("Find My Plan"):
+        # Score every catalog plan against the answers and the customer's usage history
+        best_plan, _ = plan_scoring.recommend(store.catalog, usage, devices, budget, activities, observed_gb)
+
+        # Display recommendation
+        if best_plan:
+            st.success(f"We recommend the {best_plan.name} plan for you!")
+        else:
+            st.info("No plans are available right now.")
+
 
 # Display the customer dashboard
 def customer_dashboard():
-    # Get current user's data
-    user_data = st.session_state.users[st.session_state.username]
+    # Shared data store
+    store = st.session_state.store
+    # Get current user's data and subscriptions
+    user_data = store.get_user(st.session_state.username)
+    user_data['subscriptions'] = store.user_subscriptions(st.session_state.username)
     # Welcome message in sidebar
     st.sidebar.markdown(f"### Welcome, {user_data['name']}")
     # Logout button in sidebar
@@ -776,6 +1039,10 @@ def customer_dashboard():
                 </div>
                 """, unsafe_allow_html=True)
                 
+                # Remind the customer to renew a subscription that ends soon (database mode only)
+                if sub['status'] == 'active' and not sandbox_mode() and get_scheduler().renewal_due(sub['id']):
+                    st.warning(f"Your {sub['plan']} plan ends on {sub['end_date']}. Renew it to keep your service.")
+
                 # Show action buttons for active subscriptions only
                 if sub['status'] == 'active':
                     # Three-column layout for action buttons
@@ -797,9 +1064,9 @@ def customer_dashboard():
                     # Cancel button
                     if col3.button("Cancel", key=f"cancel_{i}"):
                         # Mark subscription as cancelled
-                        user_data['subscriptions'][i]['status'] = 'cancelled'
-                        # Warning message
-                        st.warning(f"Cancelled {sub['plan']} plan!")
+                        store.update_subscription(sub['id'], status='cancelled')
+                        # Warning message (shown after the rerun)
+                        flash(f"Cancelled {sub['plan']} plan!", 'warning')
                         st.rerun()  # Refresh the page
     
     # Browse Plans tab content
@@ -821,138 +1088,98 @@ def customer_dashboard():
             current_sub = user_data['subscriptions'][st.session_state.renew_sub_index]
             st.info(f"You are renewing your {current_sub['plan']} plan. Select renewal options below.")
             
-            # Two-column layout for renewal options
-            col1, col2 = st.columns(2)
-            with col1:
-                # Slider for selecting renewal duration
-                months = st.slider("Months to renew", 1, 24, 12)
-            with col2:
-                # Spacer for alignment
-                st.write("")  
-                st.write("")  
-                # Confirm renewal button
-                if st.button("Confirm Renewal"):
-                    # Calculate new end date
-                    current_end = datetime.strptime(current_sub['end_date'], '%Y-%m-%d')
-                    new_end = current_end + timedelta(days=30*months)
-                    # Update subscription end date
-                    user_data['subscriptions'][st.session_state.renew_sub_index]['end_date'] = new_end.strftime('%Y-%m-%d')
-                    # Success message
-                    st.success(f"Renewed your plan for {months} months!")
-                    # Exit renewal mode
-                    st.session_state.renew_sub_index = None
-                    time.sleep(1)  # Brief delay
-                    st.rerun()  # Refresh the page
+            # Renewal duration and confirmation (reruns on its own when the slider moves)
+            renewal_panel(store, current_sub)
         
         # Show plan recommendations if not in upgrade or renew mode
         if not upgrade_mode and not renew_mode:
             st.markdown("#### Recommended For You")
-            # Simple recommendation logic (always recommends Standard plan)
-            rec_plan = st.session_state.plans[1]
-            # Display recommended plan card
-            st.markdown(f"""
-            <div class="plan-card" style="border: 2px solid #1E88E5;">
-                <h3>🌟 {rec_plan['name']} Plan (Recommended)</h3>
-                <p><strong>Speed:</strong> {rec_plan['speed']} | <strong>Data Cap:</strong> {rec_plan['data_cap']}</p>
-                <p><strong>Price:</strong> ${rec_plan['price']}/month</p>
-                <p>{rec_plan['description']}</p>
-            </div>
-            """, unsafe_allow_html=True)
+            # Usage over the last 30 days of the customer's active subscription (0 if none)
+            active_sub = store.active_subscription(st.session_state.username)
+            observed_gb = float(store.usage.daily(active_sub['id']).sum()) if active_sub else 0.0
+            # Score the catalog for a typical household, raised to the observed usage
+            rec_plan, _ = plan_scoring.recommend(store.catalog, "Moderate", 3, 50, [], observed_gb)
+            # Nothing to recommend when the catalog is empty
+            if rec_plan:
+                # Display recommended plan card
+                st.markdown(f"""
+                <div class="plan-card" style="border: 2px solid #1E88E5;">
+                    <h3>🌟 {rec_plan.name} Plan (Recommended)</h3>
+                    <p><strong>Speed:</strong> {rec_plan.speed} | <strong>Data Cap:</strong> {rec_plan.data_cap}</p>
+                    <p><strong>Price:</strong> ${rec_plan.price}/month</p>
+                    <p>{rec_plan.description}</p>
+                </div>
+                """, unsafe_allow_html=True)
             
-            # Subscribe to recommended plan button
-            if st.button("Subscribe to Recommended Plan", key="sub_rec"):
-                # Add subscription to user
-                start_date = datetime.now().strftime('%Y-%m-%d')
-                end_date = (datetime.now() + timedelta(days=365)).strftime('%Y-%m-%d')
-                
-                # Add to user's subscriptions
-                user_data['subscriptions'].append({
-                    'plan': rec_plan['name'],
-                    'status': 'active',
-                    'start_date': start_date,
-                    'end_date': end_date,
-                    'data_used': 0,
-                    'data_limit': 1000 if rec_plan['data_cap'] == '1 TB' else (500 if rec_plan['data_cap'] == '500 GB' else float('inf'))
-                })
-                
-                # Also add to global subscriptions for revenue tracking
-                st.session_state.subscriptions.append({
-                    'user_id': st.session_state.username,
-                    'plan': rec_plan['name'],
-                    'status': 'active',
-                    'start_date': start_date,
-                    'end_date': end_date,
-                    'price': rec_plan['price']
-                })
+                # Subscribe to recommended plan button
+                if st.button("Subscribe to Recommended Plan", key="sub_rec"):
+                    # Add subscription to user
+                    start_date = datetime.now().strftime('%Y-%m-%d')
+                    end_date = (datetime.now() + timedelta(days=365)).strftime('%Y-%m-%d')
                 
-                # Update revenue
-                st.session_state.revenue_data = calculate_revenue()
+                    # Record the subscription (also used for revenue tracking)
+                    store.add_subscription({
+                        'user_id': st.session_state.username,
+                        'plan': rec_plan.name,
+                        'status': 'active',
+                        'start_date': start_date,
+                        'end_date': end_date,
+                        'price': rec_plan.price,
+                        'data_used': 0,
+                        'data_limit': rec_plan.data_limit
+                    })
                 
-                # Success message
-                st.success(f"Subscribed to {rec_plan['name']} plan!")
-                time.sleep(1)  # Brief delay
-                st.rerun()  # Refresh the page
+                    # Success message (shown after the rerun)
+                    flash(f"Subscribed to {rec_plan.name} plan!")
+                    st.rerun()  # Refresh the page
         
         # Display all available plans
         st.markdown("#### All Available Plans")
         # Loop through each plan
-        for plan in st.session_state.plans:
+        for plan in store.plans():
             # Display plan card
             st.markdown(f"""
             <div class="plan-card">
-                <h3>{plan['name']} Plan</h3>
-                <p><strong>Speed:</strong> {plan['speed']} | <strong>Data Cap:</strong> {plan['data_cap']}</p>
-                <p><strong>Price:</strong> ${plan['price']}/month</p>
-                <p>{plan['description']}</p>
+                <h3>{plan.name} Plan</h3>
+                <p><strong>Speed:</strong> {plan.speed} | <strong>Data Cap:</strong> {plan.data_cap}</p>
+                <p><strong>Price:</strong> ${plan.price}/month</p>
+                <p>{plan.description}</p>
             </div>
             """, unsafe_allow_html=True)
             
             # Show appropriate button based on mode
             if upgrade_mode:
                 # Upgrade button for upgrade mode
-                if st.button(f"Upgrade to {plan['name']}", key=f"upg_{plan['name']}"):
+                if st.button(f"Upgrade to {plan.name}", key=f"upg_{plan.name}"):
                     # Upgrade the subscription
-                    user_data['subscriptions'][st.session_state.upgrade_sub_index]['plan'] = plan['name']
-                    user_data['subscriptions'][st.session_state.upgrade_sub_index]['data_limit'] = 1000 if plan['data_cap'] == '1 TB' else (500 if plan['data_cap'] == '500 GB' else float('inf'))
-                    # Success message
-                    st.success(f"Upgraded to {plan['name']} plan!")
+                    store.update_subscription(current_sub['id'], plan=plan.name, price=plan.price,
+                                              data_limit=plan.data_limit)
+                    # Success message (shown after the rerun)
+                    flash(f"Upgraded to {plan.name} plan!")
                     # Exit upgrade mode
                     st.session_state.upgrade_sub_index = None
-                    time.sleep(1)  # Brief delay
                     st.rerun()  # Refresh the page
             elif not renew_mode:
                 # Subscribe button for normal mode
-                if st.button(f"Subscribe to {plan['name']}", key=f"sub_{plan['name']}"):
+                if st.button(f"Subscribe to {plan.name}", key=f"sub_{plan.name}"):
                     # Add subscription to user
                     start_date = datetime.now().strftime('%Y-%m-%d')
                     end_date = (datetime.now() + timedelta(days=365)).strftime('%Y-%m-%d')
                     
-                    # Add to user's subscriptions
-                    user_data['subscriptions'].append({
-                        'plan': plan['name'],
-                        'status': 'active',
-                        'start_date': start_date,
-                        'end_date': end_date,
-                        'data_used': 0,
-                        'data_limit': 1000 if plan['data_cap'] == '1 TB' else (500 if plan['data_cap'] == '500 GB' else float('inf'))
-                    })
-                    
-                    # Also add to global subscriptions for revenue tracking
-                    st.session_state.subscriptions.append({
+                    # Record the subscription (also used for revenue tracking)
+                    store.add_subscription({
                         'user_id': st.session_state.username,
-                        'plan': plan['name'],
+                        'plan': plan.name,
                         'status': 'active',
                         'start_date': start_date,
                         'end_date': end_date,
-                        'price': plan['price']
+                        'price': plan.price,
+                        'data_used': 0,
+                        'data_limit': plan.data_limit
                     })
                     
-                    # Update revenue
-                    st.session_state.revenue_data = calculate_revenue()
-                    
-                    # Success message
-                    st.success(f"Subscribed to {plan['name']} plan!")
-                    time.sleep(1)  # Brief delay
+                    # Success message (shown after the rerun)
+                    flash(f"Subscribed to {plan.name} plan!")
                     st.rerun()  # Refresh the page
         
         # Cancel button for upgrade or renew mode
@@ -967,32 +1194,8 @@ def customer_dashboard():
         
         # Plan finder tool (only shown in normal mode)
         if not upgrade_mode and not renew_mode:
-            st.markdown("#### Find the Right Plan for You")
-            # Two-column layout for plan finder inputs
-            col1, col2 = st.columns(2)
-            with col1:
-                # Usage intensity selector
-                usage = st.select_slider("Usage Intensity", options=["Light", "Moderate", "Heavy"])
-                # Number of devices slider
-                devices = st.slider("Number of devices", 1, 10, 3)
-            with col2:
-                # Budget slider
-                budget = st.slider("Budget ($/month)", 20, 100, 50)
-                # Primary activities multi-select
-                activities = st.multiselect("Primary activities", ["Browsing", "Streaming", "Gaming", "Working"])
-            
-            # Find My Plan button
-            if st.button("Find My Plan"):
-                # Simple recommendation algorithm
-                if usage == "Light" or budget < 40:
-                    rec_idx = 0  # Basic plan
-                elif usage == "Moderate" or budget < 70:
-                    rec_idx = 1  # Standard plan
-                else:
-                    rec_idx = 2  # Premium plan
-                    
-                # Display recommendation
-                st.success(f"We recommend the {st.session_state.plans[rec_idx]['name']} plan for you!")
+            # Plan finder inputs and result (reruns on its own when its widgets change)
+            plan_finder_panel(store, observed_gb)
     
     # Usage Analytics tab content
     elif tabs[selected_index] == "Usage Analytics":
@@ -1009,9 +1212,8 @@ def customer_dashboard():
         # Get the first active subscription
         current_sub = active_subs[0]
         
-        # Generate sample usage data if not exists
-        if not user_data['usage']['daily']:
-            user_data['usage']['daily'] = np.random.randint(5, 20, 30).tolist()
+        # Daily usage of this subscription over the last 30 days (from the usage store)
+        usage_data = store.usage.daily(current_sub['id'], days=30)
         
         # Data usage progress visualization
         if current_sub.get('data_limit', float('inf')) != float('inf'):
@@ -1043,16 +1245,15 @@ def customer_dashboard():
             # Message for unlimited data plans
             st.info("Your current plan has unlimited data usage.")
         
-        # Daily usage chart
-        # Generate dates for the last 30 days
-        dates = [datetime.now() - timedelta(days=i) for i in range(30, 0, -1)]
-        # Get usage data
-        usage_data = user_data['usage']['daily']
+        # Nothing to chart until usage has been recorded (ingested, or seeded for the demo customers)
+        if not usage_data.any():
+            st.info("No usage has been recorded for this subscription yet.")
+            return  # Exit the function
         
-        # Create line chart of daily usage
-        fig = go.Figure()
-        fig.add_trace(go.Scatter(x=dates, y=usage_data, mode='lines+markers', name='Daily Usage (GB)'))
-        fig.update_layout(title="Your Data Usage (Last 30 Days)", xaxis_title="Date", yaxis_title="Data Used (GB)")
+        # Daily usage chart
+        # Create line chart of daily usage (cached until the usage data changes)
+        fig = get_view_cache().get(('usage', current_sub['id'], datetime.now().date()), store.usage.version,
+                                   lambda: build_usage_figure(usage_data))
         # Display the chart
         st.plotly_chart(fig, use_container_width=True)
         
@@ -1061,9 +1262,9 @@ def customer_dashboard():
         # Average daily usage metric
         col1.metric("Average Daily Usage", f"{np.mean(usage_data):.1f} GB")
         # Maximum daily usage metric
-        col2.metric("Max Daily Usage", f"{np.max(usage_data)} GB")
+        col2.metric("Max Daily Usage", f"{np.max(usage_data):.1f} GB")
         # Total monthly usage metric
-        col3.metric("Total Monthly Usage", f"{np.sum(usage_data)} GB")
+        col3.metric("Total Monthly Usage", f"{np.sum(usage_data):.1f} GB")
         
         # Data cap warnings (for limited plans only)
         if current_sub.get('data_limit', float('inf')) != float('inf'):
@@ -1101,18 +1302,18 @@ def customer_dashboard():
             # Save Details button
             if st.form_submit_button("Save Details"):
                 # Update user data with new values
-                user_data['name'] = name
-                user_data['personal_details'] = {
+                store.update_user(st.session_state.username, name=name, personal_details={
                     'email': email,
                     'phone': phone,
                     'address': address
-                }
+                })
                 # Success message
                 st.success("Personal details updated successfully!")
 
 # Main application logic
 def main():
     init_data()  # Initialize application data
+    show_flash_messages()  # Messages queued by the previous run's actions
     
     # Initialize login state if it doesn't exist
     if 'logged_in' not in st.session_state:
@@ -1124,6 +1325,9 @@ def main():
     if not st.session_state.logged_in:
         login_page()  # Show login/signup page
     else:
+        # Let the user see which part of the page each interaction re-executed
+        st.sidebar.toggle("Show panel reruns", key="show_panel_runs")
+        panel_stamp("Page")
         if st.session_state.role == 'admin':
             admin_dashboard()  # Show admin dashboard
         else:
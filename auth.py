@@ -0,0 +1,181 @@
+# Password hashing and login verification
+# Passwords are stored as salted scrypt hashes "scrypt$n$r$p$salt$hash", so the cost
+# parameters travel with each user and can be raised later: a successful login with
+# an older cost (or a legacy plaintext/SHA-256 password) re-hashes at the current cost.
+# Hashing runs on a bounded worker pool so a burst of logins cannot occupy every
+# script thread, and attempts are throttled per username and per client.
+import base64  # Encoding salts and hashes as text
+import hashlib  # scrypt and legacy SHA-256
+import hmac  # Constant-time comparison
+import os  # Environment configuration
+import secrets  # Random salts
+import string  # Hex digits of legacy digests
+import threading  # Locks and the pool's admission semaphore
+import time  # Throttling windows
+from collections import deque  # Recent attempts per throttled key
+from concurrent.futures import ThreadPoolExecutor  # Bounded hashing pool
+
+# Hash scheme marker at the start of stored hashes
+SCHEME = 'scrypt'
+# Default scrypt cost: N (CPU/memory cost, power of two), r (block size), p (parallelism)
+# 2**14 x 8 uses 16 MiB and takes tens of milliseconds per hash
+DEFAULT_COST = (2 ** 14, 8, 1)
+# Salt and derived key lengths in bytes
+SALT_BYTES = 16
+KEY_BYTES = 32
+# Hashing threads (scrypt releases the GIL, so these run in parallel)
+WORKERS = max(2, (os.cpu_count() or 2) // 2)
+# Hash jobs allowed to wait for a worker before new logins are turned away
+MAX_PENDING = 32
+# Failed logins allowed per username, and login attempts allowed per client, within the window
+USER_FAILURES = 5
+CLIENT_ATTEMPTS = 30
+THROTTLE_WINDOW = 300  # Seconds
+
+# Login outcomes
+OK, INVALID, THROTTLED, BUSY = 'ok', 'invalid', 'throttled', 'busy'
+
+
+# Scrypt cost from BROADBAND_SCRYPT_N / _R / _P (falling back to DEFAULT_COST)
+def cost_from_env():
+    n, r, p = DEFAULT_COST
+    return (int(os.environ.get('BROADBAND_SCRYPT_N', n)), int(os.environ.get('BROADBAND_SCRYPT_R', r)),
+            int(os.environ.get('BROADBAND_SCRYPT_P', p)))
+
+
+# Text form of salts and keys inside stored hashes
+def _b64(data):
+    return base64.b64encode(data).decode()
+
+
+# Derive the scrypt key of a password
+def _scrypt(password, salt, n, r, p):
+    # OpenSSL needs 128 * r * (n + p + 2) bytes; leave headroom for its bookkeeping
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, dklen=KEY_BYTES,
+                          maxmem=128 * r * (n + p + 2) + (1 << 20))
+
+
+# Hash a password with a fresh salt at the given cost
+def hash_password(password, cost=DEFAULT_COST):
+    n, r, p = cost
+    salt = secrets.token_bytes(SALT_BYTES)
+    return f"{SCHEME}${n}${r}${p}${_b64(salt)}${_b64(_scrypt(password, salt, n, r, p))}"
+
+
+# Cost parameters of a stored hash (None for legacy plaintext/SHA-256 passwords)
+def hash_cost(stored):
+    parts = stored.split('$')
+    if len(parts) != 6 or parts[0] != SCHEME:
+        return None
+    return int(parts[1]), int(parts[2]), int(parts[3])
+
+
+# Check a password against a stored hash; returns (matches, needs_rehash at the given cost)
+def verify_password(password, stored, cost=DEFAULT_COST):
+    stored_cost = hash_cost(stored)
+    if stored_cost is None:
+        # Legacy rows: plaintext, or unsalted SHA-256 hex digests (a 64-character plaintext may look like one)
+        matches = hmac.compare_digest(password.encode(), stored.encode())
+        if len(stored) == 64 and all(char in string.hexdigits for char in stored):
+            digest = hashlib.sha256(password.encode()).hexdigest()
+            matches |= hmac.compare_digest(digest.encode(), stored.lower().encode())
+        return matches, True
+    n, r, p = stored_cost
+    salt, expected = (base64.b64decode(part) for part in stored.split('$')[4:])
+    matches = hmac.compare_digest(_scrypt(password, salt, n, r, p), expected)
+    return matches, stored_cost != tuple(cost)
+
+
+# Sliding-window counter of events per key (usernames or client addresses)
+class Throttle:
+    def __init__(self, limit, window=THROTTLE_WINDOW):
+        self.limit = limit  # Events allowed per key within the window
+        self.window = window  # Window length in seconds
+        self._events = {}  # Key -> deque of event times, oldest first
+        self._lock = threading.Lock()
+
+    # Drop events older than the window; returns the key's remaining events
+    def _recent(self, key, now):
+        events = self._events.get(key)
+        while events and events[0] <= now - self.window:
+            events.popleft()
+        if events is not None and not events:
+            del self._events[key]
+        return events or ()
+
+    # Seconds until the key may act again (0 if it is under the limit)
+    def retry_after(self, key):
+        with self._lock:
+            now = time.monotonic()
+            events = self._recent(key, now)
+            return 0 if len(events) < self.limit else events[0] + self.window - now
+
+    # Count an event for the key
+    def hit(self, key):
+        with self._lock:
+            self._recent(key, time.monotonic())
+            self._events.setdefault(key, deque()).append(time.monotonic())
+
+    # Forget the key's events (e.g. after a successful login)
+    def reset(self, key):
+        with self._lock:
+            self._events.pop(key, None)
+
+
+# Login verification against a store, on a bounded pool with per-user and per-client throttling
+class Authenticator:
+    def __init__(self, store, cost=DEFAULT_COST, workers=WORKERS, max_pending=MAX_PENDING,
+                 user_failures=USER_FAILURES, client_attempts=CLIENT_ATTEMPTS, window=THROTTLE_WINDOW):
+        self.store = store
+        self.cost = tuple(cost)  # Cost for new hashes; older hashes are upgraded on login
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='auth')
+        self._slots = threading.BoundedSemaphore(workers + max_pending)  # Running + queued hash jobs
+        self.users = Throttle(user_failures, window)  # Failed logins per username
+        self.clients = Throttle(client_attempts, window)  # Login attempts per client
+        # Hash checked for unknown usernames, so they take as long as known ones
+        self._dummy = hash_password(secrets.token_hex(8), self.cost)
+
+    # Run fn on the pool; returns its result, or BUSY when the pool is saturated
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            return BUSY
+        future = self.pool.submit(fn, *args)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+    # Hash a password at the current cost on the pool (BUSY if the pool is saturated)
+    def hash(self, password):
+        return self._run(hash_password, password, self.cost)
+
+    # Verify a login; returns (OK | INVALID | THROTTLED | BUSY, seconds to wait before retrying)
+    # client identifies the caller (e.g. its IP address); None skips the per-client limit
+    # store is the store to check against (default: the authenticator's own, e.g. a session overlay)
+    def login(self, username, password, client=None, store=None):
+        wait = max(self.users.retry_after(username), self.clients.retry_after(client) if client else 0)
+        if wait:
+            return THROTTLED, wait
+        if client:
+            self.clients.hit(client)
+        result = self._run(self._check, store or self.store, username, password)
+        if result == BUSY:
+            return BUSY, 1
+        if result:
+            self.users.reset(username)
+            return OK, 0
+        self.users.hit(username)
+        return INVALID, 0
+
+    # Worker task: compare the password and upgrade the stored hash if it is outdated
+    def _check(self, store, username, password):
+        user = store.get_user(username)
+        if user is None:
+            verify_password(password, self._dummy, self.cost)
+            return False
+        matches, needs_rehash = verify_password(password, user['password'], self.cost)
+        if matches and needs_rehash:
+            store.update_user(username, password=hash_password(password, self.cost))
+        return matches
+
+    # Stop the worker threads
+    def close(self):
+        self.pool.shutdown(wait=False)
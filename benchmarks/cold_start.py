@@ -0,0 +1,93 @@
+# Cold-start benchmark for the journaled in-memory store
+# For each dataset size: generates customers, subscriptions and usage into a store, writes a
+# snapshot, journals a tail of further subscriptions on top, then starts fresh processes that
+# (a) open the store (snapshot + log tail) and (b) render the portal's first page headlessly
+# with BROADBAND_STORE=journal, and reports the wall time of each from process start. The time
+# to import the modules and to render an empty Streamlit script are reported too: they are fixed
+# costs of the interpreter and framework, the same at any dataset size.
+#
+# Usage:
+#   python benchmarks/cold_start.py [--sizes 100000 1000000] [--tail 1000] [--usage-days 7]
+import argparse  # Command-line interface
+import os  # Paths and environment
+import subprocess  # Fresh processes for each measurement
+import sys  # Import path for the portal modules
+import tempfile  # Throwaway data directories
+import time  # Timing
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import datagen  # noqa: E402  Synthetic customers, subscriptions and usage
+import journal  # noqa: E402  Journaled store
+import snapshot  # noqa: E402  Snapshot writer
+from storage import DEFERRABLE, MemoryStore, seed_sample_data  # noqa: E402  Store the dataset is generated into
+
+# Measured in a fresh process; prints the seconds from interpreter start to the end of the step(s)
+OPEN_STORE = """
+import time, sys; start = time.perf_counter(); sys.path.insert(0, {root!r})
+import journal
+imported = time.perf_counter() - start
+store = journal.open_store({path!r}, fsync=False)
+print(imported, time.perf_counter() - start, len(store.ledger))
+"""
+FIRST_RENDER = """
+import time, sys; start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file({app!r}, default_timeout=600)
+app.run()
+assert not app.exception, app.exception
+print(time.perf_counter() - start)
+"""
+
+
+# Generate a dataset, snapshot it and journal `tail` subscriptions after the snapshot; returns the journal path
+def prepare(directory, customers, tail, usage_days):
+    path = os.path.join(directory, 'bench.journal')
+    store = MemoryStore(usage_dir=f'{path}-usage', defer=DEFERRABLE)  # Nothing is searched while loading
+    seed_sample_data(store)
+    datagen.load_store(store, customers, usage_days=usage_days)
+    snapshot.write(store, f'{path}-snapshots')
+    store = journal.open_store(path, fsync=False)
+    for i in range(tail):
+        store.add_subscription({'user_id': f'cust{i % customers:07d}', 'plan': 'Basic', 'status': 'active',
+                                'start_date': '2026-01-01', 'end_date': '2026-12-31', 'price': 29.99})
+    store.journal.close()
+    return path
+
+
+# Run a snippet in a fresh interpreter and return its printed output
+def measure(code, **environment):
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            env=dict(os.environ, **environment))
+    return result.stdout.split()
+
+
+# Command-line entry point
+def main():
+    parser = argparse.ArgumentParser(description="Measure store open and first-render time from a snapshot")
+    parser.add_argument('--sizes', nargs='+', type=int, default=[100_000, 1_000_000], help="Customers per dataset")
+    parser.add_argument('--tail', type=int, default=1000, help="Journaled writes after the snapshot")
+    parser.add_argument('--usage-days', type=int, default=7, help="Days of usage per active subscription")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        empty = os.path.join(directory, 'empty.py')
+        with open(empty, 'w') as file:
+            file.write("import streamlit as st\nst.write('')\n")
+        baseline, = measure(FIRST_RENDER.format(app=empty))
+    print(f"Empty Streamlit script renders in {float(baseline):.2f} s")
+    print(f"{'customers':>10}{'subscriptions':>15}{'prepare s':>11}{'imports s':>11}{'open s':>9}{'first render s':>16}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            start = time.perf_counter()
+            path = prepare(directory, size, args.tail, args.usage_days)
+            prepared = time.perf_counter() - start
+            imported, opened, rows = measure(OPEN_STORE.format(root=ROOT, path=path))
+            rendered, = measure(FIRST_RENDER.format(app=os.path.join(ROOT, 'app.py')), BROADBAND_STORE='journal',
+                                BROADBAND_JOURNAL=path, BROADBAND_FSYNC='0')
+            print(f"{size:>10}{int(rows):>15}{prepared:>11.1f}{float(imported):>11.2f}{float(opened):>9.2f}"
+                  f"{float(rendered):>16.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+# Concurrent-session load simulator
+# Runs N scripted sessions at once against one portal process, each an AppTest driver
+# following a randomised click path (customers move between their tabs, admins look at the
+# dashboard, page and search customers and open the plan list). Reports rerun throughput,
+# p50/p95/p99 rerun latency and the resident memory each session adds to the process,
+# which tells how many sessions one worker process can hold.
+#
+# AppTest swaps a process-global runtime on every run, so reruns within one process take
+# turns (latencies include the wait, like requests queued on a busy worker); sessions still
+# interleave and all stay in memory together. With --processes P the sessions are split
+# across P worker processes, each holding its own copy of the store like separate portal
+# workers would, and reruns in different processes run in parallel.
+#
+# Usage:
+#   python benchmarks/load_simulator.py [--sessions 50] [--steps 20] [--customers 10000]
+#                                       [--admins 0.1] [--think 0.5] [--processes 1]
+import argparse  # Command-line interface
+import gc  # Settling memory before measuring it
+import os  # Paths and environment
+import resource  # Peak resident memory
+import sys  # Import path for the portal modules
+import tempfile  # Throwaway databases
+import threading  # Collecting results from session threads
+import time  # Timing and think time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor  # Session drivers
+
+import numpy as np  # Percentiles and random click paths
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from render_latency import ADMIN, APP, TIMEOUT, build_dataset, click, log_in, widget  # noqa: E402
+
+from streamlit.testing.v1 import AppTest  # noqa: E402  Headless app runner
+
+# Customer tabs and how often a customer opens each
+CUSTOMER_TABS = {'My Subscriptions': 0.4, 'Browse Plans': 0.25, 'Usage Analytics': 0.25, 'Personal Details': 0.1}
+# Admin actions and how often an admin performs each
+ADMIN_ACTIONS = {'Dashboard': 0.3, 'Customer Management': 0.2, 'search': 0.25, 'next page': 0.1, 'Manage Plans': 0.15}
+# Search queries admins type
+QUERIES = ('smith', 'garcia', 'oak st', 'example.net', 'cust00001', 'chen', '555')
+# Password of the generated customers (datagen.DEFAULT_PASSWORD)
+CUSTOMER_PASSWORD = 'password'
+# One AppTest run at a time per process (see above)
+RUN_LOCK = threading.Lock()
+
+
+# Current resident memory of this process in bytes
+def resident_bytes():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        # No /proc (e.g. macOS): fall back to the peak, reported in bytes there
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+# Actions of one admin click path (each followed by a rerun)
+def admin_path(rng, steps):
+    names = rng.choice(list(ADMIN_ACTIONS), size=steps, p=list(ADMIN_ACTIONS.values()))
+    path = []
+    for name in names:
+        if name == 'search':
+            query = str(rng.choice(QUERIES))
+            path += [lambda at: click(at, 'Customer Management'),
+                     lambda at, query=query: widget(at.text_input, 'Search Customers').input(query)]
+        elif name == 'next page':
+            path += [lambda at: click(at, 'Customer Management'), lambda at: click(at, 'Next')]
+        else:
+            path.append(lambda at, name=name: click(at, name))
+    return path
+
+
+# Actions of one customer click path (each followed by a rerun)
+def customer_path(rng, steps):
+    tabs = rng.choice(list(CUSTOMER_TABS), size=steps, p=list(CUSTOMER_TABS.values()))
+    return [lambda at, tab=tab: click(at, tab) for tab in tabs]
+
+
+# Run one session: open the login page, log in and follow the click path
+# Rerun latencies are appended to `latencies`; the finished AppTest is kept in `alive` so its
+# session state stays in memory until the memory is measured
+def run_session(number, customers, admins, steps, think, seed, latencies, alive, lock):
+    rng = np.random.default_rng([seed, number])
+    is_admin = rng.random() < admins
+    if is_admin:
+        account, path = ADMIN, admin_path(rng, steps)
+    else:
+        account = (f"cust{rng.integers(customers):07d}", CUSTOMER_PASSWORD)
+        path = customer_path(rng, steps)
+    at = AppTest.from_file(APP, default_timeout=TIMEOUT)
+    timings = []
+    errors = 0
+    for act in [None, log_in(account)] + path:
+        try:
+            if act is not None:
+                act(at)
+        except (LookupError, StopIteration):
+            continue  # Widget not on the page (e.g. "Next" on the last page): skip the step
+        start = time.perf_counter()
+        with RUN_LOCK:
+            at.run()
+        timings.append(time.perf_counter() - start)
+        errors += bool(at.exception)
+        if think:
+            time.sleep(rng.exponential(think))
+    with lock:
+        latencies.extend(timings)
+        alive.append(at)
+    return errors
+
+
+# Run a batch of concurrent sessions in this process; returns its measurements
+def run_worker(first, sessions, db, customers, admins, steps, think, seed):
+    os.environ['BROADBAND_DB'] = db
+    # Warm the process: open the shared store once so it is not counted against the sessions
+    AppTest.from_file(APP, default_timeout=TIMEOUT).run()
+    gc.collect()
+    base = resident_bytes()
+    latencies, alive, lock = [], [], threading.Lock()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as drivers:
+        errors = sum(drivers.map(lambda number: run_session(number, customers, admins, steps, think, seed,
+                                                             latencies, alive, lock),
+                                 range(first, first + sessions)))
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    return {'base': base, 'loaded': resident_bytes(), 'sessions': len(alive), 'errors': errors,
+            'elapsed': elapsed, 'latencies': latencies}
+
+
+# Command-line entry point
+def main():
+    parser = argparse.ArgumentParser(description="Simulate concurrent portal sessions and measure latency and memory")
+    parser.add_argument('--sessions', type=int, default=50, help="Concurrent sessions")
+    parser.add_argument('--steps', type=int, default=20, help="Clicks per session after logging in")
+    parser.add_argument('--customers', type=int, default=10000, help="Generated customers in the dataset")
+    parser.add_argument('--admins', type=float, default=0.1, help="Fraction of sessions that are admins")
+    parser.add_argument('--think', type=float, default=0.5, help="Mean think time between clicks (seconds)")
+    parser.add_argument('--processes', type=int, default=1, help="Worker processes the sessions are split across")
+    parser.add_argument('--seed', type=int, default=0, help="Dataset and click path seed")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        db = build_dataset(directory, args.customers, args.seed)
+        print(f"{args.customers:,} customers generated in {time.perf_counter() - start:.1f}s")
+        # Sessions per worker process (the first workers take the remainder)
+        shares = [args.sessions // args.processes + (i < args.sessions % args.processes) for i in range(args.processes)]
+        firsts = np.concatenate([[0], np.cumsum(shares)[:-1]]).tolist()
+        options = (db, args.customers, args.admins, args.steps, args.think, args.seed)
+        start = time.perf_counter()
+        if args.processes == 1:
+            workers = [run_worker(0, args.sessions, *options)]
+        else:
+            with ProcessPoolExecutor(max_workers=args.processes) as pool:
+                workers = list(pool.map(run_worker, firsts, shares, *([option] * args.processes for option in options)))
+        elapsed = time.perf_counter() - start
+
+    latencies = np.concatenate([worker['latencies'] for worker in workers]) * 1000
+    sessions = sum(worker['sessions'] for worker in workers)
+    added = sum(worker['loaded'] - worker['base'] for worker in workers)
+    base = np.mean([worker['base'] for worker in workers])
+    print(f"{sessions} sessions in {args.processes} process(es), {len(latencies)} reruns in {elapsed:.1f}s "
+          f"({len(latencies) / elapsed:.1f} reruns/s), {sum(worker['errors'] for worker in workers)} errors")
+    print(f"rerun latency ms: p50 {np.percentile(latencies, 50):.0f}  p95 {np.percentile(latencies, 95):.0f}  "
+          f"p99 {np.percentile(latencies, 99):.0f}  max {latencies.max():.0f}")
+    print(f"resident memory: {base / 2 ** 20:.0f} MiB per process before sessions, "
+          f"{added / max(sessions, 1) / 2 ** 20:.2f} MiB per session")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+# Login throughput benchmark
+# Fires a burst of concurrent logins at an Authenticator for each scrypt cost setting
+# and reports logins/second, latency percentiles and how many logins were turned away.
+#
+# Usage:
+#   python benchmarks/login_throughput.py [--costs 12:8:1 14:8:1 15:8:1] [--logins 200] [--concurrency 32]
+# Each cost is log2(N):r:p.
+import argparse  # Command-line interface
+import os  # Paths
+import sys  # Import path for the portal modules
+import tempfile  # Throwaway databases
+import time  # Timing
+from concurrent.futures import ThreadPoolExecutor  # Concurrent login callers
+
+import numpy as np  # Percentiles
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import auth  # noqa: E402  Password hashing and login verification
+from storage import SQLiteStore  # noqa: E402  Store holding the benchmark user
+
+
+# Run one burst of logins at a cost; returns a result row
+def run(cost, logins, concurrency, workers, max_pending):
+    with tempfile.TemporaryDirectory() as directory:
+        store = SQLiteStore(os.path.join(directory, 'bench.db'))
+        store.add_user('bench', {'password': auth.hash_password('secret', cost), 'role': 'customer'})
+        # Throttling off: the burst comes from one user and no client
+        authenticator = auth.Authenticator(store, cost=cost, workers=workers, max_pending=max_pending,
+                                           user_failures=logins + 1)
+
+        # One timed login; returns (status, seconds)
+        def login(_):
+            start = time.perf_counter()
+            status, _ = authenticator.login('bench', 'secret')
+            return status, time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as callers:
+            results = list(callers.map(login, range(logins)))
+        elapsed = time.perf_counter() - start
+        authenticator.close()
+        store.pool.close()
+
+    latencies = np.array([seconds for status, seconds in results if status == auth.OK])
+    n, r, p = cost
+    return {
+        'cost': f"N=2^{n.bit_length() - 1} r={r} p={p}",
+        'memory_mib': 128 * r * n / 2 ** 20,
+        'ok': len(latencies),
+        'busy': sum(status == auth.BUSY for status, _ in results),
+        'logins_per_s': len(latencies) / elapsed,
+        'p50_ms': np.percentile(latencies, 50) * 1000 if len(latencies) else float('nan'),
+        'p95_ms': np.percentile(latencies, 95) * 1000 if len(latencies) else float('nan'),
+    }
+
+
+# Command-line entry point
+def main():
+    parser = argparse.ArgumentParser(description="Measure login throughput per scrypt cost setting")
+    parser.add_argument('--costs', nargs='+', default=['12:8:1', '14:8:1', '15:8:1'], help="Costs as log2(N):r:p")
+    parser.add_argument('--logins', type=int, default=200, help="Logins per burst")
+    parser.add_argument('--concurrency', type=int, default=32, help="Simultaneous login callers")
+    parser.add_argument('--workers', type=int, default=auth.WORKERS, help="Hashing pool threads")
+    parser.add_argument('--max-pending', type=int, default=auth.MAX_PENDING, help="Queued hash jobs before BUSY")
+    args = parser.parse_args()
+
+    print(f"{args.logins} logins, {args.concurrency} callers, {args.workers} hashing threads, "
+          f"{args.max_pending} queued at most")
+    print(f"{'cost':<18}{'MiB':>6}{'ok':>6}{'busy':>6}{'logins/s':>10}{'p50 ms':>9}{'p95 ms':>9}")
+    for spec in args.costs:
+        log_n, r, p = (int(part) for part in spec.split(':'))
+        row = run((2 ** log_n, r, p), args.logins, args.concurrency, args.workers, args.max_pending)
+        print(f"{row['cost']:<18}{row['memory_mib']:>6.0f}{row['ok']:>6}{row['busy']:>6}"
+              f"{row['logins_per_s']:>10.1f}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
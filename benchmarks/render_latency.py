@@ -0,0 +1,276 @@
+# Render-latency benchmark
+# Drives the portal headlessly with Streamlit's AppTest: logs in as the admin and as a
+# customer, opens every tab and performs the main actions on generated datasets of several
+# sizes. For every step it reports the wall time of the script reruns it triggers, the peak
+# Python memory allocated during them and the number of elements the page emitted.
+#
+# Results are saved as one JSON file per dataset size; pass --compare with a directory of
+# earlier results to flag steps that got slower (the exit status is 1 if any did).
+#
+# Usage:
+#   python benchmarks/render_latency.py [--sizes 1000 10000 100000] [--repeat 3]
+#                                       [--output benchmarks/results] [--compare benchmarks/baseline]
+import argparse  # Command-line interface
+import json  # Result files
+import os  # Paths and environment
+import platform  # Machine description stored with the results
+import shutil  # Copies of the generated dataset
+import sys  # Import path for the portal modules
+import tempfile  # Throwaway databases
+import time  # Timing
+import tracemalloc  # Peak memory per step
+
+import numpy as np  # Medians
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import datagen  # noqa: E402  Synthetic customers, subscriptions and usage
+from storage import SQLiteStore, seed_sample_data  # noqa: E402  Store the app is pointed at
+
+import streamlit as st  # noqa: E402  Clearing the app's process-wide caches between runs
+from streamlit.testing.v1 import AppTest  # noqa: E402  Headless app runner
+from streamlit.testing.v1.element_tree import Block  # noqa: E402  Container nodes of the element tree
+
+# The app under test
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+# Seconds a single rerun may take before AppTest gives up
+TIMEOUT = 600
+# Accounts used by the scenarios (created by seed_sample_data)
+ADMIN = ('admin', 'admin123')
+CUSTOMER = ('customer1', 'customer1')
+# Name of the plan added and deleted by the admin scenario
+BENCH_PLAN = 'Bench'
+# Relative slowdown against the baseline that counts as a regression
+TOLERANCE = 0.25
+
+
+# Press the first button with the given label or key (AppTest reruns on the next run())
+def click(at, label=None, key=None):
+    for button in at.button:
+        if (label is not None and button.label == label) or (key is not None and button.key == key):
+            button.click()
+            return
+    raise LookupError(f"No button {label or key!r} on the page")
+
+
+# Key of the first button whose key starts with a prefix
+def key_with_prefix(at, prefix):
+    return next(button.key for button in at.button if button.key and button.key.startswith(prefix))
+
+
+# Widget with the given label from one of the AppTest widget lists
+def widget(widgets, label):
+    return next(item for item in widgets if item.label == label)
+
+
+# Fill in and submit the login form
+def log_in(account):
+    def act(at):
+        at.text_input[0].input(account[0])
+        at.text_input[1].input(account[1])
+        click(at, 'Login')
+    return act
+
+
+# Fill in and submit the add-plan form
+def add_plan(at):
+    widget(at.text_input, 'Plan Name').input(BENCH_PLAN)
+    widget(at.text_input, 'Speed').input('500 Mbps')
+    widget(at.number_input, 'Price ($)').set_value(59.99)
+    widget(at.text_input, 'Data Cap').input('2 TB')
+    click(at, 'Add Plan')
+
+
+# Press the delete button of the plan added by add_plan
+def delete_plan(at):
+    click(at, f"Delete {BENCH_PLAN}")
+
+
+# Type a query into the customer search box
+def search(query):
+    def act(at):
+        widget(at.text_input, 'Search Customers').input(query)
+    return act
+
+
+# Press the first button whose key starts with a prefix (e.g. the upgrade button of a plan)
+def click_prefix(prefix):
+    def act(at):
+        click(at, key=key_with_prefix(at, prefix))
+    return act
+
+
+# Steps of each scenario: (step name, action before the rerun); None only reruns the script
+SCENARIOS = {
+    'admin': [
+        ('login page', None),
+        ('log in', log_in(ADMIN)),
+        ('Dashboard', lambda at: click(at, 'Dashboard')),
+        ('Customer Management', lambda at: click(at, 'Customer Management')),
+        ('search', search('smith')),
+        ('clear search', search('')),
+        ('Manage Plans', lambda at: click(at, 'Manage Plans')),
+        ('add plan', add_plan),
+        ('delete plan', delete_plan),
+    ],
+    'customer': [
+        ('login page', None),
+        ('log in', log_in(CUSTOMER)),
+        ('My Subscriptions', lambda at: click(at, 'My Subscriptions')),
+        ('Browse Plans', lambda at: click(at, 'Browse Plans')),
+        ('subscribe', lambda at: click(at, key='sub_Basic')),
+        ('upgrade', lambda at: (click(at, 'My Subscriptions'), at.run(), click(at, key='upgrade_0'))),
+        ('upgrade confirm', click_prefix('upg_')),
+        ('renew', lambda at: (click(at, 'My Subscriptions'), at.run(), click(at, key='renew_0'))),
+        ('renew confirm', lambda at: click(at, 'Confirm Renewal')),
+        ('cancel', lambda at: (click(at, 'My Subscriptions'), at.run(), click_prefix('cancel_')(at))),
+        ('Usage Analytics', lambda at: click(at, 'Usage Analytics')),
+        ('Personal Details', lambda at: click(at, 'Personal Details')),
+    ],
+}
+
+
+# Number of elements (non-container nodes) on the page
+def count_elements(node):
+    if isinstance(node, Block):
+        return sum(count_elements(child) for child in node.children.values())
+    return 1
+
+
+# Generate a dataset of `customers` generated customers (plus the demo data) into a directory
+def build_dataset(directory, customers, seed):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, 'bench.db')
+    store = SQLiteStore(path)
+    seed_sample_data(store)
+    datagen.load_store(store, customers, seed)
+    store.pool.close()  # Checkpoints the WAL so the database file is complete
+    return path
+
+
+# Fresh copy of a generated dataset (database plus usage segments), so every pass starts from the same data
+def copy_dataset(path, directory):
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(os.path.dirname(path)):
+        if name.startswith(os.path.basename(path)):
+            source = os.path.join(os.path.dirname(path), name)
+            copy = shutil.copytree if os.path.isdir(source) else shutil.copy
+            copy(source, os.path.join(directory, name))
+    return os.path.join(directory, os.path.basename(path))
+
+
+# Run one scenario against a database; returns {step: {'seconds', 'reruns', 'peak_mib', 'elements'}}
+# Peak memory is only traced when trace_memory is set (tracing slows the runs down)
+def run_scenario(name, path, trace_memory=False):
+    os.environ['BROADBAND_DB'] = path
+    st.cache_resource.clear()  # Open the copied database, not the previous pass's store
+    st.cache_data.clear()
+    at = AppTest.from_file(APP, default_timeout=TIMEOUT)
+    results = {}
+    for step, act in SCENARIOS[name]:
+        runs = []  # Wall time of each rerun the step triggered
+
+        # Rerun the script, timing it
+        def rerun():
+            start = time.perf_counter()
+            AppTest.run(at)
+            runs.append(time.perf_counter() - start)
+
+        at.run = rerun  # Reruns inside multi-click actions are timed too
+        if trace_memory:
+            tracemalloc.start()
+        if act is not None:
+            act(at)
+        rerun()
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+        if trace_memory:
+            tracemalloc.stop()
+        if at.exception:
+            raise RuntimeError(f"{name}/{step}: {at.exception[0].value}")
+        results[step] = {'seconds': sum(runs), 'reruns': len(runs),
+                         'peak_mib': None if peak is None else peak / 2 ** 20,
+                         'elements': count_elements(at._tree)}
+    return results
+
+
+# Benchmark every scenario at one dataset size; returns the result document
+def run_size(customers, repeat, seed):
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        path = build_dataset(os.path.join(directory, 'template'), customers, seed)
+        print(f"{customers:,} customers generated in {time.perf_counter() - start:.1f}s")
+        steps = {}
+        for name in SCENARIOS:
+            passes = [run_scenario(name, copy_dataset(path, os.path.join(directory, f'{name}-{i}')))
+                      for i in range(repeat)]
+            traced = run_scenario(name, copy_dataset(path, os.path.join(directory, f'{name}-memory')), True)
+            for step in traced:
+                steps[f'{name}/{step}'] = {
+                    'median_ms': float(np.median([run[step]['seconds'] for run in passes])) * 1000,
+                    'min_ms': min(run[step]['seconds'] for run in passes) * 1000,
+                    'reruns': traced[step]['reruns'],
+                    'peak_mib': traced[step]['peak_mib'],
+                    'elements': traced[step]['elements'],
+                }
+    return {
+        'customers': customers,
+        'seed': seed,
+        'repeat': repeat,
+        'python': platform.python_version(),
+        'streamlit': st.__version__,
+        'machine': f"{platform.machine()} {platform.processor() or ''} x{os.cpu_count()}".strip(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'steps': steps,
+    }
+
+
+# Print a result document, with the change against a baseline document if one is given
+# Returns the steps that are slower than the baseline by more than the tolerance
+def report(result, baseline=None, tolerance=TOLERANCE):
+    regressions = []
+    print(f"{'step':<34}{'median ms':>11}{'reruns':>8}{'peak MiB':>10}{'elements':>10}"
+          + (f"{'baseline':>11}{'change':>9}" if baseline else ''))
+    for step, row in result['steps'].items():
+        line = f"{step:<34}{row['median_ms']:>11.1f}{row['reruns']:>8}{row['peak_mib']:>10.1f}{row['elements']:>10}"
+        before = baseline['steps'].get(step) if baseline else None
+        if before:
+            change = row['median_ms'] / max(before['median_ms'], 1e-9) - 1
+            line += f"{before['median_ms']:>11.1f}{change:>+9.0%}"
+            if change > tolerance:
+                regressions.append(step)
+                line += '  REGRESSION'
+        print(line)
+    return regressions
+
+
+# Command-line entry point
+def main():
+    parser = argparse.ArgumentParser(description="Measure per-step render latency of the portal with AppTest")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help="Generated customers per dataset")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed passes per scenario (the median is reported)")
+    parser.add_argument('--seed', type=int, default=0, help="Dataset seed")
+    parser.add_argument('--output', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results'),
+                        help="Directory for the result JSON files")
+    parser.add_argument('--compare', metavar='DIRECTORY', help="Directory of baseline JSON files to compare against")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help="Slowdown that counts as a regression (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    regressions = []
+    for customers in args.sizes:
+        result = run_size(customers, args.repeat, args.seed)
+        file_name = f'render_latency_{customers}.json'
+        with open(os.path.join(args.output, file_name), 'w') as output:
+            json.dump(result, output, indent=2)
+        baseline = None
+        if args.compare and os.path.exists(os.path.join(args.compare, file_name)):
+            with open(os.path.join(args.compare, file_name)) as source:
+                baseline = json.load(source)
+        regressions += [f"{customers}:{step}" for step in report(result, baseline, args.tolerance)]
+        print()
+    if regressions:
+        print(f"{len(regressions)} regressions: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
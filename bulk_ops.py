@@ -0,0 +1,113 @@
+# Vectorized bulk operations on plans and subscriptions
+# Catalog changes that touch many subscriptions at once: migrating a plan's subscribers to
+# another plan, repricing a plan (now or from an effective date), changing the status of
+# every subscription matching a filter and renewing them. Subscriptions are selected with
+# boolean masks over the ledger columns and written with one Store.update_subscriptions
+# call: one transaction, one vectorized ledger update and one refresh of the revenue
+# totals, indexes and other derived structures.
+import numpy as np  # Numerical computations
+
+from catalog import to_cents  # Prices compared in cents
+
+# Statuses an admin can set in bulk ('suspended' subscriptions earn nothing and do not expire)
+BULK_STATUSES = ('active', 'suspended', 'cancelled')
+# Statuses of subscriptions that still hold their plan (and may be reactivated on it)
+HOLDING_STATUSES = ('active', 'suspended')
+
+
+# Ids of the subscriptions matching every given filter (None = no filter)
+# users / plans / statuses: collections of labels; ends_from / ends_to: end date range (inclusive, dates or
+# 'YYYY-MM-DD'); min_usage: minimum share of the data limit used (0.9 = 90%)
+def select(store, plans=None, statuses=None, ends_from=None, ends_to=None, min_usage=None, users=None):
+    ledger = store.ledger
+    mask = np.ones(len(ledger), dtype=bool)
+    for column, labels in (('user_id', users), ('plan', plans), ('status', statuses)):
+        if labels is not None:
+            codes = [ledger.categories(column).find(label) for label in labels]
+            mask &= np.isin(ledger.column(column), codes)
+    if ends_from is not None:
+        mask &= ledger.column('end_date') >= np.datetime64(ends_from, 'D')
+    if ends_to is not None:
+        mask &= ledger.column('end_date') <= np.datetime64(ends_to, 'D')
+    if min_usage is not None:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mask &= ledger.column('data_used') / ledger.column('data_limit') >= min_usage  # Never true when unlimited
+    return ledger.column('id')[mask]
+
+
+# Number of subscriptions still holding plan `name`; a plan can only be deleted once this is 0
+def plan_holders(store, name):
+    return len(select(store, plans=[name], statuses=HOLDING_STATUSES))
+
+
+# Move the subscriptions on plan `source` (default active and suspended ones) to catalog plan `target`,
+# at the target's price and data limit; returns the number moved
+def migrate_plan(store, source, target, statuses=HOLDING_STATUSES):
+    plan = store.plan(target)
+    if plan is None:
+        raise ValueError(f"Unknown plan {target!r}")
+    ids = select(store, plans=[source], statuses=statuses)
+    return store.update_subscriptions(ids, plan=plan.name, price=plan.price, data_limit=plan.data_limit)
+
+
+# Change a plan's price. Applied at once when `effective` (date or 'YYYY-MM-DD') is None or not in
+# the future: the catalog price changes and so does the price of every active subscription on the plan.
+# A future change is scheduled and applied by apply_price_changes. Returns the number of subscriptions repriced
+def reprice_plan(store, name, price, effective=None):
+    if store.plan(name) is None:
+        raise ValueError(f"Unknown plan {name!r}")
+    if effective is not None and np.datetime64(effective, 'D') > np.datetime64('today', 'D'):
+        store.add_price_change(name, price, str(np.datetime64(effective, 'D')))
+        return 0
+    if to_cents(store.plan(name).price) != to_cents(price):
+        store.update_plan(name, price=price)
+    return store.update_subscriptions(select(store, plans=[name], statuses=['active']), price=price)
+
+
+# Apply the scheduled price changes due on or before `today` (date; None = today) in date order
+# Changes for plans no longer in the catalog are dropped; returns the number of changes applied
+def apply_price_changes(store, today=None):
+    today = np.datetime64('today' if today is None else today, 'D')
+    applied = 0
+    for change in store.price_changes():
+        if np.datetime64(change['effective'], 'D') > today:
+            break
+        if store.plan(change['plan']) is not None:
+            reprice_plan(store, change['plan'], change['price'])
+            applied += 1
+        store.remove_price_change(change['plan'], change['effective'])
+    return applied
+
+
+# Ids among sub_ids whose plan is still in the catalog
+def on_catalog_plans(store, sub_ids):
+    sub_ids = np.asarray(sub_ids, dtype=np.int64)
+    rows, found = store.ledger.rows_of(sub_ids)
+    codes = [store.ledger.plans.find(plan.name) for plan in store.plans()]
+    return sub_ids[found][np.isin(store.ledger.column('plan')[rows[found]], codes)]
+
+
+# Set the status of many subscriptions (one of BULK_STATUSES); returns the number changed
+# Subscriptions on plans deleted from the catalog are never made active again
+def set_status(store, sub_ids, status):
+    if status not in BULK_STATUSES:
+        raise ValueError(f"Status must be one of {', '.join(BULK_STATUSES)}")
+    if status == 'active':
+        sub_ids = on_catalog_plans(store, sub_ids)
+    return store.update_subscriptions(sub_ids, status=status)
+
+
+# Extend the end date of many subscriptions by `days` from their end date, or from today if that has passed;
+# expired subscriptions come back as active (unless their plan has left the catalog, in which case they are
+# not renewed). Returns the number renewed
+def renew(store, sub_ids, days):
+    ledger = store.ledger
+    sub_ids = np.asarray(sub_ids, dtype=np.int64)
+    rows, found = ledger.rows_of(sub_ids)
+    rows, sub_ids = rows[found], sub_ids[found]
+    expired = ledger.column('status')[rows] == ledger.statuses.find('expired')
+    keep = ~expired | np.isin(sub_ids, on_catalog_plans(store, sub_ids))
+    rows, sub_ids, expired = rows[keep], sub_ids[keep], expired[keep]
+    ends = np.maximum(ledger.column('end_date')[rows], np.datetime64('today', 'D')) + np.timedelta64(int(days), 'D')
+    statuses = np.where(expired, 'active', np.asarray(ledger.statuses.labels, dtype=object)[ledger.column('status')[rows]])
+    return store.update_subscriptions(sub_ids, end_date=ends, status=statuses)
@@ -0,0 +1,140 @@
+# Plan catalog
+# Plans are typed records with parsed units (speed in bits/s, data cap in bytes,
+# price in cents) held in a name -> plan hash index. The catalog carries a version
+# stamp that changes on every edit, so values derived from it can be cached.
+import re  # Parsing speed and data cap labels
+
+import numpy as np  # Numerical computations
+
+# Unit multipliers for speed labels (to bits/s) and data cap labels (to bytes), decimal units
+SPEED_UNITS = {'kbps': 10 ** 3, 'mbps': 10 ** 6, 'gbps': 10 ** 9}
+CAP_UNITS = {'mb': 10 ** 6, 'gb': 10 ** 9, 'tb': 10 ** 12}
+# Data cap labels meaning "no cap"
+UNLIMITED = ('unlimited', 'none', 'no cap')
+# Bytes per GB (subscription data limits and usage are kept in GB)
+BYTES_PER_GB = CAP_UNITS['gb']
+
+# Plans the demo store is seeded with
+SAMPLE_PLANS = [
+    {'name': 'Basic', 'speed': '50 Mbps', 'price': 29.99, 'data_cap': '500 GB', 'description': 'For light browsing and streaming'},
+    {'name': 'Standard', 'speed': '100 Mbps', 'price': 49.99, 'data_cap': '1 TB', 'description': 'For families and remote work'},
+    {'name': 'Premium', 'speed': '1 Gbps', 'price': 79.99, 'data_cap': 'Unlimited', 'description': 'For gaming and 4K streaming'}
+]
+
+
+# Convert a dollar price to whole cents so running totals never drift
+def to_cents(price):
+    return int(round(float(price) * 100))
+
+
+# Parse a speed label such as '100 Mbps' or '1 Gbps' into bits/s; raises ValueError if unreadable
+def parse_speed(label):
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([kmg])(?:bps|b/s|bit/s)\s*', str(label), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Unrecognised speed {label!r} (expected e.g. '100 Mbps')")
+    return int(round(float(match.group(1)) * SPEED_UNITS[match.group(2).lower() + 'bps']))
+
+
+# Parse a data cap label such as '500 GB', '1.5 TB' or 'Unlimited' into bytes (None when unlimited)
+# raises ValueError if unreadable
+def parse_cap(label):
+    if str(label).strip().lower() in UNLIMITED:
+        return None
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([mgt])b\s*', str(label), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Unrecognised data cap {label!r} (expected e.g. '500 GB', '1 TB' or 'Unlimited')")
+    return int(round(float(match.group(1)) * CAP_UNITS[match.group(2).lower() + 'b']))
+
+
+# One catalog plan with typed fields; `speed` and `data_cap` keep the labels shown to customers
+class Plan:
+    __slots__ = ('name', 'speed', 'data_cap', 'description', 'speed_bps', 'cap_bytes', 'price_cents')
+
+    def __init__(self, name, speed, data_cap, price, description=''):
+        self.name = name
+        self.speed = speed  # Display label, e.g. '100 Mbps'
+        self.data_cap = data_cap  # Display label, e.g. '1 TB'
+        self.description = description or ''
+        self.speed_bps = parse_speed(speed)  # Bits per second
+        self.cap_bytes = parse_cap(data_cap)  # Bytes per month (None = unlimited)
+        self.price_cents = to_cents(price)  # Monthly price in cents
+
+    # Build a plan from a dict with name, speed, data_cap, price and description
+    @classmethod
+    def from_dict(cls, plan):
+        return cls(plan['name'], plan['speed'], plan['data_cap'], plan['price'], plan.get('description', ''))
+
+    # Monthly price in dollars
+    @property
+    def price(self):
+        return self.price_cents / 100
+
+    # Speed in Mbps
+    @property
+    def speed_mbps(self):
+        return self.speed_bps / SPEED_UNITS['mbps']
+
+    # Per-subscription data limit in GB (inf when unlimited)
+    @property
+    def data_limit(self):
+        return float('inf') if self.cap_bytes is None else self.cap_bytes / BYTES_PER_GB
+
+    # Plan as a plain dict (the shape stored in the database)
+    def to_dict(self):
+        return {'name': self.name, 'speed': self.speed, 'price': self.price,
+                'data_cap': self.data_cap, 'description': self.description}
+
+    def __repr__(self):
+        return f"Plan({self.name!r}, {self.speed!r}, {self.data_cap!r}, ${self.price:.2f})"
+
+
+# Ordered catalog of plans with O(1) lookup by name and a version stamp
+class PlanCatalog:
+    def __init__(self, plans=()):
+        self._plans = {}  # Name -> Plan (insertion order = catalog order)
+        self.version = 0  # Bumped on every change to the catalog
+        self._features = None  # (version, feature matrix) cache
+        for plan in plans:
+            self.add(plan)
+
+    # Add a plan (a Plan or a dict), replacing any plan with the same name; returns the Plan
+    def add(self, plan):
+        if not isinstance(plan, Plan):
+            plan = Plan.from_dict(plan)
+        self._plans[plan.name] = plan
+        self.version += 1
+        return plan
+
+    # Remove a plan by name (no-op if it is not in the catalog)
+    def remove(self, name):
+        if self._plans.pop(name, None) is not None:
+            self.version += 1
+
+    # Plan by name (None if unknown)
+    def get(self, name):
+        return self._plans.get(name)
+
+    def __getitem__(self, name):
+        return self._plans[name]
+
+    def __contains__(self, name):
+        return name in self._plans
+
+    def __iter__(self):
+        return iter(list(self._plans.values()))
+
+    def __len__(self):
+        return len(self._plans)
+
+    # Plans in catalog order
+    def plans(self):
+        return list(self._plans.values())
+
+    # Feature matrix with one row per plan in catalog order: speed (Mbps), cap (GB, inf = unlimited), price ($)
+    # Cached until the catalog changes
+    def features(self):
+        if self._features is None or self._features[0] != self.version:
+            features = np.array([(plan.speed_mbps, plan.data_limit, plan.price) for plan in self._plans.values()],
+                                dtype=np.float64).reshape(-1, 3)
+            self._features = (self.version, features)
+        return self._features[1]
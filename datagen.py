@@ -0,0 +1,226 @@
+# Synthetic data generator for load testing
+# Produces customers (with personal details), subscriptions and daily usage series at any
+# scale with vectorized NumPy, written straight into a store or to Parquet files.
+# Output depends only on the seed, the scale options and the as-of date: customers are
+# generated in fixed-size chunks, each with its own random stream derived from the seed.
+#
+# Usage:
+#   python datagen.py --customers 1000000 [--seed 0] [--subs-per-customer 1.0] [--usage-days 30]
+#                     [--as-of 2024-06-30] (--db broadband.db | --parquet DIRECTORY)
+import argparse  # Command-line interface
+import os  # Paths and environment defaults
+import time  # Progress timing
+
+import numpy as np  # Numerical computations
+import pandas as pd  # Data manipulation and analysis
+
+from auth import cost_from_env, hash_password  # One shared password hash for every generated customer
+from catalog import SAMPLE_PLANS, PlanCatalog  # Plans subscriptions are drawn from
+
+# Parquet output is only offered when pyarrow is installed
+try:
+    import pyarrow as pa
+    import pyarrow.parquet
+except ImportError:
+    pa = None
+
+# Customers generated per chunk (fixed, so the data does not depend on how it is written)
+CHUNK_SIZE = 100_000
+# Subscription statuses and their weights
+STATUSES = ('active', 'expired', 'cancelled')
+STATUS_WEIGHTS = (0.7, 0.2, 0.1)
+# Subscription term and how far back start dates go (days)
+TERM_DAYS = 365
+START_WINDOW = 365
+# Median daily usage (GB) per subscription and its spread (log-normal sigma)
+DAILY_GB = 10.0
+DAILY_GB_SIGMA = 0.6
+# Day-to-day variation of usage (gamma shape; higher is steadier)
+DAILY_SHAPE = 4.0
+# Password every generated customer logs in with
+DEFAULT_PASSWORD = 'password'
+
+# Building blocks for names and addresses
+FIRST_NAMES = np.array(['James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David',
+                        'Elizabeth', 'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah',
+                        'Carlos', 'Karen', 'Wei', 'Priya', 'Ahmed', 'Fatima', 'Hiroshi', 'Yuki', 'Olga', 'Ivan'])
+LAST_NAMES = np.array(['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez',
+                       'Martinez', 'Hernandez', 'Lopez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson',
+                       'Martin', 'Lee', 'Chen', 'Patel', 'Khan', 'Tanaka', 'Ivanova', 'Nguyen', 'Kim', 'Singh'])
+STREETS = np.array(['Main', 'Oak', 'Pine', 'Maple', 'Cedar', 'Elm', 'Washington', 'Lake', 'Hill', 'Park',
+                    'River', 'Sunset', 'Highland', 'Church', 'Spring', 'Mill'])
+STREET_TYPES = np.array(['St', 'Ave', 'Rd', 'Blvd', 'Ln', 'Dr', 'Ct', 'Way'])
+EMAIL_DOMAINS = np.array(['example.com', 'example.net', 'example.org'])
+
+
+# Random stream for one chunk: the same (seed, chunk) always gives the same numbers
+def chunk_rng(seed, chunk):
+    return np.random.default_rng([seed, chunk])
+
+
+# Customers numbered first .. first + count - 1, as a DataFrame with the users table columns
+# (password is left to the caller, so one hash can be shared by every chunk)
+def generate_customers(first, count, rng, prefix='cust'):
+    numbers = np.arange(first, first + count)
+    usernames = np.char.add(prefix, np.char.zfill(numbers.astype(str), 7))
+    first_names = FIRST_NAMES[rng.integers(len(FIRST_NAMES), size=count)]
+    last_names = LAST_NAMES[rng.integers(len(LAST_NAMES), size=count)]
+    names = np.char.add(np.char.add(first_names, ' '), last_names)
+    # Emails stay unique by embedding the customer number
+    emails = np.char.add(np.char.add(np.char.lower(first_names), '.'), np.char.lower(last_names))
+    emails = np.char.add(np.char.add(emails, numbers.astype(str)), '@')
+    emails = np.char.add(emails, EMAIL_DOMAINS[rng.integers(len(EMAIL_DOMAINS), size=count)])
+    digits = rng.integers([200, 200, 0], [1000, 1000, 10000], size=(count, 3))
+    phones = pd.Series(digits[:, 0]).astype(str) + '-' + pd.Series(digits[:, 1]).astype(str) + '-' \
+        + pd.Series(digits[:, 2]).astype(str).str.zfill(4)
+    houses = rng.integers(1, 10000, size=count).astype(str)
+    addresses = np.char.add(np.char.add(houses, ' '), STREETS[rng.integers(len(STREETS), size=count)])
+    addresses = np.char.add(np.char.add(addresses, ' '), STREET_TYPES[rng.integers(len(STREET_TYPES), size=count)])
+    return pd.DataFrame({
+        'username': usernames.astype(object),
+        'password': None,
+        'role': 'customer',
+        'name': names.astype(object),
+        'email': emails.astype(object),
+        'phone': phones.to_numpy(dtype=object),
+        'address': addresses.astype(object),
+    })
+
+
+# Subscriptions for the given usernames, as a DataFrame with the subscriptions table columns
+# Every customer gets at least one subscription; subs_per_customer is the mean number per customer.
+# Plans are drawn uniformly from the catalog; start dates fall within the year before as_of.
+def generate_subscriptions(usernames, catalog, rng, subs_per_customer=1.0, as_of=None):
+    usernames = np.asarray(usernames, dtype=object)
+    counts = 1 + rng.poisson(max(subs_per_customer - 1.0, 0.0), size=len(usernames))
+    total = int(counts.sum())
+    names = np.array([plan.name for plan in catalog.plans()], dtype=object)
+    features = catalog.features()
+    plans = rng.integers(len(names), size=total)
+    as_of = np.datetime64(as_of or 'today', 'D')
+    start = as_of - rng.integers(1, START_WINDOW, size=total).astype('timedelta64[D]')
+    data_limit = features[plans, 1]
+    # Data used so far this term: a fraction of the cap, or of a heavy month when unlimited
+    data_used = np.round(rng.random(total) * np.where(np.isfinite(data_limit), data_limit, 1500.0), 2)
+    return pd.DataFrame({
+        'user_id': np.repeat(usernames, counts),
+        'plan': names[plans],
+        'status': np.array(STATUSES, dtype=object)[rng.choice(len(STATUSES), size=total, p=STATUS_WEIGHTS)],
+        'start_date': start,
+        'end_date': start + np.timedelta64(TERM_DAYS, 'D'),
+        'price': features[plans, 2],
+        'data_used': data_used,
+        'data_limit': data_limit,
+    })
+
+
+# Daily usage for `count` subscriptions over the `days` days ending at as_of
+# Returns (subscription positions 0 .. count - 1, days as datetime64[D], GB) with one entry per day
+def generate_usage(count, days, rng, as_of=None):
+    if not days or not count:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype='datetime64[D]'), np.empty(0)
+    # Each subscription has its own typical level; days vary around it
+    levels = rng.lognormal(np.log(DAILY_GB), DAILY_GB_SIGMA, size=count)
+    gb = rng.gamma(DAILY_SHAPE, levels[:, None] / DAILY_SHAPE, size=(count, days))
+    first = np.datetime64(as_of or 'today', 'D') - np.timedelta64(days - 1, 'D')
+    dates = first + np.arange(days).astype('timedelta64[D]')
+    return np.repeat(np.arange(count), days), np.tile(dates, count), np.round(gb, 3).ravel()
+
+
+# Generate the dataset chunk by chunk; yields (customers, subscriptions, usage) per chunk where
+# usage is (positions into the chunk's subscriptions, days, GB) for its active subscriptions
+def generate(customers, seed=0, catalog=None, subs_per_customer=1.0, usage_days=30, as_of=None,
+             prefix='cust', chunk_size=CHUNK_SIZE):
+    catalog = catalog if catalog is not None else PlanCatalog(SAMPLE_PLANS)
+    for chunk, first in enumerate(range(0, customers, chunk_size)):
+        rng = chunk_rng(seed, chunk)
+        users = generate_customers(first, min(chunk_size, customers - first), rng, prefix)
+        subscriptions = generate_subscriptions(users['username'], catalog, rng, subs_per_customer, as_of)
+        active = np.flatnonzero(subscriptions['status'].to_numpy() == 'active')
+        positions, days, gb = generate_usage(len(active), usage_days, rng, as_of)
+        yield users, subscriptions, (active[positions], days, gb)
+
+
+# Generate straight into a store; returns (customers, subscriptions, usage points) written
+# Every customer's password is `password` (hashed once and shared)
+def load_store(store, customers, seed=0, password=DEFAULT_PASSWORD, progress=None, **options):
+    shared_hash = hash_password(password, cost_from_env())  # At the configured cost, like signups
+    totals = np.zeros(3, dtype=np.int64)
+    for users, subscriptions, (positions, days, gb) in generate(customers, seed, store.catalog, **options):
+        ids = store.bulk_load(users.assign(password=shared_hash), subscriptions)
+        # One point per subscription per day, at the day's first hour
+        store.usage.record_batch(ids[positions], days.astype('datetime64[h]'), gb)
+        totals += (len(users), len(subscriptions), len(gb))
+        if progress:
+            progress(*totals)
+    store.usage.flush()
+    return tuple(int(total) for total in totals)
+
+
+# Generate into customers/subscriptions/usage Parquet files in a directory (needs pyarrow)
+# Subscription ids are numbered from 1; returns (customers, subscriptions, usage points) written
+def write_parquet(directory, customers, seed=0, password=DEFAULT_PASSWORD, progress=None, **options):
+    if pa is None:
+        raise RuntimeError("Parquet output needs pyarrow (pip install pyarrow)")
+    os.makedirs(directory, exist_ok=True)
+    shared_hash = hash_password(password, cost_from_env())  # At the configured cost, like signups
+    writers = {}  # Dataset name -> ParquetWriter (opened with the first chunk's schema)
+    totals = np.zeros(3, dtype=np.int64)
+    try:
+        for users, subscriptions, (positions, days, gb) in generate(customers, seed, **options):
+            ids = np.arange(totals[1] + 1, totals[1] + 1 + len(subscriptions), dtype=np.int64)
+            frames = {
+                'customers': users.assign(password=shared_hash),
+                'subscriptions': subscriptions.assign(id=ids)[['id', *subscriptions.columns]],
+                'usage': pd.DataFrame({'sub_id': ids[positions], 'date': days, 'usage_gb': gb}),
+            }
+            for name, frame in frames.items():
+                table = pa.Table.from_pandas(frame, preserve_index=False)
+                if name not in writers:
+                    writers[name] = pa.parquet.ParquetWriter(os.path.join(directory, f'{name}.parquet'), table.schema)
+                writers[name].write_table(table)
+            totals += (len(users), len(subscriptions), len(gb))
+            if progress:
+                progress(*totals)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return tuple(int(total) for total in totals)
+
+
+# Command-line entry point
+def main():
+    parser = argparse.ArgumentParser(description="Generate reproducible synthetic customers, subscriptions and usage")
+    parser.add_argument('--customers', type=int, default=1000, help="Number of customers")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed")
+    parser.add_argument('--subs-per-customer', type=float, default=1.0, help="Mean subscriptions per customer (at least 1)")
+    parser.add_argument('--usage-days', type=int, default=30, help="Days of usage per active subscription")
+    parser.add_argument('--as-of', help="Last day of the generated data (YYYY-MM-DD, default today)")
+    parser.add_argument('--prefix', default='cust', help="Username prefix")
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument('--db', default=os.environ.get('BROADBAND_DB', 'broadband.db'), help="SQLite database file")
+    output.add_argument('--parquet', metavar='DIRECTORY', help="Write Parquet files to this directory instead")
+    args = parser.parse_args()
+
+    options = {'subs_per_customer': args.subs_per_customer, 'usage_days': args.usage_days,
+               'as_of': args.as_of, 'prefix': args.prefix}
+    start = time.perf_counter()
+
+    # Running totals after each chunk
+    def progress(customers, subscriptions, points):
+        print(f"{customers:>12,} customers {subscriptions:>12,} subscriptions {points:>14,} usage points "
+              f"({time.perf_counter() - start:.1f}s)")
+
+    if args.parquet:
+        write_parquet(args.parquet, args.customers, args.seed, progress=progress, **options)
+    else:
+        from storage import SQLiteStore, seed_sample_data  # Imported here so Parquet output needs no database
+
+        store = SQLiteStore(args.db)
+        if store.is_empty():
+            seed_sample_data(store)
+        load_store(store, args.customers, args.seed, progress=progress, **options)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+# On-demand streaming export of customers, subscriptions and usage
+# Rows are read from the store in chunks and written straight to a temporary
+# file on disk, so memory stays flat however many rows are exported. Reading
+# never changes the store (usage segments are merged on the fly, not compacted).
+import gzip  # Compressed CSV output
+import io  # Unbuffered reader over the finished file
+import os  # Removing the temporary file
+import tempfile  # Output file on disk
+
+import numpy as np  # Numerical computations
+import pandas as pd  # Data manipulation and analysis
+
+# Arrow-based formats are only offered when pyarrow is installed
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pa = None
+
+# Rows per chunk read from the store
+CHUNK_SIZE = 50_000
+
+# Exportable datasets and their columns
+DATASETS = {
+    'customers': ['username', 'name', 'email', 'phone', 'address', 'plan', 'status', 'start_date', 'end_date'],
+    'subscriptions': ['id', 'user_id', 'plan', 'status', 'start_date', 'end_date', 'price', 'data_used', 'data_limit'],
+    'usage': ['sub_id', 'user_id', 'date', 'usage_gb'],
+}
+# Output format -> (file extension, MIME type)
+FORMATS = {
+    'csv': ('csv', 'text/csv'),
+    'csv.gz': ('csv.gz', 'application/gzip'),
+}
+if pa is not None:
+    FORMATS['parquet'] = ('parquet', 'application/vnd.apache.parquet')
+    FORMATS['arrow'] = ('arrow', 'application/vnd.apache.arrow.file')
+
+
+# Keep the rows of a chunk that pass every filter
+# filters maps column -> list of allowed values, or -> (low, high) inclusive range for dates/numbers
+def apply_filters(frame, filters):
+    if not filters or frame.empty:
+        return frame
+    mask = np.ones(len(frame), dtype=bool)
+    for column, allowed in filters.items():
+        if isinstance(allowed, tuple):
+            low, high = allowed
+            values = frame[column]
+            if pd.api.types.is_datetime64_any_dtype(values):
+                low, high = pd.Timestamp(low), pd.Timestamp(high)
+            mask &= ((values >= low) & (values <= high)).to_numpy()
+        else:
+            mask &= frame[column].isin(allowed).to_numpy()
+    return frame[mask]
+
+
+# Subscriptions in ledger order, one chunk at a time
+def _subscription_chunks(store, chunk_size):
+    ledger = store.ledger
+    for start in range(0, len(ledger), chunk_size):
+        yield ledger.frame(DATASETS['subscriptions'], start, start + chunk_size)
+
+
+# Customers with their active subscription, one page of users at a time
+def _customer_chunks(store, chunk_size):
+    cursor = None
+    while True:
+        users, cursor = store.users_page('customer', cursor, chunk_size)
+        rows = []
+        for username, user in users.items():
+            details = user.get('personal_details', {})
+            active_sub = store.active_subscription(username) or {}
+            rows.append({
+                'username': username, 'name': user.get('name', ''),
+                'email': details.get('email', ''), 'phone': details.get('phone', ''), 'address': details.get('address', ''),
+                'plan': active_sub.get('plan'), 'status': active_sub.get('status'),
+                'start_date': active_sub.get('start_date'), 'end_date': active_sub.get('end_date'),
+            })
+        if rows:
+            # All-text columns so every chunk has the same schema (even when a page has no subscriptions)
+            yield pd.DataFrame(rows, columns=DATASETS['customers']).astype('string')
+        if cursor is None:
+            break
+
+
+# Daily usage of every subscription, streamed from the usage store's daily tier
+def _usage_chunks(store, chunk_size):
+    ledger = store.ledger
+    for chunk in store.usage.iter_points('day', chunk_size):
+        # Attach the subscriber through one binary search of the ledger's id column per chunk
+        rows, found = ledger.rows_of(chunk['sub_id'].to_numpy())
+        user_ids = np.full(len(chunk), None, dtype=object)
+        user_ids[found] = [ledger.users.labels[code] for code in ledger.column('user_id')[rows[found]].tolist()]
+        chunk['user_id'] = user_ids
+        yield chunk.rename(columns={'period': 'date'})
+
+
+# Chunks of a dataset after filtering and column selection
+def iter_chunks(store, dataset, columns=None, filters=None, chunk_size=CHUNK_SIZE):
+    chunks = {'customers': _customer_chunks, 'subscriptions': _subscription_chunks, 'usage': _usage_chunks}[dataset]
+    for chunk in chunks(store, chunk_size):
+        chunk = apply_filters(chunk, filters)
+        if len(chunk):
+            yield chunk[columns or DATASETS[dataset]]
+
+
+# Write chunks to a binary file object in the given format
+def write_chunks(chunks, fmt, fileobj):
+    if fmt in ('csv', 'csv.gz'):
+        out = gzip.GzipFile(filename='', fileobj=fileobj, mode='wb') if fmt == 'csv.gz' else fileobj
+        header = True  # Only the first chunk carries the header row
+        for chunk in chunks:
+            out.write(chunk.to_csv(index=False, header=header).encode('utf-8'))
+            header = False
+        if out is not fileobj:
+            out.close()  # Flush the gzip trailer (leaves fileobj open)
+        return
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    writer = schema = None
+    for chunk in chunks:
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        if writer is None:
+            # The first chunk fixes the schema
+            schema = table.schema
+            writer = (pa.parquet.ParquetWriter(fileobj, schema) if fmt == 'parquet'
+                      else pa.ipc.new_file(fileobj, schema))
+        writer.write_table(table.cast(schema))
+    if writer is not None:
+        writer.close()
+
+
+# Export a dataset to a temporary file and return it opened for reading (an unbuffered io.FileIO at
+# the start of the output); the file is already unlinked, so its space is freed once the reader is closed
+def export(store, dataset, fmt='csv', columns=None, filters=None, chunk_size=CHUNK_SIZE):
+    output = tempfile.NamedTemporaryFile(suffix=f'.{FORMATS[fmt][0]}' if fmt in FORMATS else '', delete=False)
+    try:
+        with output:
+            write_chunks(iter_chunks(store, dataset, columns, filters, chunk_size), fmt, output)
+        return io.FileIO(output.name, 'r')
+    finally:
+        os.remove(output.name)
@@ -0,0 +1,41 @@
+# Versioned LRU cache for dashboard aggregates and figures
+# Entries are tagged with the store's data version; a lookup with a newer
+# version recomputes the entry, so views are only rebuilt after a mutation.
+import threading  # Lock shared by all script threads
+from collections import OrderedDict  # Recency order for LRU eviction
+
+
+# Bounded cache of computed views keyed by name and validated by data version
+class VersionedCache:
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries  # Entries kept before the least recently used is evicted
+        self._entries = OrderedDict()  # Key -> (version, value), least recently used first
+        self._lock = threading.Lock()
+        self.hits = 0  # Lookups served from the cache
+        self.misses = 0  # Lookups that had to recompute
+
+    # Return the cached value for key if it was computed at this version, otherwise compute and store it
+    def get(self, key, version, compute):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)  # Mark as most recently used
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        # Compute outside the lock so other sessions are not blocked
+        value = compute()
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)  # Evict the least recently used entry
+        return value
+
+    # Drop every entry
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,174 @@
+# Secondary indexes over the subscription ledger
+# Hash indexes on status, plan and user give O(1) counts and lookups; a sorted
+# index on end date answers "what ends between X and Y" in O(log n + k) for k
+# matches. The sorted index is split into blocks of bounded size, so inserting
+# or removing one entry is a binary search over the block maxima plus a shift
+# inside one block: O(log n), not the O(n) of inserting into one long list.
+from bisect import bisect_left, bisect_right, insort  # Binary search on sorted lists
+
+import numpy as np  # Numerical computations
+import pandas as pd  # Data manipulation and analysis
+
+# Columns with a hash index (category code -> set of ledger rows)
+HASHED = ('status', 'plan', 'user_id')
+# Target entries per block of a sorted index (blocks are split at twice this size)
+BLOCK_SIZE = 512
+
+
+# Sorted entries held as a list of sorted blocks, with O(log n) insert and remove
+class SortedEntries:
+    def __init__(self, entries=()):
+        self._load(sorted(entries))
+
+    # Sorted entries over an already sorted list (no sort)
+    @classmethod
+    def from_sorted(cls, entries):
+        sorted_entries = cls()
+        sorted_entries._load(list(entries))
+        return sorted_entries
+
+    # Replace the contents with already sorted entries, cut into blocks
+    def _load(self, entries):
+        self.blocks = [entries[i:i + BLOCK_SIZE] for i in range(0, len(entries), BLOCK_SIZE)]
+        self.maxes = [block[-1] for block in self.blocks]  # Largest entry of each block
+        self.size = len(entries)
+
+    # Index of the block an entry belongs in (the first whose maximum is not below it)
+    def _block(self, entry):
+        return min(bisect_left(self.maxes, entry), len(self.blocks) - 1)
+
+    def add(self, entry):
+        if not self.blocks:
+            self._load([entry])
+            return
+        i = self._block(entry)
+        block = self.blocks[i]
+        insort(block, entry)
+        self.maxes[i] = block[-1]
+        if len(block) > 2 * BLOCK_SIZE:
+            self.blocks[i:i + 1] = [block[:BLOCK_SIZE], block[BLOCK_SIZE:]]
+            self.maxes[i:i + 1] = [block[BLOCK_SIZE - 1], block[-1]]
+        self.size += 1
+
+    # Remove an entry; returns False if it is not there
+    def remove(self, entry):
+        if not self.blocks:
+            return False
+        i = self._block(entry)
+        block = self.blocks[i]
+        position = bisect_left(block, entry)
+        if position == len(block) or block[position] != entry:
+            return False
+        del block[position]
+        if block:
+            self.maxes[i] = block[-1]
+        else:
+            del self.blocks[i], self.maxes[i]
+        self.size -= 1
+        return True
+
+    # Add many entries: one merge of the sorted runs and one re-blocking (linear)
+    def extend(self, entries):
+        self._load(sorted(list(self) + list(entries)))
+
+    # Entries in [low, high], in order
+    def between(self, low, high):
+        found = []
+        for block in self.blocks[bisect_left(self.maxes, low):]:
+            if block[0] > high:
+                break
+            found.extend(block[bisect_left(block, low):bisect_right(block, high)])
+        return found
+
+    def __iter__(self):
+        for block in self.blocks:
+            yield from block
+
+    def __len__(self):
+        return self.size
+
+
+# Hash and sorted indexes kept in sync with a SubscriptionLedger (registered as a listener)
+class SubscriptionIndex:
+    def __init__(self):
+        self.hashed = {column: {} for column in HASHED}  # Column -> code -> set of rows
+        self.by_end = SortedEntries()  # (end date as day number, row) pairs
+
+    # Day number of a datetime64[D] value (sort key for the end-date index)
+    @staticmethod
+    def _day(value):
+        return int(np.datetime64(value, 'D').astype(np.int64))
+
+    # Ledger listener: add a new row to every index
+    def on_append(self, ledger, row):
+        for column in HASHED:
+            self.hashed[column].setdefault(int(ledger.column(column)[row]), set()).add(row)
+        self.by_end.add((self._day(ledger.column('end_date')[row]), row))
+
+    # Ledger listener: move a row between buckets for every indexed column that changed
+    def on_update(self, ledger, row, old):
+        for column in HASHED:
+            if column in old:
+                self.hashed[column][int(old[column])].discard(row)
+                self.hashed[column].setdefault(int(ledger.column(column)[row]), set()).add(row)
+        if 'end_date' in old:
+            self.by_end.remove((self._day(old['end_date']), row))
+            self.by_end.add((self._day(ledger.column('end_date')[row]), row))
+
+    # Ledger listener: many rows were appended at once; add them group by group
+    def on_bulk_append(self, ledger, rows):
+        for column in HASHED:
+            for code, group in self._groups(ledger.column(column)[rows], rows):
+                self.hashed[column].setdefault(code, set()).update(group.tolist())
+        # Sorted new entries form a second run, which the sort merges in linear time
+        self.by_end.extend(self._end_entries(ledger, rows))
+
+    # Ledger listener: many rows changed at once; rebuild once if an indexed column changed
+    def on_bulk_update(self, ledger, rows, old):
+        if any(column in old for column in HASHED + ('end_date',)):
+            self.rebuild(ledger)
+
+    # Rows whose column has the given label
+    def rows(self, ledger, column, label):
+        return self.hashed[column].get(ledger.categories(column).find(label), set())
+
+    # Number of rows whose column has the given label
+    def count(self, ledger, column, label):
+        return len(self.rows(ledger, column, label))
+
+    # Number of rows per label of an indexed column, as a Series indexed by label
+    def counts(self, ledger, column):
+        labels = ledger.categories(column).labels
+        counts = [len(self.hashed[column].get(code, ())) for code in range(len(labels))]
+        return pd.Series(counts, index=pd.Index(labels, name=column), name='count')
+
+    # One user's rows in ledger (creation) order
+    def user_rows(self, ledger, username):
+        return sorted(self.rows(ledger, 'user_id', username))
+
+    # Rows whose end date falls in [start, end] (dates or 'YYYY-MM-DD' strings), earliest first
+    def ending_between(self, start, end):
+        return [row for _, row in self.by_end.between((self._day(start), -1), (self._day(end), float('inf')))]
+
+    # Split rows by category code; yields (code, rows with that code)
+    @staticmethod
+    def _groups(codes, rows):
+        order = np.argsort(codes, kind='stable')  # Group rows by code
+        bounds = np.flatnonzero(np.diff(codes[order])) + 1
+        for group in np.split(order, bounds):
+            if len(group):
+                yield int(codes[group[0]]), rows[group]
+
+    # Sorted (end day, row) entries for the given rows
+    @staticmethod
+    def _end_entries(ledger, rows):
+        days = ledger.column('end_date')[rows].astype(np.int64)
+        order = np.lexsort((rows, days))
+        return list(zip(days[order].tolist(), rows[order].tolist()))
+
+    # Rebuild every index from scratch in one pass over the ledger columns
+    def rebuild(self, ledger):
+        rows = np.arange(len(ledger))
+        for column in HASHED:
+            self.hashed[column] = {code: set(group.tolist()) for code, group in self._groups(ledger.column(column), rows)}
+        self.by_end = SortedEntries.from_sorted(self._end_entries(ledger, rows))
@@ -0,0 +1,151 @@
+# Batch ingestion of usage/accounting records
+# Record files (CSV or newline-delimited JSON) dropped into a directory are read
+# in chunks, aggregated per subscription with vectorized group-bys and applied in
+# batches to each subscription's data_used and to the usage history.
+# Progress is checkpointed per file after every chunk, and the usage history keeps
+# its own watermark per file, so re-running over the same files (or resuming after
+# a crash between the two) never counts a record twice.
+#
+# Each record needs `sub_id`, `timestamp` (ISO string or epoch seconds) and the
+# volume as `gb` or `bytes`. Only complete files are ingested: write a file under
+# another name (e.g. with a .tmp suffix) and rename it into place, or leave it
+# unmodified for SETTLE_SECONDS; a file that changes while it is read is resumed
+# on the next pass instead of being marked done.
+#
+# Usage:
+#   python ingest.py DIRECTORY [--db broadband.db] [--watch SECONDS]
+# The store keeps an in-memory mirror per process, so run the CLI while the portal
+# is stopped, or set BROADBAND_INGEST_DIR to let the portal ingest in-process.
+import argparse  # Command-line interface
+import glob  # Finding record files
+import logging  # Reporting failed passes
+import os  # Paths
+import threading  # Background ingestion inside the portal
+import time  # Polling interval
+
+import numpy as np  # Numerical computations
+import pandas as pd  # Data manipulation and analysis
+
+from catalog import BYTES_PER_GB  # Decimal units, as in the plan catalog
+from usage_store import sum_by  # Vectorized group-by sum
+
+logger = logging.getLogger(__name__)
+
+# Records read per chunk
+CHUNK_SIZE = 1_000_000
+# Seconds a file must go unmodified before it is ingested (it may still be being written)
+SETTLE_SECONDS = 10
+# File patterns picked up from the drop directory
+PATTERNS = ('*.csv', '*.csv.gz', '*.jsonl', '*.ndjson', '*.jsonl.gz', '*.ndjson.gz')
+
+
+# Read a record file in chunks of DataFrames
+def read_chunks(path, chunk_size=CHUNK_SIZE):
+    if '.csv' in os.path.basename(path):
+        return pd.read_csv(path, chunksize=chunk_size)
+    return pd.read_json(path, lines=True, chunksize=chunk_size, convert_dates=False)  # Timestamps are parsed in parse_records
+
+
+# Turn a chunk of records into (sub_ids, hour numbers, GB) arrays
+def parse_records(chunk):
+    sub_ids = chunk['sub_id'].to_numpy(dtype=np.int64)
+    timestamps = chunk['timestamp']
+    if pd.api.types.is_numeric_dtype(timestamps):
+        times = pd.to_datetime(timestamps, unit='s')  # Epoch seconds
+    else:
+        times = pd.to_datetime(timestamps, utc=True).dt.tz_localize(None)  # ISO strings, normalised to UTC
+    hours = times.to_numpy(dtype='datetime64[h]').astype(np.int64)
+    if 'gb' in chunk:
+        gb = chunk['gb'].to_numpy(dtype=np.float64)
+    else:
+        gb = chunk['bytes'].to_numpy(dtype=np.float64) / BYTES_PER_GB
+    return sub_ids, hours, gb
+
+
+# Ingest one record file, resuming from its checkpoint; returns the number of records applied
+def ingest_file(store, path, chunk_size=CHUNK_SIZE):
+    source = os.path.basename(path)  # Checkpoints are keyed by file name
+    processed, done = store.get_checkpoint(source)
+    if done:
+        return 0
+    stat = os.stat(path)
+    applied = 0
+    position = 0  # Records read so far from this file
+    for chunk in read_chunks(path, chunk_size):
+        start, position = position, position + len(chunk)
+        if position <= processed:
+            continue  # Whole chunk applied by an earlier run
+        chunk = chunk.iloc[max(processed - start, 0):]  # Skip the part an earlier run applied
+        sub_ids, hours, gb = parse_records(chunk)
+        # Keep records for known subscriptions only
+        found = store.ledger.rows_of(sub_ids)[1]
+        sub_ids, hours, gb = sub_ids[found], hours[found], gb[found]
+        # Usage history (rolled up per hour/day/month inside the usage store), sealed with the file position
+        # before the checkpoint commits; a chunk replayed after a crash in between is skipped by the usage store
+        store.usage.record_batch(sub_ids, hours, gb, source, position)
+        store.usage.flush()
+        # One data_used delta per subscription, committed together with the checkpoint
+        unique, deltas = sum_by(sub_ids, gb)
+        store.apply_usage(unique, deltas, source, position)
+        applied += len(sub_ids)
+    grown = os.stat(path)
+    if (grown.st_size, grown.st_mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+        store.apply_usage([], [], source, position, done=True)  # A file still growing is resumed next time
+    return applied
+
+
+# Ingest every settled record file in a directory (oldest name first); returns {file name: records applied}
+# Files modified in the last `settle` seconds are left for a later pass
+def ingest_directory(store, directory, chunk_size=CHUNK_SIZE, settle=SETTLE_SECONDS):
+    paths = sorted({path for pattern in PATTERNS for path in glob.glob(os.path.join(directory, pattern))})
+    settled = time.time() - settle
+    return {os.path.basename(path): ingest_file(store, path, chunk_size) for path in paths
+            if os.path.getmtime(path) <= settled}
+
+
+# Background thread that polls a drop directory and ingests new files
+class IngestWorker(threading.Thread):
+    def __init__(self, store, directory, interval=60, chunk_size=CHUNK_SIZE):
+        super().__init__(name='usage-ingest', daemon=True)
+        self.store = store
+        self.directory = directory
+        self.interval = interval  # Seconds between polls
+        self.chunk_size = chunk_size
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                ingest_directory(self.store, self.directory, self.chunk_size)
+            except Exception:  # Keep polling; a bad file is retried on the next pass
+                logger.exception("Usage ingestion failed")
+            self.stopped.wait(self.interval)
+
+    # Ask the worker to finish after the current pass
+    def stop(self):
+        self.stopped.set()
+
+
+# Command-line entry point
+def main():
+    from storage import SQLiteStore  # Imported here so the module can be used without a database
+
+    parser = argparse.ArgumentParser(description="Ingest usage record files into the subscription store")
+    parser.add_argument('directory', help="Directory containing .csv/.ndjson record files")
+    parser.add_argument('--db', default=os.environ.get('BROADBAND_DB', 'broadband.db'), help="SQLite database file")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Records per chunk")
+    parser.add_argument('--watch', type=float, help="Keep polling the directory every N seconds")
+    args = parser.parse_args()
+
+    store = SQLiteStore(args.db)
+    while True:
+        for name, count in ingest_directory(store, args.directory, args.chunk_size).items():
+            if count:
+                print(f"{name}: {count} records")
+        if args.watch is None:
+            break
+        time.sleep(args.watch)
+
+
+if __name__ == '__main__':
+    main()
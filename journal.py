@@ -0,0 +1,183 @@
+# Append-only mutation journal
+# Every committed write to a journaled MemoryStore is appended as a typed event, one JSON
+# line {"seq": n, "type": ..., "data": {...}} naming the Store write method and its
+# arguments. Replaying the events in order through the same methods rebuilds the users,
+# plans, subscriptions, price changes and ingestion checkpoints; the derived structures
+# are detached during the replay. Revenue totals and rollups are rebuilt once at the end
+# in vectorized passes; the costly indexes, customer search and summary are built on
+# first use. A snapshot (see snapshot.py) lets a replay start from its sequence number,
+# after which compact() drops the events it covers.
+#
+# Group commit: a writer appends its event to a pending buffer while it still holds the
+# store's write lock (so the log order is the order the writes were applied in) and waits
+# for durability after releasing it. The first waiter writes every pending event with one
+# write() and one fsync; writers whose events went out in that group return at once. With
+# fsync=False each group still reaches the operating system (safe if the process crashes)
+# but is not forced to disk (the tail can be lost on power failure).
+# A torn last line, left by a crash in the middle of a write, is dropped on open.
+import json  # Event encoding
+import os  # fsync and truncation
+import threading  # Group commit
+
+import numpy as np  # Numerical computations
+import pandas as pd  # Bulk-load frames
+
+import snapshot  # Snapshot the replay starts from
+from storage import DEFERRABLE, MemoryStore  # Backend the journal makes durable
+
+# Event types: the Store write methods that are journaled
+EVENTS = ('add_user', 'update_user', 'add_plan', 'delete_plan', 'update_plan', 'add_subscription',
+          'update_subscription', 'update_subscriptions', 'add_price_change', 'remove_price_change',
+          'expire_subscriptions', 'bulk_load', 'apply_usage')
+
+
+# JSON values of an array or column (dates as 'YYYY-MM-DD', missing values as null)
+def _values(values):
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        return np.datetime_as_string(values.astype('datetime64[D]')).tolist()
+    if values.dtype == object:
+        return pd.Series(values).where(pd.notna(values), None).tolist()
+    return values.tolist()
+
+
+# json.dumps hook for the numpy and pandas values stores are called with
+def _default(value):
+    if isinstance(value, pd.DataFrame):
+        return {'__frame__': {column: _values(value[column]) for column in value.columns}}
+    if isinstance(value, (np.ndarray, pd.Series)):
+        return _values(value)
+    if isinstance(value, np.datetime64):
+        return str(value.astype('datetime64[D]'))
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Cannot journal a {type(value).__name__}")
+
+
+# json.loads hook turning encoded frames back into DataFrames
+def _object_hook(obj):
+    return pd.DataFrame(obj['__frame__']) if '__frame__' in obj else obj
+
+
+# Sequence number of an encoded event, read without decoding the rest of the line ('{"seq":N,...')
+def _seq(line):
+    return int(line[7:line.index(b',')])
+
+
+# Append-only event log in a file, with group commit
+class Journal:
+    def __init__(self, path, fsync=True):
+        self.path = path
+        self.fsync = fsync  # Force each group to disk before its writers return
+        self.last_seq = self._recover()  # Sequence number of the last durable event
+        self.appended = self.last_seq  # Sequence number of the last appended event
+        self._pending = []  # Encoded events not yet written
+        self._lock = threading.Lock()  # Guards the pending buffer and sequence numbers
+        self._flush_lock = threading.Lock()  # One group write at a time
+        self._file = open(path, 'ab')
+
+    # Drop a torn last line and return the sequence number of the last complete event
+    def _recover(self):
+        if not os.path.exists(self.path):
+            return 0
+        last_seq, good = 0, 0
+        with open(self.path, 'rb') as file:
+            for line in file:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    json.loads(line)
+                except ValueError:
+                    break
+                last_seq = _seq(line)
+                good += len(line)
+        if good < os.path.getsize(self.path):
+            with open(self.path, 'r+b') as file:
+                file.truncate(good)
+        return last_seq
+
+    # Queue an event; returns its sequence number (pass it to commit to wait until it is durable)
+    def append(self, event_type, data):
+        if event_type not in EVENTS:
+            raise ValueError(f"Unknown event type {event_type!r}")
+        with self._lock:
+            self.appended += 1
+            record = {'seq': self.appended, 'type': event_type, 'data': data}
+            self._pending.append(json.dumps(record, default=_default, separators=(',', ':')).encode() + b'\n')
+            return self.appended
+
+    # Return once event `seq` is durable, writing every pending event as one group if nobody else is
+    def commit(self, seq):
+        if self.last_seq >= seq:
+            return
+        with self._flush_lock:
+            if self.last_seq >= seq:
+                return  # Written in the group of an earlier writer
+            with self._lock:
+                group, self._pending = self._pending, []
+                last = self.appended
+            self._file.write(b''.join(group))
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self.last_seq = last
+
+    # Events with a sequence number above `after`, in log order, as dicts with seq, type and data
+    def events(self, after=0):
+        self.commit(self.appended)  # Include events still pending
+        with open(self.path, 'rb') as file:
+            for line in file:
+                if _seq(line) > after:
+                    yield json.loads(line, object_hook=_object_hook)
+
+    # Drop the events up to sequence number `upto` (e.g. once a snapshot covers them) by rewriting the
+    # file with the rest; appends wait until it is done
+    def compact(self, upto):
+        with self._flush_lock:
+            with open(self.path, 'rb') as file, open(self.path + '.tmp', 'wb') as kept:
+                for line in file:
+                    if _seq(line) > upto:
+                        kept.write(line)
+                kept.flush()
+                os.fsync(kept.fileno())
+            self._file.close()
+            os.replace(self.path + '.tmp', self.path)  # Atomic: a crash leaves the old or the new file
+            self._file = open(self.path, 'ab')
+
+    # Write what is pending and close the file
+    def close(self):
+        self.commit(self.appended)
+        self._file.close()
+
+
+# Apply the journal's events after sequence number `after` to a store through its write methods, then
+# reattach the derived structures (DEFERRABLE ones are built on first use); the store must not be
+# journaling (or have other ledger listeners) yet. Returns the number of events applied
+def replay(store, journal, after=0):
+    # Derived structures are rebuilt once below instead of updated per event
+    store.ledger.listeners = []
+    store._pending = set(DEFERRABLE)
+    applied = 0
+    for event in journal.events(after):
+        getattr(store, event['type'])(**event['data'])
+        applied += 1
+    store.ledger.listeners = []
+    store._attach_derived(defer=DEFERRABLE)
+    return applied
+
+
+# Open a durable in-memory store: load the newest snapshot in `snapshot_dir` (default next to the
+# journal) if there is one, replay the events of the journal at `path` (created if missing) that
+# follow it, and journal every write made to the store from then on. Usage series are kept as
+# segment files in a directory next to the journal
+def open_store(path, fsync=True, usage_dir=None, snapshot_dir=None):
+    journal = Journal(path, fsync)
+    usage_dir = usage_dir or f'{path}-usage'
+    latest = snapshot.latest(snapshot_dir or f'{path}-snapshots')
+    if latest:
+        store, seq = snapshot.load(latest, usage_dir, derived=False)  # replay() attaches the derived structures
+    else:
+        store, seq = MemoryStore(usage_dir=usage_dir), 0
+    replay(store, journal, after=seq)
+    store.journal = journal
+    return store
@@ -0,0 +1,267 @@
+# Columnar, typed subscription ledger
+# Subscriptions are held as parallel NumPy arrays instead of a list of dicts:
+# categorical codes for user/plan/status, datetime64 dates and float32 numbers.
+import numpy as np  # Numerical computations
+import pandas as pd  # Data manipulation and analysis
+
+# Subscription statuses known up front (more are added on first use)
+STATUSES = ('active', 'expired', 'cancelled')
+# Share of the ledger above which update_rows changes rows in one bulk_update instead of row by row
+BULK_SHARE = 0.02
+
+
+# Growable mapping between category labels and small integer codes
+class Categories:
+    def __init__(self, labels=()):
+        self.labels = []  # Code -> label
+        self.codes = {}  # Label -> code
+        self._sorted = None  # (sorted labels, their codes) of labels loaded in bulk, found by binary search
+        for label in labels:
+            self.code(label)
+
+    # Categories over many labels at once (code order), e.g. from a snapshot; `order` sorts the labels
+    # Looking them up by binary search saves building a dict of every label
+    @classmethod
+    def from_array(cls, labels, order):
+        categories = cls()
+        categories.labels = labels.tolist()
+        categories._sorted = (labels[order], order)
+        return categories
+
+    # Return the code for a label, assigning the next free code if it is new
+    def code(self, label):
+        code = self.find(label)
+        if code < 0:
+            code = self.codes[label] = len(self.labels)
+            self.labels.append(label)
+        return code
+
+    # Return the code for a label without assigning one (-1 if unknown)
+    def find(self, label):
+        code = self.codes.get(label, -1)
+        if code < 0 and self._sorted is not None:
+            keys, order = self._sorted
+            position = np.searchsorted(keys, label)
+            if position < len(keys) and keys[position] == label:
+                code = self.codes[label] = int(order[position])  # Found labels are remembered
+        return code
+
+    # Return the label of a code
+    def label(self, code):
+        return self.labels[code]
+
+    def __len__(self):
+        return len(self.labels)
+
+
+# Subscription ledger with amortised O(1) append and zero-copy column views
+# Listeners (revenue totals, indexes, ...) are notified of every append and update:
+#   on_append(ledger, row) and on_update(ledger, row, old) where old maps column -> previous stored value,
+#   on_bulk_append(ledger, rows) once per vectorized append (extend),
+#   on_bulk_update(ledger, rows, old) once per vectorized update where old maps column -> previous values array
+class SubscriptionLedger:
+    # Column name -> NumPy dtype
+    DTYPES = {
+        'id': np.int64,
+        'user_id': np.int32,
+        'plan': np.int16,
+        'status': np.int8,
+        'start_date': 'datetime64[D]',
+        'end_date': 'datetime64[D]',
+        'price': np.float32,
+        'data_used': np.float32,
+        'data_limit': np.float32,
+    }
+    # Columns stored as category codes
+    CATEGORICAL = ('user_id', 'plan', 'status')
+
+    def __init__(self, capacity=1024):
+        self.size = 0  # Number of rows in use
+        self.users = Categories()  # Username categories
+        self.plans = Categories()  # Plan name categories
+        self.statuses = Categories(STATUSES)  # Status categories
+        self.listeners = []  # Derived structures kept in sync with the ledger
+        self._columns = {name: np.empty(capacity, dtype=dtype) for name, dtype in self.DTYPES.items()}
+
+    def __len__(self):
+        return self.size
+
+    # Register a derived structure to be notified of changes
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    # Category table for a categorical column
+    def categories(self, column):
+        return {'user_id': self.users, 'plan': self.plans, 'status': self.statuses}[column]
+
+    # Double the capacity of every column when full (or grow to at least `needed` rows)
+    def _grow(self, needed=0):
+        for name, array in self._columns.items():
+            grown = np.empty(max(2 * len(array), 16, needed), dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            self._columns[name] = grown
+
+    # Convert one field value to its stored representation
+    def _encode(self, column, value):
+        if column in self.CATEGORICAL:
+            return self.categories(column).code(value)
+        if column in ('start_date', 'end_date'):
+            return np.datetime64(value, 'D')
+        return value
+
+    # Convert one stored value back to the form used by the UI
+    def _decode(self, column, value):
+        if column in self.CATEGORICAL:
+            return self.categories(column).label(value)
+        if column in ('start_date', 'end_date'):
+            return str(value)
+        if column == 'id':
+            return int(value)
+        if column == 'price':
+            return round(float(value), 2)
+        return float(value)
+
+    # Append a subscription dict and return its row number (its id must be larger than every id in the ledger)
+    def append(self, sub):
+        if self.size == len(self._columns['id']):
+            self._grow()
+        row = self.size
+        for column in self.DTYPES:
+            self._columns[column][row] = self._encode(column, sub.get(column, 0))
+        self.size += 1
+        for listener in self.listeners:
+            listener.on_append(self, row)
+        return row
+
+    # Append many subscriptions in one vectorized step and return their row numbers
+    # frame is a DataFrame (or dict of arrays) with the ledger columns; ids must be increasing
+    # and larger than every id already in the ledger (rows_of relies on the id order)
+    def extend(self, frame):
+        count = len(frame['id'])
+        if self.size + count > len(self._columns['id']):
+            self._grow(self.size + count)
+        rows = np.arange(self.size, self.size + count)
+        for column in self.DTYPES:
+            values = np.asarray(frame[column]) if column in frame else 0
+            if column in self.CATEGORICAL:
+                # Encode each distinct label once, in order of first appearance
+                codes, labels = pd.factorize(values)
+                values = np.array([self.categories(column).code(label) for label in labels], dtype=np.int64)[codes]
+            elif column in ('start_date', 'end_date'):
+                values = np.asarray(values, dtype='datetime64[D]')
+            self._columns[column][rows] = values
+        self.size += count
+        for listener in self.listeners:
+            listener.on_bulk_append(self, rows)
+        return rows
+
+    # Change fields of an existing row
+    def update(self, row, **fields):
+        if row is None or not 0 <= row < self.size:
+            raise KeyError(row)  # Indexing with None would write every row
+        old = {}  # Previous stored values of the changed columns
+        for column, value in fields.items():
+            if column in self.DTYPES:
+                old[column] = self._columns[column][row]
+                self._columns[column][row] = self._encode(column, value)
+        for listener in self.listeners:
+            listener.on_update(self, row, old)
+
+    # Change columns of many rows in one vectorized step (values are stored values or arrays of them)
+    def bulk_update(self, rows, **columns):
+        old = {}  # Previous stored values of the changed columns
+        for column, values in columns.items():
+            old[column] = self._columns[column][rows].copy()
+            self._columns[column][rows] = values
+        for listener in self.listeners:
+            listener.on_bulk_update(self, rows, old)
+
+    # Convert one value (stored for every row) or an array of values (one per row) to stored form
+    def _encode_many(self, column, values):
+        if np.ndim(values) == 0:
+            return self._encode(column, values)
+        if column in self.CATEGORICAL:
+            codes, labels = pd.factorize(np.asarray(values))
+            return np.array([self.categories(column).code(label) for label in labels], dtype=np.int64)[codes]
+        if column in ('start_date', 'end_date'):
+            return np.asarray(values, dtype='datetime64[D]')
+        return np.asarray(values, dtype=self.DTYPES[column])
+
+    # Change fields of many rows; each field is one value for every row or an array with one value per row
+    # Small batches go row by row (listeners update incrementally), large ones in one bulk_update
+    # (listeners rebuild once)
+    def update_rows(self, rows, **fields):
+        rows = np.asarray(rows, dtype=np.int64)
+        fields = {column: value for column, value in fields.items() if column in self.DTYPES}
+        if len(rows) > BULK_SHARE * len(self):
+            self.bulk_update(rows, **{column: self._encode_many(column, value) for column, value in fields.items()})
+        else:
+            for position, row in enumerate(rows.tolist()):
+                self.update(row, **{column: value if np.ndim(value) == 0 else value[position]
+                                    for column, value in fields.items()})
+
+    # Row number of a subscription id (None if unknown); a binary search on the id column, like rows_of
+    def row_of(self, sub_id):
+        ids = self.column('id')
+        row = int(np.searchsorted(ids, sub_id))
+        return row if row < len(ids) and ids[row] == sub_id else None
+
+    # Row numbers of an array of subscription ids; returns (rows, found mask)
+    # Ids are appended in increasing order, so this is a binary search on the id column
+    def rows_of(self, sub_ids):
+        ids = self.column('id')
+        rows = np.clip(np.searchsorted(ids, sub_ids), 0, max(len(ids) - 1, 0))
+        found = ids[rows] == sub_ids if len(ids) else np.zeros(len(sub_ids), dtype=bool)
+        return rows, found
+
+    # Zero-copy view of the rows in use for one column (category codes for categorical columns)
+    def column(self, name):
+        return self._columns[name][:self.size]
+
+    # Decode one row back into the dict form used by the UI
+    def record(self, row):
+        return {column: self._decode(column, array[row]) for column, array in self._columns.items()}
+
+    # Number of rows per category of a categorical column, as a Series indexed by label
+    # (optionally restricted to the rows selected by a boolean mask)
+    def counts(self, column, mask=None):
+        categories = self.categories(column)
+        codes = self.column(column) if mask is None else self.column(column)[mask]
+        counts = np.bincount(codes, minlength=len(categories))
+        return pd.Series(counts, index=pd.Index(categories.labels, name=column), name='count')
+
+    # DataFrame over the ledger columns without copying the underlying arrays
+    # (optionally only rows start..stop, e.g. one chunk of an export)
+    def frame(self, columns=None, start=0, stop=None):
+        data = {}
+        for name in columns or self.DTYPES:
+            values = self.column(name)[start:stop]
+            if name in self.CATEGORICAL:
+                values = pd.Categorical.from_codes(values, categories=self.categories(name).labels, validate=False)
+            data[name] = values
+        return pd.DataFrame(data, copy=False)
+
+    # Make every column read-only, so a ledger shared as a snapshot cannot be changed in place
+    def freeze(self):
+        for array in self._columns.values():
+            array.flags.writeable = False
+
+    # Ledger over existing column arrays (e.g. memory-mapped from a snapshot) without copying them
+    # categories maps each categorical column to its Categories; the first append copies the
+    # columns into growable arrays
+    @classmethod
+    def from_columns(cls, columns, categories):
+        ledger = cls(capacity=0)
+        ledger._columns = {name: columns[name] for name in cls.DTYPES}
+        ledger.size = len(ledger._columns['id'])
+        ledger.users, ledger.plans, ledger.statuses = (categories[column] for column in cls.CATEGORICAL)
+        return ledger
+
+    # Build a ledger from an iterable of subscription dicts in one pass
+    @classmethod
+    def from_records(cls, records):
+        records = list(records)
+        ledger = cls(capacity=max(len(records), 1024))
+        for sub in records:
+            ledger.append(sub)
+        return ledger
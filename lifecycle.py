@@ -0,0 +1,182 @@
+# Subscription lifecycle scheduler
+# Active subscriptions sit in a min-heap keyed on the next day something happens to them:
+# a renewal reminder REMINDER_DAYS before the end date, then expiry the day after it
+# (a subscription is valid through its end date). A periodic tick pops only the entries
+# that are due, so each transition costs O(log n) and nothing scans the ledger.
+# Renewed, cancelled or upgraded subscriptions are not searched for in the heap: each
+# entry is checked against the ledger when it is popped and dropped if it is stale.
+# Each tick also applies the plan price changes scheduled for that day (see bulk_ops).
+import heapq  # Min-heap of upcoming transitions
+import logging  # Reporting failed ticks
+import threading  # Background ticks inside the portal
+
+import numpy as np  # Numerical computations
+
+from bulk_ops import apply_price_changes  # Scheduled plan price changes
+
+logger = logging.getLogger(__name__)
+
+# Days before the end date at which a renewal reminder is raised
+REMINDER_DAYS = 14
+# Transition kinds, stored in the low bit of a heap key
+EXPIRE, REMIND = 0, 1
+# Bits of a heap key below the day number (ledger row and kind)
+ROW_BITS = 32
+
+
+# Day number of a date ('YYYY-MM-DD' string, date or datetime64; None = today)
+def day_number(value=None):
+    return int(np.datetime64('today' if value is None else value, 'D').astype(np.int64))
+
+
+# Heap key of a transition: ordered by day; packed into one int to keep a large heap small
+def _key(day, row, kind):
+    return (day << ROW_BITS) | (row << 1) | kind
+
+
+# Min-heap of upcoming reminders and expiries kept in sync with a store's ledger (registered as a listener)
+# Handlers added with add_handler are called as handler(kind, sub_ids) after each tick, where kind is
+# 'reminder' or 'expired'
+class LifecycleScheduler:
+    def __init__(self, store, reminder_days=REMINDER_DAYS):
+        self.store = store
+        self.reminder_days = reminder_days
+        self.heap = []  # Packed (day, row, kind) keys
+        self.reminded = {}  # Ledger row -> end day the last reminder was raised for
+        self.handlers = []  # Called with the subscriptions each tick transitioned
+        self._lock = threading.Lock()  # Ledger writes push while the tick thread pops
+        self.rebuild(store.ledger)
+        store.ledger.add_listener(self)
+
+    # Register a callback for reminder and expiry events
+    def add_handler(self, handler):
+        self.handlers.append(handler)
+
+    # End day of a ledger row if the subscription is active, else None
+    @staticmethod
+    def _active_end(ledger, row):
+        if ledger.column('status')[row] != ledger.statuses.find('active'):
+            return None
+        return int(ledger.column('end_date')[row].astype(np.int64))
+
+    # Push the first transition of an active row (its reminder; the expiry follows it)
+    def _schedule(self, ledger, row):
+        end = self._active_end(ledger, row)
+        if end is not None:
+            with self._lock:
+                heapq.heappush(self.heap, _key(end - self.reminder_days, row, REMIND))
+
+    # Reminder keys for many rows (only active ones)
+    def _keys(self, ledger, rows):
+        rows = rows[ledger.column('status')[rows] == ledger.statuses.find('active')]
+        days = ledger.column('end_date')[rows].astype(np.int64) - self.reminder_days
+        return (days << ROW_BITS) | (rows.astype(np.int64) << 1) | REMIND
+
+    # Ledger listener: a new subscription was appended
+    def on_append(self, ledger, row):
+        self._schedule(ledger, row)
+
+    # Ledger listener: many subscriptions were appended at once
+    def on_bulk_append(self, ledger, rows):
+        keys = self._keys(ledger, np.asarray(rows)).tolist()
+        with self._lock:
+            self.heap.extend(keys)
+            heapq.heapify(self.heap)
+
+    # Ledger listener: a renewal, cancellation or reactivation reschedules the row
+    # (its old entries become stale and are dropped when popped)
+    def on_update(self, ledger, row, old):
+        if 'status' in old or 'end_date' in old:
+            self.reminded.pop(row, None)
+            self._schedule(ledger, row)
+
+    # Ledger listener: many rows changed at once; rebuild if statuses or end dates moved
+    def on_bulk_update(self, ledger, rows, old):
+        if 'status' in old or 'end_date' in old:
+            self.rebuild(ledger)
+
+    # Rebuild the heap from the ledger in one vectorized pass (a sorted list is a valid heap)
+    def rebuild(self, ledger):
+        keys = np.sort(self._keys(ledger, np.arange(len(ledger)))).tolist()
+        with self._lock:
+            self.heap = keys
+
+    # Pop every transition due on or before `today`; returns the still-valid (kind, row, end day) triples
+    # Popped keys are checked against the ledger in vectorized batches (a catch-up tick can pop many)
+    def _due(self, ledger, today):
+        limit = _key(today + 1, 0, 0)
+        due = []
+        with self._lock:
+            while self.heap and self.heap[0] < limit:
+                keys = []
+                while self.heap and self.heap[0] < limit:
+                    keys.append(heapq.heappop(self.heap))
+                keys = np.array(keys, dtype=np.int64)
+                days, rows, kinds = keys >> ROW_BITS, (keys & (2 ** ROW_BITS - 1)) >> 1, keys & 1
+                ends = ledger.column('end_date')[rows].astype(np.int64)
+                # Stale if the subscription is no longer active or its end date moved
+                valid = ((ledger.column('status')[rows] == ledger.statuses.find('active'))
+                         & (ends == np.where(kinds == REMIND, days + self.reminder_days, days - 1)))
+                kinds, rows, ends = kinds[valid], rows[valid], ends[valid]
+                due.extend(zip(kinds.tolist(), rows.tolist(), ends.tolist()))
+                # Reminded rows expire the day after their end date (popped above if that is due too)
+                for key in _key(ends[kinds == REMIND] + 1, rows[kinds == REMIND], EXPIRE).tolist():
+                    heapq.heappush(self.heap, key)
+        return due
+
+    # Apply due price changes, raise the reminders and expire the subscriptions that are due
+    # (today = date or None for today); returns {'repriced': count, 'reminder': count, 'expired': count}
+    def tick(self, today=None):
+        ledger = self.store.ledger
+        today = day_number(today)
+        repriced = apply_price_changes(self.store, np.datetime64(today, 'D'))
+        due = self._due(ledger, today)
+        ids = ledger.column('id')
+        reminders = []
+        for kind, row, end in due:
+            # A catch-up tick skips reminders for subscriptions that have already ended (they expire below)
+            if kind == REMIND and end >= today and self.reminded.get(row) != end:
+                self.reminded[row] = end
+                reminders.append(int(ids[row]))
+        expiring = [int(ids[row]) for kind, row, end in due if kind == EXPIRE]
+        # The store re-checks each subscription under its write lock, so a renewal racing the tick wins
+        expired = self.store.expire_subscriptions(expiring, np.datetime64(today, 'D')) if expiring else []
+        for sub_id in expired:
+            self.reminded.pop(ledger.row_of(sub_id), None)
+        for handler in self.handlers:
+            if reminders:
+                handler('reminder', reminders)
+            if len(expired):
+                handler('expired', list(expired))
+        return {'repriced': repriced, 'reminder': len(reminders), 'expired': len(expired)}
+
+    # True if a renewal reminder is out for the subscription's current end date
+    def renewal_due(self, sub_id):
+        row = self.store.ledger.row_of(sub_id)
+        return row is not None and row in self.reminded and self.reminded[row] == self._active_end(self.store.ledger, row)
+
+    # Number of scheduled (possibly stale) transitions
+    def __len__(self):
+        return len(self.heap)
+
+
+# Background thread that ticks a scheduler periodically
+class LifecycleWorker(threading.Thread):
+    def __init__(self, scheduler, interval=60):
+        super().__init__(name='subscription-lifecycle', daemon=True)
+        self.scheduler = scheduler
+        self.interval = interval  # Seconds between ticks
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.scheduler.tick()
+            except Exception:  # Keep ticking; the due entries of a failed tick are rebuilt below
+                logger.exception("Subscription lifecycle tick failed")
+                self.scheduler.rebuild(self.scheduler.store.ledger)
+            self.stopped.wait(self.interval)
+
+    # Ask the worker to finish after the current tick
+    def stop(self):
+        self.stopped.set()
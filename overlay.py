@@ -0,0 +1,617 @@
+# Copy-on-write session overlays over a shared snapshot
+# The baseline dataset (plans, users, subscriptions, usage) is held once per process in a
+# frozen MemoryStore. Each session works on an OverlayStore that keeps only its own changes
+# (new and edited users, plan edits, new and edited subscriptions, recorded usage) and
+# merges them into every read, so a session costs its deltas instead of a full copy.
+# Until a session writes, its overlay hands out the snapshot's structures unchanged.
+import copy  # Forking the small per-plan revenue totals and rollup buckets
+import heapq  # Merging sorted search results and end-date entries
+import itertools  # Overlay tokens and result limits
+
+import numpy as np  # Numerical computations
+import pandas as pd  # Data manipulation and analysis
+
+from catalog import Plan, PlanCatalog  # Copied catalog once a session edits plans
+from indexes import HASHED, SortedEntries, SubscriptionIndex  # Indexed columns and end-date keys
+from ledger import SubscriptionLedger  # Ledger holding a session's new subscriptions
+from search import MAX_RESULTS, CustomerSearchIndex, rank_key  # Search over a session's changed customers
+from summary import CustomerSummary, contact_details  # Summary rows of a session's changed customers
+from storage import PLAN_COLUMNS, SUBSCRIPTION_COLUMNS, USER_COLUMNS, USER_FIELDS, MemoryStore, Store  # Store interface
+from usage_store import UsageStore  # Usage recorded by a session
+
+# Distinguishes the versions of different overlays in process-wide caches
+_tokens = itertools.count(1)
+
+
+# Category table extending a snapshot's table with labels first seen in one session
+class OverlayCategories:
+    def __init__(self, base):
+        self.base = base
+        self.extra = []  # Labels added by the session
+        self.codes = {}  # Added label -> code (continuing after the snapshot's codes)
+
+    def code(self, label):
+        code = self.find(label)
+        if code < 0:
+            code = self.codes[label] = len(self.base) + len(self.extra)
+            self.extra.append(label)
+        return code
+
+    def find(self, label):
+        code = self.base.find(label)
+        return code if code >= 0 else self.codes.get(label, -1)
+
+    def label(self, code):
+        return self.base.label(code) if code < len(self.base) else self.extra[code - len(self.base)]
+
+    # Code -> label list (the snapshot's list itself while the session added none)
+    @property
+    def labels(self):
+        return self.base.labels + self.extra if self.extra else self.base.labels
+
+    def __len__(self):
+        return len(self.base) + len(self.extra)
+
+
+# Subscription ledger = snapshot rows (read-only) + patches to them + rows added by the session
+# Offers the SubscriptionLedger interface. Once the session has changes, a column is merged on
+# its first read and cached: updates patch the cached copy in place (like writes to a ledger's
+# column views) and only appends drop it, so repeated reads between writes cost O(1)
+class OverlayLedger:
+    DTYPES = SubscriptionLedger.DTYPES
+    CATEGORICAL = SubscriptionLedger.CATEGORICAL
+    _encode = SubscriptionLedger._encode
+    _decode = SubscriptionLedger._decode
+    rows_of = SubscriptionLedger.rows_of
+    _encode_many = SubscriptionLedger._encode_many
+    update_rows = SubscriptionLedger.update_rows
+    counts = SubscriptionLedger.counts
+    frame = SubscriptionLedger.frame
+
+    def __init__(self, base):
+        self.base = base
+        self.base_size = len(base)  # Rows below this come from the snapshot
+        self.users = OverlayCategories(base.users)
+        self.plans = OverlayCategories(base.plans)
+        self.statuses = OverlayCategories(base.statuses)
+        self.patches = {}  # Snapshot row -> {column: stored value} changed by the session
+        # Rows added by the session, encoded with the merged categories
+        self.tail = SubscriptionLedger(capacity=16)
+        self.tail.users, self.tail.plans, self.tail.statuses = self.users, self.plans, self.statuses
+        self.listeners = []
+        self._merged = {}  # Column -> merged column, kept until the next append
+
+    def __len__(self):
+        return self.base_size + len(self.tail)
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def categories(self, column):
+        return {'user_id': self.users, 'plan': self.plans, 'status': self.statuses}[column]
+
+    # Stored value of one cell
+    def stored(self, column, row):
+        if row >= self.base_size:
+            return self.tail.column(column)[row - self.base_size]
+        patch = self.patches.get(row)
+        if patch and column in patch:
+            return patch[column]
+        return self.base.column(column)[row]
+
+    def append(self, sub):
+        self._merged.clear()
+        row = self.base_size + self.tail.append(sub)
+        for listener in self.listeners:
+            listener.on_append(self, row)
+        return row
+
+    def extend(self, frame):
+        self._merged.clear()
+        rows = self.base_size + self.tail.extend(frame)
+        for listener in self.listeners:
+            listener.on_bulk_append(self, rows)
+        return rows
+
+    def update(self, row, **fields):
+        fields = {column: value for column, value in fields.items() if column in self.DTYPES}
+        old = {column: self.stored(column, row) for column in fields}
+        if row >= self.base_size:
+            self.tail.update(row - self.base_size, **fields)
+        else:
+            self.patches.setdefault(row, {}).update({column: self._encode(column, value) for column, value in fields.items()})
+        for column in fields:
+            if column in self._merged:
+                self._merged[column][row] = self.stored(column, row)
+        for listener in self.listeners:
+            listener.on_update(self, row, old)
+
+    def bulk_update(self, rows, **columns):
+        rows = np.asarray(rows)
+        old = {column: self.column(column)[rows].copy() for column in columns}
+        in_tail = rows >= self.base_size
+        for column, values in columns.items():
+            values = np.broadcast_to(np.asarray(values, dtype=self.DTYPES[column]), rows.shape)
+            if in_tail.any():
+                self.tail.bulk_update(rows[in_tail] - self.base_size, **{column: values[in_tail]})
+            for row, value in zip(rows[~in_tail].tolist(), values[~in_tail]):
+                self.patches.setdefault(row, {})[column] = value
+            if column in self._merged:
+                self._merged[column][rows] = values
+        for listener in self.listeners:
+            listener.on_bulk_update(self, rows, old)
+
+    def row_of(self, sub_id):
+        row = self.tail.row_of(sub_id)
+        return self.base.row_of(sub_id) if row is None else self.base_size + row
+
+    # Snapshot column with the session's patches and new rows applied
+    def column(self, name):
+        base = self.base.column(name)
+        if not self.patches and not len(self.tail):
+            return base
+        merged = self._merged.get(name)
+        if merged is None:
+            merged = self._merged[name] = np.concatenate([base, self.tail.column(name)])
+            for row, patch in self.patches.items():
+                if name in patch:
+                    merged[row] = patch[name]
+        return merged
+
+    def record(self, row):
+        return {column: self._decode(column, self.stored(column, row)) for column in self.DTYPES}
+
+
+# Secondary indexes = snapshot index + rows the session moved into or out of each bucket
+class OverlayIndex:
+    _day = staticmethod(SubscriptionIndex._day)
+
+    def __init__(self, base):
+        self.base = base
+        self.added = {column: {} for column in HASHED}  # Column -> code -> rows moved into the bucket
+        self.removed = {column: {} for column in HASHED}  # Column -> code -> snapshot rows moved out
+        self.by_end = SortedEntries()  # (end day, row) entries of new and re-dated rows
+        self.moved_end = set()  # Snapshot rows whose snapshot end-date entry no longer applies
+
+    # Move a row from one bucket to another (either may be None)
+    def _move(self, column, row, old_code, new_code):
+        if old_code is not None:
+            added = self.added[column].get(old_code, set())
+            if row in added:
+                added.discard(row)
+            else:
+                self.removed[column].setdefault(old_code, set()).add(row)
+        if new_code is not None:
+            removed = self.removed[column].get(new_code, set())
+            if row in removed:
+                removed.discard(row)
+            else:
+                self.added[column].setdefault(new_code, set()).add(row)
+
+    # Replace a row's end-date entry
+    def _move_end(self, row, old_day, new_day):
+        if old_day is not None and not self.by_end.remove((old_day, row)):
+            self.moved_end.add(row)
+        self.by_end.add((new_day, row))
+
+    def on_append(self, ledger, row):
+        for column in HASHED:
+            self._move(column, row, None, int(ledger.stored(column, row)))
+        self._move_end(row, None, self._day(ledger.stored('end_date', row)))
+
+    def on_bulk_append(self, ledger, rows):
+        for row in rows.tolist():
+            self.on_append(ledger, row)
+
+    def on_update(self, ledger, row, old):
+        for column in HASHED:
+            if column in old:
+                self._move(column, row, int(old[column]), int(ledger.stored(column, row)))
+        if 'end_date' in old:
+            self._move_end(row, self._day(old['end_date']), self._day(ledger.stored('end_date', row)))
+
+    def on_bulk_update(self, ledger, rows, old):
+        for i, row in enumerate(rows.tolist()):
+            self.on_update(ledger, row, {column: values[i] for column, values in old.items()})
+
+    def rows(self, ledger, column, label):
+        code = ledger.categories(column).find(label)
+        rows = self.base.hashed[column].get(code, set())
+        if self.removed[column].get(code):
+            rows = rows - self.removed[column][code]
+        if self.added[column].get(code):
+            rows = rows | self.added[column][code]
+        return rows
+
+    def count(self, ledger, column, label):
+        code = ledger.categories(column).find(label)
+        return (len(self.base.hashed[column].get(code, ())) - len(self.removed[column].get(code, ()))
+                + len(self.added[column].get(code, ())))
+
+    def counts(self, ledger, column):
+        labels = ledger.categories(column).labels
+        counts = [len(self.base.hashed[column].get(code, ())) - len(self.removed[column].get(code, ()))
+                  + len(self.added[column].get(code, ())) for code in range(len(labels))]
+        return pd.Series(counts, index=pd.Index(labels, name=column), name='count')
+
+    def user_rows(self, ledger, username):
+        return sorted(self.rows(ledger, 'user_id', username))
+
+    def ending_between(self, start, end):
+        low, high = (self._day(start), -1), (self._day(end), float('inf'))
+        base = [entry for entry in self.base.by_end.between(low, high) if entry[1] not in self.moved_end]
+        own = self.by_end.between(low, high)
+        return [row for _, row in heapq.merge(base, own)]
+
+
+# Customer search = snapshot index without the customers the session changed + an index of those
+class OverlaySearch:
+    def __init__(self, base):
+        self.base = base
+        self.own = CustomerSearchIndex()  # Customers added or edited by the session
+        self.hidden = set()  # Snapshot customers whose snapshot entry no longer applies
+
+    def add(self, username, user):
+        self.hidden.add(username)
+        self.own.add(username, user)
+
+    def add_many(self, items):
+        items = list(items)
+        self.hidden.update(username for username, _ in items)
+        self.own.add_many(items)
+
+    def remove(self, username):
+        self.hidden.add(username)
+        self.own.remove(username)
+
+    def scored(self, query):
+        base = [match for match in self.base.scored(query) if match[1] not in self.hidden]
+        return list(heapq.merge(base, self.own.scored(query), key=rank_key))
+
+    def rank(self, query):
+        return [username for _, username in self.scored(query)[:MAX_RESULTS]]
+
+    def search(self, query, limit=50, offset=0):
+        ranked = self.rank(query)
+        return len(ranked), ranked[offset:offset + limit]
+
+
+# Customer summary = snapshot summary with the rows of customers the session added, edited or
+# changed subscriptions of replaced by its own
+class OverlaySummary:
+    frame = CustomerSummary.frame
+    _first_active = CustomerSummary._first_active
+
+    def __init__(self, base):
+        self.base = base
+        self.index = base.index  # Replaced by the session's index once its ledger is forked
+        self.own = {}  # Username -> (details, current ledger row)
+
+    # Every customer: the snapshot's, then the session's new ones
+    @property
+    def usernames(self):
+        return self.base.usernames + [username for username in self.own if username not in self.base.rows]
+
+    # (details, current ledger row) of a customer as the session sees it (None if unknown)
+    def _row(self, username):
+        if username in self.own:
+            return self.own[username]
+        row = self.base.rows.get(username)
+        if row is None:
+            return None
+        return {field: values[row] for field, values in self.base.details.items()}, int(self.base.current[row])
+
+    def add(self, username, user):
+        current = self._row(username)
+        self.own[username] = (contact_details(user), -1 if current is None else current[1])
+
+    def add_many(self, items):
+        for username, user in items:
+            self.add(username, user)
+
+    # Recompute the current subscription of the customers with the given user codes
+    def _refresh(self, ledger, codes):
+        for username in {ledger.users.label(code) for code in np.atleast_1d(codes).tolist()}:
+            current = self._row(username)
+            if current is not None:
+                self.own[username] = (current[0], self._first_active(ledger, username))
+
+    def on_append(self, ledger, row):
+        self._refresh(ledger, ledger.column('user_id')[row])
+
+    def on_bulk_append(self, ledger, rows):
+        self._refresh(ledger, ledger.column('user_id')[rows])
+
+    def on_update(self, ledger, row, old):
+        if 'status' in old or 'user_id' in old:
+            self._refresh(ledger, [ledger.column('user_id')[row], old.get('user_id', ledger.column('user_id')[row])])
+
+    def on_bulk_update(self, ledger, rows, old):
+        if 'status' in old or 'user_id' in old:
+            self._refresh(ledger, np.concatenate([ledger.column('user_id')[rows], old.get('user_id', [])]).astype(np.int64))
+
+    def _lookup(self, usernames):
+        found = [(username, row) for username, row in ((username, self._row(username)) for username in usernames) if row]
+        details = {field: [row[0][field] for _, row in found] for field in self.base.details}
+        return [username for username, _ in found], details, np.array([row[1] for _, row in found], dtype=np.int64)
+
+
+# Usage series = snapshot usage + usage recorded by the session (points add up)
+class OverlayUsage:
+    def __init__(self, base, token):
+        self.base = base
+        self.own = UsageStore()  # Memory-only store for the session's points
+        self.token = token
+        self.sub_ids = set()  # Subscriptions with points in the session's store
+
+    # The snapshot's version until the session records usage, then one of its own
+    @property
+    def version(self):
+        return self.base.version if not self.own.version else (self.base.version, self.token, self.own.version)
+
+    def record_batch(self, sub_ids, hours, values, source=None, position=None):
+        self.own.record_batch(sub_ids, hours, values, source, position)
+        self.sub_ids.update(np.unique(np.asarray(sub_ids, dtype=np.int64)).tolist())
+
+    def record(self, sub_id, hours, values):
+        self.own.record(sub_id, hours, values)
+        self.sub_ids.add(int(sub_id))
+
+    def record_daily(self, sub_id, days, totals):
+        self.own.record_daily(sub_id, days, totals)
+        self.sub_ids.add(int(sub_id))
+
+    def flush(self):
+        self.own.flush()
+
+    def query(self, sub_id, tier='day', start=None, end=None):
+        series = self.base.query(sub_id, tier, start, end)
+        if int(sub_id) in self.sub_ids:
+            series = series.add(self.own.query(sub_id, tier, start, end), fill_value=0).rename('usage_gb')
+        return series
+
+    def daily(self, sub_id, days=30, end=None):
+        dense = self.base.daily(sub_id, days, end)
+        if int(sub_id) in self.sub_ids:
+            dense = dense + self.own.daily(sub_id, days, end)
+        return dense
+
+    def total(self, sub_id, start, end):
+        return float(self.query(sub_id, 'day', start, end).sum())
+
+    # Snapshot chunks, then the session's chunks
+    def iter_points(self, tier='day', chunk_size=100_000):
+        yield from self.base.iter_points(tier, chunk_size)
+        yield from self.own.iter_points(tier, chunk_size)
+
+
+# One session's view of a shared snapshot store; writes stay in the session
+# Structures are forked lazily: the catalog on the first plan change, the ledger, its indexes
+# and the revenue totals on the first subscription change, the search index on the first user change
+class OverlayStore(Store):
+    def __init__(self, base):
+        self.base = base
+        self.catalog, self.ledger, self.revenue = base.catalog, base.ledger, base.revenue
+        self.index, self.rollups = base.index, base.rollups
+        self.search, self.summary = base.search, base.summary
+        self._token = next(_tokens)
+        self.usage = OverlayUsage(base.usage, self._token)
+        self._users = {}  # Username -> users table row, for users added or edited by the session
+        self._new_users = {}  # Role -> usernames added by the session, in creation order
+        self._checkpoints = {}  # Ingestion source -> (rows, done)
+        self._price_changes = base._price_changes  # Scheduled price changes (copied on the first change)
+        self._next_id = None  # Id of the next subscription (set on the first new subscription)
+        self._changes = 0  # Writes made by the session
+
+    # The snapshot's version until the session writes, then one no other session shares
+    @property
+    def version(self):
+        return self.base.version if not self._changes else (self.base.version, self._token, self._changes)
+
+    # Number of structures and changes held by the session, e.g. for a memory readout
+    def delta_size(self):
+        ledger = self.ledger if self.ledger is not self.base.ledger else None
+        return {'users': len(self._users),
+                'patched_subscriptions': len(ledger.patches) if ledger else 0,
+                'new_subscriptions': len(ledger.tail) if ledger else 0,
+                'usage_subscriptions': len(self.usage.sub_ids)}
+
+    def _fork_revenue(self):
+        if self.revenue is self.base.revenue:
+            self.revenue = copy.deepcopy(self.base.revenue)  # Per-plan totals only
+            if self.ledger is not self.base.ledger:
+                self.ledger.add_listener(self.revenue)
+
+    def _fork_catalog(self):
+        if self.catalog is self.base.catalog:
+            self.catalog = PlanCatalog(self.base.catalog.plans())  # Plan records are shared
+            self._fork_revenue()
+
+    def _fork_ledger(self):
+        if self.ledger is self.base.ledger:
+            self._fork_revenue()
+            self._fork_summary()
+            self.ledger = OverlayLedger(self.base.ledger)
+            self.index = self.summary.index = OverlayIndex(self.base.index)
+            self.rollups = copy.deepcopy(self.base.rollups)  # A few small bucket arrays
+            self.ledger.add_listener(self.revenue)
+            self.ledger.add_listener(self.index)
+            self.ledger.add_listener(self.rollups)
+            self.ledger.add_listener(self.summary)
+            self._next_id = int(self.base.ledger.column('id')[-1]) + 1 if len(self.base.ledger) else 1
+
+    def _fork_search(self):
+        if self.search is self.base.search:
+            self.search = OverlaySearch(self.base.search)
+
+    def _fork_price_changes(self):
+        if self._price_changes is self.base._price_changes:
+            self._price_changes = dict(self.base._price_changes)
+
+    # (Always forked before the ledger, which then registers it as a listener)
+    def _fork_summary(self):
+        if self.summary is self.base.summary:
+            self.summary = OverlaySummary(self.base.summary)
+
+    # Users table row of a user (the session's edited copy, or a new copy of the snapshot's)
+    def _user_row(self, username):
+        if username in self._users:
+            return self._users[username]
+        user = self.base.get_user(username)
+        return None if user is None else self._row_from_user(username, user)
+
+    def get_user(self, username):
+        row = self._users.get(username)
+        return self._user_from_row(row) if row else self.base.get_user(username)
+
+    def add_user(self, username, user):
+        if self.get_user(username) is not None:
+            return False
+        row = self._users[username] = self._row_from_user(username, user)
+        self._new_users.setdefault(row['role'], []).append(username)
+        if row['role'] == 'customer':
+            self._fork_search()
+            self._fork_summary()
+            self.search.add(username, user)
+            self.summary.add(username, user)
+        self._changes += 1
+        return True
+
+    def update_user(self, username, **fields):
+        if 'personal_details' in fields:
+            fields.update(fields.pop('personal_details'))
+        columns = [column for column in USER_COLUMNS if column in fields]
+        row = self._user_row(username)
+        if not columns or row is None:
+            return
+        row.update({column: fields[column] for column in columns})
+        self._users[username] = row
+        if row['role'] == 'customer' and any(column in fields for column in ('name', 'email', 'phone', 'address')):
+            self._fork_search()
+            self._fork_summary()
+            self.search.add(username, self._user_from_row(row))
+            self.summary.add(username, self._user_from_row(row))
+        self._changes += 1
+
+    # Replace snapshot users the session edited by its copies
+    def _merge_users(self, users):
+        return {username: self._user_from_row(self._users[username]) if username in self._users else user
+                for username, user in users.items()}
+
+    def users_by_role(self, role):
+        users = self._merge_users(self.base.users_by_role(role))
+        users.update((username, self._user_from_row(self._users[username])) for username in self._new_users.get(role, ()))
+        return users
+
+    # Snapshot pages first (cursor ('base', snapshot cursor)), then the session's users (cursor ('own', position))
+    def users_page(self, role, cursor, limit):
+        new = self._new_users.get(role, [])
+        if cursor is None or cursor[0] == 'base':
+            users, next_cursor = self.base.users_page(role, cursor and cursor[1], limit)
+            users = self._merge_users(users)
+            if next_cursor is not None:
+                return users, ('base', next_cursor)
+            start = 0
+            limit -= len(users)
+        else:
+            users, start = {}, cursor[1]
+        users.update((username, self._user_from_row(self._users[username])) for username in new[start:start + limit])
+        return users, (('own', start + limit) if start + limit < len(new) else None)
+
+    def count_users(self, role):
+        return self.base.count_users(role) + len(self._new_users.get(role, ()))
+
+    def add_plan(self, plan):
+        if not isinstance(plan, Plan):
+            plan = Plan.from_dict(plan)
+        self._fork_catalog()
+        self.catalog.add(plan)
+        self.revenue.set_price(plan.name, plan.price_cents)
+        self._changes += 1
+
+    def delete_plan(self, name):
+        self._fork_catalog()
+        self.catalog.remove(name)
+        self.revenue.remove_plan(name)
+        self._changes += 1
+
+    def update_plan(self, name, **fields):
+        columns = [column for column in PLAN_COLUMNS if column in fields]
+        if not columns:
+            return
+        plan = Plan.from_dict(dict(self.catalog[name].to_dict(), **{column: fields[column] for column in columns}))
+        self._fork_catalog()
+        self.catalog.add(plan)
+        self.revenue.set_price(name, plan.price_cents)
+        self._changes += 1
+
+    def add_subscription(self, sub):
+        self._fork_ledger()
+        sub_id, self._next_id = self._next_id, self._next_id + 1
+        self.ledger.append(dict(sub, id=sub_id, data_used=sub.get('data_used', 0),
+                                data_limit=sub.get('data_limit', float('inf'))))
+        self._changes += 1
+        return sub_id
+
+    def update_subscription(self, sub_id, **fields):
+        columns = [column for column in SUBSCRIPTION_COLUMNS if column in fields]
+        if not columns or self.ledger.row_of(sub_id) is None:
+            return
+        self._fork_ledger()
+        self.ledger.update(self.ledger.row_of(sub_id), **{column: fields[column] for column in columns})
+        self._changes += 1
+
+    def update_subscriptions(self, sub_ids, **fields):
+        self._fork_ledger()
+        rows, _, fields = self._bulk_target(sub_ids, fields)
+        if not fields or not len(rows):
+            return 0
+        self.ledger.update_rows(rows, **fields)
+        self._changes += 1
+        return len(rows)
+
+    def add_price_change(self, plan, price, effective):
+        self._fork_price_changes()
+        self._price_changes[(plan, str(effective))] = price
+        self._changes += 1
+
+    price_changes = MemoryStore.price_changes
+
+    def remove_price_change(self, plan, effective):
+        self._fork_price_changes()
+        self._price_changes.pop((plan, str(effective)), None)
+        self._changes += 1
+
+    def expire_subscriptions(self, sub_ids, today):
+        self._fork_ledger()
+        rows, ids = self._expirable(sub_ids, today)
+        self.ledger.update_rows(rows, status='expired')
+        self._changes += 1
+        return ids
+
+    def bulk_load(self, users=None, subscriptions=None):
+        ids = np.empty(0, dtype=np.int64)
+        if users is not None and len(users):
+            rows = users.reindex(columns=list(USER_FIELDS)).astype(object)
+            for row in rows.where(rows.notna(), None).to_dict('records'):
+                self.add_user(row['username'], self._user_from_row(row))
+        if subscriptions is not None and len(subscriptions):
+            self._fork_ledger()
+            ids = np.arange(self._next_id, self._next_id + len(subscriptions), dtype=np.int64)
+            self._next_id += len(subscriptions)
+            self.ledger.extend(subscriptions.reindex(columns=list(SUBSCRIPTION_COLUMNS)).assign(id=ids))
+            self._changes += 1
+        return ids
+
+    def apply_usage(self, sub_ids, deltas, source, rows, done=False):
+        sub_ids, deltas = np.asarray(sub_ids, dtype=np.int64), np.asarray(deltas, dtype=np.float64)
+        self._fork_ledger()
+        ledger_rows, found = self.ledger.rows_of(sub_ids)
+        ledger_rows, deltas = ledger_rows[found], deltas[found]  # Skip unknown subscriptions
+        self._checkpoints[source] = (rows, bool(done))
+        if len(ledger_rows):
+            self.ledger.bulk_update(ledger_rows, data_used=self.ledger.column('data_used')[ledger_rows] + deltas)
+        self._changes += 1
+
+    def get_checkpoint(self, source):
+        return self._checkpoints.get(source) or self.base.get_checkpoint(source)
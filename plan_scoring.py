@@ -0,0 +1,132 @@
+# Plan scoring engine
+# Every plan in the catalog is a row of its feature matrix (speed, data cap, price);
+# customer needs are scored against all plans in one broadcast NumPy pass, either for
+# one customer ("Find My Plan") or for every customer at once (campaign targeting).
+#
+# Usage (batch mode):
+#   python plan_scoring.py [--db broadband.db] [--output recommendations.csv]
+import argparse  # Command-line interface
+import os  # Environment defaults
+
+import numpy as np  # Numerical computations
+import pandas as pd  # Data manipulation and analysis
+
+from usage_store import sum_by  # Vectorized group-by sum
+
+# Columns of the catalog feature matrix (PlanCatalog.features)
+SPEED, CAP, PRICE = 0, 1, 2
+
+# Monthly data (GB) and baseline speed (Mbps) per usage intensity
+INTENSITY_GB = {'Light': 100, 'Moderate': 400, 'Heavy': 1000}
+INTENSITY_MBPS = {'Light': 15, 'Moderate': 40, 'Heavy': 100}
+# Extra data and speed needed per connected device
+DEVICE_GB, DEVICE_MBPS = 50, 5
+# Extra speed (Mbps) needed by each primary activity
+ACTIVITY_MBPS = {'Browsing': 5, 'Streaming': 25, 'Gaming': 50, 'Working': 20}
+# Observed usage is padded by this factor so the recommended cap leaves headroom
+USAGE_HEADROOM = 1.2
+# Speed (Mbps) assumed per GB of monthly usage when only usage history is known
+MBPS_PER_GB = 0.1
+# Score weights: meeting the speed need, meeting the data need, staying within budget, price
+W_SPEED, W_CAP, W_BUDGET, W_PRICE = 0.4, 0.4, 1.0, 0.1
+
+
+# Speed (Mbps) and monthly data (GB) a customer needs from the plan finder answers
+# observed_gb (usage over the last month) raises the data need when it is higher than the estimate
+def customer_needs(usage, devices, activities, observed_gb=0.0):
+    speed = INTENSITY_MBPS[usage] + DEVICE_MBPS * devices + sum(ACTIVITY_MBPS[a] for a in activities)
+    gb = max(INTENSITY_GB[usage] + DEVICE_GB * devices, observed_gb * USAGE_HEADROOM)
+    return speed, gb
+
+
+# Score every plan against every customer
+# need_speed, need_gb and budget are scalars or arrays of shape (customers,);
+# returns an array of shape (customers, plans) (or (plans,) for scalars), higher is better
+def score_plans(features, need_speed, need_gb, budget):
+    need_speed = np.asarray(need_speed, dtype=np.float64)[..., None]
+    need_gb = np.asarray(need_gb, dtype=np.float64)[..., None]
+    budget = np.asarray(budget, dtype=np.float64)[..., None]
+    speed, cap, price = features[:, SPEED], features[:, CAP], features[:, PRICE]
+    # Fraction of each need the plan covers (1 = fully met); inf caps cover any need
+    speed_fit = np.minimum(speed / np.maximum(need_speed, 1e-9), 1.0)
+    cap_fit = np.minimum(cap / np.maximum(need_gb, 1e-9), 1.0)
+    # Relative amount by which the price exceeds the budget
+    over_budget = np.maximum(price - budget, 0.0) / np.maximum(budget, 1e-9)
+    # Small price term so the cheapest of equally fitting plans wins
+    relative_price = price / max(price.max(), 1e-9) if len(price) else price
+    return W_SPEED * speed_fit + W_CAP * cap_fit - W_BUDGET * over_budget - W_PRICE * relative_price
+
+
+# Best catalog plan for one customer; returns (Plan, scores per plan), or (None, empty array) with no plans
+def recommend(catalog, usage, devices, budget, activities, observed_gb=0.0):
+    if not len(catalog):
+        return None, np.empty(0)
+    need_speed, need_gb = customer_needs(usage, devices, activities, observed_gb)
+    scores = score_plans(catalog.features(), need_speed, need_gb, budget)
+    return catalog.plans()[int(np.argmax(scores))], scores
+
+
+# Usage (GB) per subscription over the last `days` days; returns (sorted sub ids, totals)
+def recent_usage(store, days=30):
+    last = np.datetime64('today', 'D')
+    sub_ids, totals = [], []
+    for chunk in store.usage.iter_points('day'):
+        recent = chunk[chunk['period'] > last - np.timedelta64(days, 'D')]
+        sub_ids.append(recent['sub_id'].to_numpy())
+        totals.append(recent['usage_gb'].to_numpy(dtype=np.float64))
+    if not sub_ids:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    return sum_by(np.concatenate(sub_ids), np.concatenate(totals))
+
+
+# Batch mode: score every active subscription against every catalog plan
+# The data need is last month's usage (with headroom), the speed need is derived from it and
+# the budget is the current price times budget_headroom; returns one row per subscription
+def score_customers(store, budget_headroom=1.25, days=30):
+    plans = store.plans()
+    ledger = store.ledger
+    active = np.flatnonzero(ledger.column('status') == ledger.statuses.find('active'))
+    sub_ids = ledger.column('id')[active]
+    # Align last month's usage with the active subscriptions (0 where nothing was recorded)
+    used_ids, used_gb = recent_usage(store, days)
+    monthly_gb = np.zeros(len(sub_ids))
+    if len(used_ids):
+        positions = np.minimum(np.searchsorted(used_ids, sub_ids), len(used_ids) - 1)
+        found = used_ids[positions] == sub_ids
+        monthly_gb[found] = used_gb[positions[found]]
+    need_gb = monthly_gb * USAGE_HEADROOM
+    budget = ledger.column('price')[active].astype(np.float64) * budget_headroom
+    scores = score_plans(store.catalog.features(), need_gb * MBPS_PER_GB, need_gb, budget)
+    best = scores.argmax(axis=1) if plans else np.zeros(len(active), dtype=np.int64)
+    names = np.array([plan.name for plan in plans] or [None], dtype=object)
+    current = np.array(ledger.plans.labels, dtype=object)[ledger.column('plan')[active]]
+    return pd.DataFrame({
+        'user_id': np.array(ledger.users.labels, dtype=object)[ledger.column('user_id')[active]],
+        'sub_id': sub_ids,
+        'plan': current,
+        'monthly_gb': monthly_gb,
+        'recommended': names[best],
+        'score': scores[np.arange(len(active)), best] if plans else np.nan,
+        'change': names[best] != current,
+    })
+
+
+# Command-line entry point (batch mode)
+def main():
+    from storage import SQLiteStore  # Imported here so the module can be used without a database
+
+    parser = argparse.ArgumentParser(description="Score every active subscription against the plan catalog")
+    parser.add_argument('--db', default=os.environ.get('BROADBAND_DB', 'broadband.db'), help="SQLite database file")
+    parser.add_argument('--output', default='recommendations.csv', help="CSV file for the recommendations")
+    parser.add_argument('--changes-only', action='store_true', help="Only write subscriptions whose best plan differs")
+    args = parser.parse_args()
+
+    recommendations = score_customers(SQLiteStore(args.db))
+    if args.changes_only:
+        recommendations = recommendations[recommendations['change']]
+    recommendations.to_csv(args.output, index=False)
+    print(f"{len(recommendations)} recommendations written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
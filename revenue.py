@@ -0,0 +1,89 @@
+# Incremental revenue aggregation
+# Keeps the number of active subscriptions per plan and the revenue they bring in,
+# updated in O(1) as subscriptions and plan prices change.
+import numpy as np  # Numerical computations
+
+
+# Running per-plan active counts and revenue totals
+# Revenue for a plan is (active subscriptions on the plan) x (current catalog price);
+# plans no longer in the catalog count towards the subscription totals but earn nothing.
+class RevenueAggregator:
+    def __init__(self, catalog):
+        self.prices = {}  # Catalog plan name -> price in cents (insertion order = catalog order)
+        self.active = {}  # Plan name -> number of active subscriptions
+        self.total = 0  # Total revenue in cents across catalog plans
+        for plan in catalog:
+            self.prices[plan.name] = plan.price_cents
+
+    # Adjust the active count of a plan by delta and keep the total in step
+    def _add(self, plan_name, delta):
+        self.active[plan_name] = self.active.get(plan_name, 0) + delta
+        self.total += delta * self.prices.get(plan_name, 0)
+
+    # Ledger listener: a new subscription was appended
+    def on_append(self, ledger, row):
+        if ledger.column('status')[row] == ledger.statuses.find('active'):
+            self._add(ledger.plans.labels[ledger.column('plan')[row]], 1)
+
+    # Ledger listener: many subscriptions were appended at once
+    def on_bulk_append(self, ledger, rows):
+        active = ledger.column('status')[rows] == ledger.statuses.find('active')
+        counts = np.bincount(ledger.column('plan')[rows][active], minlength=len(ledger.plans))
+        for name, count in zip(ledger.plans.labels, counts):
+            if count:
+                self._add(name, int(count))
+
+    # Ledger listener: plan and/or status of a subscription may have changed
+    def on_update(self, ledger, row, old):
+        if 'plan' not in old and 'status' not in old:
+            return
+        active = ledger.statuses.find('active')
+        plan_codes, status_codes = ledger.column('plan'), ledger.column('status')
+        # Take the old (plan, status) pair out and put the new one in
+        if old.get('status', status_codes[row]) == active:
+            self._add(ledger.plans.labels[old.get('plan', plan_codes[row])], -1)
+        if status_codes[row] == active:
+            self._add(ledger.plans.labels[plan_codes[row]], 1)
+
+    # Ledger listener: many rows changed at once; recount if plans or statuses moved
+    def on_bulk_update(self, ledger, rows, old):
+        if 'plan' in old or 'status' in old:
+            self.rebuild(ledger)
+
+    # Add a plan to the catalog or change its price (in cents)
+    def set_price(self, plan_name, cents):
+        self.total += self.active.get(plan_name, 0) * (cents - self.prices.get(plan_name, 0))
+        self.prices[plan_name] = cents
+
+    # Remove a plan from the catalog (its subscriptions stop earning revenue)
+    def remove_plan(self, plan_name):
+        self.total -= self.active.get(plan_name, 0) * self.prices.pop(plan_name, 0)
+
+    # Revenue per catalog plan plus 'Total', in dollars
+    def revenue_data(self):
+        revenue_data = {name: self.active.get(name, 0) * cents / 100 for name, cents in self.prices.items()}
+        revenue_data['Total'] = self.total / 100
+        return revenue_data
+
+    # Count active subscriptions per plan straight from the ledger columns
+    @staticmethod
+    def _scan(ledger):
+        active = ledger.column('status') == ledger.statuses.find('active')
+        counts = np.bincount(ledger.column('plan')[active], minlength=len(ledger.plans))
+        return {name: int(count) for name, count in zip(ledger.plans.labels, counts) if count}
+
+    # Recompute every running total from the ledger (full rebuild)
+    def rebuild(self, ledger):
+        self.active = self._scan(ledger)
+        self.total = sum(self.active.get(name, 0) * cents for name, cents in self.prices.items())
+
+    # Compare the running totals with a full scan; returns {plan: (running, scanned)} for mismatches
+    def verify(self, ledger):
+        scanned = self._scan(ledger)
+        mismatches = {name: (self.active.get(name, 0), scanned.get(name, 0))
+                      for name in set(self.active) | set(scanned)
+                      if self.active.get(name, 0) != scanned.get(name, 0)}
+        expected_total = sum(scanned.get(name, 0) * cents for name, cents in self.prices.items())
+        if expected_total != self.total:
+            mismatches['Total'] = (self.total, expected_total)
+        return mismatches
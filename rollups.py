@@ -0,0 +1,176 @@
+# Time-bucketed subscription rollups
+# Per day, week (starting Monday) and month: subscriptions started, cancelled, expired,
+# upgraded and renewed, and the net change in monthly revenue (cents). Kept in sync with
+# the ledger (registered as a listener), so each mutation adds to one bucket per tier in
+# O(1); the initial back-fill is one vectorized pass over the start dates. Time-series
+# charts read buckets instead of scanning every subscription.
+#
+# New subscriptions are bucketed by their start date and can be back-filled from the
+# ledger. The ledger keeps no history of status, plan or end-date changes, so those are
+# counted from the moment the rollups are attached, on the day they happen.
+import numpy as np  # Numerical computations
+import pandas as pd  # Data manipulation and analysis
+
+from lifecycle import day_number  # Day numbers of dates
+
+# Bucket tiers
+TIERS = ('day', 'week', 'month')
+# Rolled-up measures; 'upgraded' counts plan changes and 'revenue' is net new monthly revenue in cents
+# (prices of new subscriptions, plus price changes of active ones, minus the prices of those that stop being active)
+METRICS = ('new', 'cancelled', 'expired', 'upgraded', 'renewed', 'revenue')
+# Status changes counted as their own metric
+STATUS_METRICS = ('cancelled', 'expired')
+
+
+# Convert day numbers (days since 1970-01-01) to period numbers of a tier
+def to_periods(days, tier):
+    days = np.asarray(days, dtype=np.int64)
+    if tier == 'day':
+        return days
+    if tier == 'week':
+        return (days + 3) // 7  # 1970-01-01 was a Thursday; weeks start on Monday
+    if days.size < 2 * 366:
+        return days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    # Calendar months of the day range, looked up: far faster than converting every day
+    low = days.min()
+    months = np.arange(low, days.max() + 1).astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    return months[days - low]
+
+
+# First day (datetime64[D]) of each period number of a tier
+def period_starts(periods, tier):
+    periods = np.asarray(periods, dtype=np.int64)
+    if tier == 'day':
+        return periods.astype('datetime64[D]')
+    if tier == 'week':
+        return (periods * 7 - 3).astype('datetime64[D]')
+    return periods.astype('datetime64[M]').astype('datetime64[D]')
+
+
+# Integer cents of float prices
+def _cents(prices):
+    return np.round(np.asarray(prices, dtype=np.float64) * 100).astype(np.int64)
+
+
+# Buckets of one tier: a (period x metric) array of totals covering a growable range of periods
+class _Buckets:
+    def __init__(self):
+        self.origin = 0  # Period number of the first row
+        self.values = np.zeros((0, len(METRICS)), dtype=np.int64)
+
+    # Make room for periods first..last (doubling the range, so growth is amortised O(1))
+    def _cover(self, first, last):
+        if not len(self.values):
+            self.origin, self.values = first, np.zeros((last - first + 1, len(METRICS)), dtype=np.int64)
+            return
+        end = self.origin + len(self.values)
+        if first >= self.origin and last < end:
+            return
+        span = len(self.values)
+        new_origin = min(first, self.origin - span) if first < self.origin else self.origin
+        new_end = max(last + 1, end + span) if last >= end else end
+        grown = np.zeros((new_end - new_origin, len(METRICS)), dtype=np.int64)
+        grown[self.origin - new_origin:self.origin - new_origin + span] = self.values
+        self.origin, self.values = new_origin, grown
+
+    # Add amounts of one metric to the buckets of the given periods
+    def add(self, periods, metric, amounts):
+        periods = np.atleast_1d(np.asarray(periods, dtype=np.int64))
+        if not len(periods):
+            return
+        self._cover(int(periods.min()), int(periods.max()))
+        amounts = np.broadcast_to(np.asarray(amounts, dtype=np.int64), periods.shape)
+        np.add.at(self.values[:, METRICS.index(metric)], periods - self.origin, amounts)
+
+    # Totals of periods first..last (inclusive) as a (period x metric) array, zeros outside the range held
+    def read(self, first, last):
+        out = np.zeros((max(last - first + 1, 0), len(METRICS)), dtype=np.int64)
+        low, high = max(first, self.origin), min(last, self.origin + len(self.values) - 1)
+        if low <= high:
+            out[low - first:high - first + 1] = self.values[low - self.origin:high - self.origin + 1]
+        return out
+
+
+# Day/week/month rollups kept in sync with a SubscriptionLedger (registered as a listener)
+class SubscriptionRollups:
+    def __init__(self):
+        self.tiers = {tier: _Buckets() for tier in TIERS}
+
+    # Add amounts of a metric on the given days (day numbers) to every tier
+    def _add(self, days, metric, amounts):
+        for tier, buckets in self.tiers.items():
+            buckets.add(to_periods(days, tier), metric, amounts)
+
+    # Count new subscriptions (and the revenue they book) on their start dates
+    def _started(self, ledger, rows):
+        days = ledger.column('start_date')[rows].astype(np.int64)
+        cents = _cents(ledger.column('price')[rows])
+        for tier, buckets in self.tiers.items():
+            periods = to_periods(days, tier)
+            buckets.add(periods, 'new', 1)
+            buckets.add(periods, 'revenue', cents)
+
+    # Count status, plan, end-date and price changes of rows (today); old maps column -> previous values
+    # (scalars for one row, arrays for many)
+    def _changed(self, ledger, rows, old):
+        rows = np.atleast_1d(rows)
+        today = day_number()
+        statuses = ledger.column('status')[rows]
+        old_statuses = np.atleast_1d(old.get('status', statuses))
+        for metric in STATUS_METRICS:
+            code = ledger.statuses.find(metric)
+            count = int(((statuses == code) & (old_statuses != code)).sum())
+            if count:
+                self._add(today, metric, count)
+        if 'plan' in old:
+            count = int((ledger.column('plan')[rows] != np.atleast_1d(old['plan'])).sum())
+            if count:
+                self._add(today, 'upgraded', count)
+        active = ledger.statuses.find('active')
+        if 'end_date' in old:
+            extended = (ledger.column('end_date')[rows] > np.atleast_1d(old['end_date'])) & (statuses == active)
+            if extended.any():
+                self._add(today, 'renewed', int(extended.sum()))
+        if 'status' in old or 'price' in old:
+            # Revenue the rows brought in before and after the change
+            before = np.where(old_statuses == active, _cents(np.atleast_1d(old.get('price', ledger.column('price')[rows]))), 0)
+            after = np.where(statuses == active, _cents(ledger.column('price')[rows]), 0)
+            change = int((after - before).sum())
+            if change:
+                self._add(today, 'revenue', change)
+
+    # Ledger listener: a new subscription was appended
+    def on_append(self, ledger, row):
+        self._started(ledger, np.array([row]))
+
+    # Ledger listener: many subscriptions were appended at once
+    def on_bulk_append(self, ledger, rows):
+        self._started(ledger, rows)
+
+    # Ledger listener: fields of a subscription changed
+    def on_update(self, ledger, row, old):
+        self._changed(ledger, row, old)
+
+    # Ledger listener: many subscriptions changed at once
+    def on_bulk_update(self, ledger, rows, old):
+        self._changed(ledger, rows, old)
+
+    # Back-fill new subscriptions and booked revenue from the ledger in one pass (clears every bucket)
+    def rebuild(self, ledger):
+        self.tiers = {tier: _Buckets() for tier in TIERS}
+        self._started(ledger, np.arange(len(ledger)))
+
+    # Totals per period for start..end (dates or 'YYYY-MM-DD' strings, inclusive; default the last 30 periods)
+    # as a DataFrame with one column per metric ('revenue' in dollars), indexed by the periods' first days
+    def frame(self, tier='day', start=None, end=None):
+        last = to_periods(day_number(end), tier).item()
+        first = last - 29 if start is None else to_periods(day_number(start), tier).item()
+        values = self.tiers[tier].read(first, last)
+        frame = pd.DataFrame(values, columns=list(METRICS),
+                             index=pd.Index(period_starts(np.arange(first, last + 1), tier), name=tier))
+        frame['revenue'] = frame['revenue'] / 100
+        return frame
+
+    # One metric per period for start..end (see frame)
+    def series(self, metric, tier='day', start=None, end=None):
+        return self.frame(tier, start, end)[metric]
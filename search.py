@@ -0,0 +1,134 @@
+# Customer search engine
+# N-gram indexes (trigrams, and bigrams for 1-2 character queries) over username,
+# name, email, phone and address, updated incrementally as customers change.
+import re  # Tokenising field values
+
+# Searchable fields and their ranking weights
+FIELDS = {'username': 3, 'name': 3, 'email': 2, 'phone': 1, 'address': 1}
+# Score for how a query matches a field value (multiplied by the field weight)
+EXACT, FIELD_PREFIX, TOKEN_PREFIX, SUBSTRING = 8, 4, 2, 1
+# Hard cap on the number of ranked matches returned for one query
+MAX_RESULTS = 1000
+
+
+# Split a lowercase string into alphanumeric tokens
+def tokenize(text):
+    return re.findall(r'[a-z0-9]+', text)
+
+
+# Set of overlapping 3-character substrings of a string
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+# Set of overlapping 2-character substrings of a string (the string itself if it has one character)
+def bigrams(text):
+    if len(text) < 2:
+        return {text} if text else set()
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+# Sort key of a (score, username) match: best score first, then alphabetical
+def rank_key(match):
+    return -match[0], match[1]
+
+
+# Incrementally maintained search index over customer records
+class CustomerSearchIndex:
+    def __init__(self):
+        self.documents = {}  # Username -> {field: lowercase value}
+        self.grams = {}  # Trigram -> set of usernames
+        self.pairs = {}  # Bigram -> set of usernames (for queries too short for trigrams)
+
+    # Lowercase searchable field values of a user dict
+    @staticmethod
+    def _fields(username, user):
+        details = user.get('personal_details', {})
+        values = {'username': username, 'name': user.get('name', '')}
+        values.update({field: details.get(field) or '' for field in ('email', 'phone', 'address')})
+        return {field: str(value).lower() for field, value in values.items()}
+
+    # Add or replace a customer in the index
+    def add(self, username, user):
+        self.add_many([(username, user)])
+
+    # Add or replace many (username, user) pairs
+    def add_many(self, items):
+        for username, user in items:
+            self.remove(username)
+            document = self._fields(username, user)
+            self.documents[username] = document
+            for value in document.values():
+                for gram in trigrams(value):
+                    self.grams.setdefault(gram, set()).add(username)
+                for pair in bigrams(value):
+                    self.pairs.setdefault(pair, set()).add(username)
+
+    # Drop a customer from the index (no-op if absent); postings left empty are deleted
+    def remove(self, username):
+        document = self.documents.pop(username, None)
+        if document is None:
+            return
+        values = document.values()
+        for postings, keys in ((self.grams, set().union(*map(trigrams, values))),
+                               (self.pairs, set().union(*map(bigrams, values)))):
+            for key in keys:
+                postings[key].discard(username)
+                if not postings[key]:
+                    del postings[key]
+
+    # Rebuild the index from a {username: user} mapping
+    def rebuild(self, users):
+        self.documents, self.grams, self.pairs = {}, {}, {}
+        self.add_many(users.items())
+
+    # Candidate usernames for a query (superset of the real matches)
+    def _candidates(self, query):
+        if len(query) == 2:
+            # Too short for trigrams: every value containing the query has it as a bigram
+            return set(self.pairs.get(query, ()))
+        if len(query) == 1:
+            # Values containing the character have a bigram containing it (or are that character)
+            return set().union(*(postings for pair, postings in self.pairs.items() if query in pair))
+        postings = sorted((self.grams.get(gram, set()) for gram in trigrams(query)), key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates &= posting
+            if not candidates:
+                break
+        return candidates
+
+    # Relevance of a document for a query (0 = no match)
+    @staticmethod
+    def _score(document, query):
+        score = 0
+        for field, weight in FIELDS.items():
+            value = document[field]
+            if value == query:
+                score += EXACT * weight
+            elif value.startswith(query):
+                score += FIELD_PREFIX * weight
+            elif any(token.startswith(query) for token in tokenize(value)):
+                score += TOKEN_PREFIX * weight
+            elif query in value:
+                score += SUBSTRING * weight
+        return score
+
+    # Every match as (score, username), best score first, then alphabetical
+    def scored(self, query):
+        query = query.strip().lower()
+        if not query:
+            return []
+        scored = [(score, username) for username in self._candidates(query)
+                  if (score := self._score(self.documents[username], query))]
+        scored.sort(key=rank_key)
+        return scored
+
+    # All matching usernames, best match first (at most MAX_RESULTS)
+    def rank(self, query):
+        return [username for _, username in self.scored(query)[:MAX_RESULTS]]
+
+    # Ranked search; returns (number of matches, usernames on the requested page)
+    def search(self, query, limit=50, offset=0):
+        ranked = self.rank(query)
+        return len(ranked), ranked[offset:offset + limit]
@@ -0,0 +1,247 @@
+# Memory-mappable binary snapshots of a MemoryStore
+# A snapshot is a directory of .npy files: the subscription ledger columns, the labels of its
+# categorical columns and the users table as fixed-width string columns, with meta.json
+# holding the plans, scheduled price changes, ingestion checkpoints and the journal sequence
+# number the snapshot covers. Loading maps the arrays copy-on-write (mmap_mode='c'), so they
+# are used in place instead of being read and parsed: pages come from disk when first
+# touched and are copied only when written. Nothing is rebuilt row by row on load: labels and
+# usernames are found by binary search over arrays stored sorted, revenue totals and rollups
+# are vectorized passes, and the indexes, customer search and summary are built on first use.
+# The journal events after the snapshot (the log tail) are then replayed (see journal.py).
+#
+# A snapshot is written to a temporary directory that is renamed into place once complete, so
+# the newest complete snapshot is always readable. Usage series need no copy: they already
+# live as .npy segments opened memory-mapped (see usage_store.py) and are flushed.
+import glob  # Finding snapshots
+import json  # meta.json
+import logging  # Reporting failed snapshots
+import os  # Paths, fsync and renames
+import shutil  # Removing old snapshots
+import threading  # Periodic snapshots
+
+import numpy as np  # Numerical computations
+
+from catalog import Plan, PlanCatalog  # Plans of a loaded snapshot
+from ledger import Categories, SubscriptionLedger  # Ledger over the mapped columns
+from storage import DEFERRABLE, USER_FIELDS, MemoryStore  # Store that is snapshotted
+
+logger = logging.getLogger(__name__)
+
+# Snapshot layout version, checked on load
+FORMAT = 1
+# Snapshot directories are named PREFIX + the journal sequence number they cover
+PREFIX = 'snapshot-'
+# Complete snapshots kept; the journal keeps the events after the oldest of them
+KEEP = 2
+# User fields that may be missing (stored as empty strings plus a mask of the missing ones)
+OPTIONAL_FIELDS = ('email', 'phone', 'address')
+
+
+# Users table of a loaded snapshot, used as a MemoryStore's {username: row} dict: the snapshot's
+# rows are read from the mapped columns on demand and rows added or replaced since are kept in a dict
+class SnapshotUsers:
+    def __init__(self, columns, missing, keys, order, changed=None):
+        self.columns = columns  # Field -> strings per user in creation order
+        self.missing = missing  # Optional field -> True where the value is missing
+        self.keys, self.order = keys, order  # Sorted usernames and their positions in the columns
+        self.changed = changed or {}  # Username -> row added or replaced since the snapshot
+
+    # Position of a snapshot user in the columns (None if not in the snapshot)
+    def _position(self, username):
+        position = np.searchsorted(self.keys, username)
+        if position < len(self.keys) and self.keys[position] == username:
+            return int(self.order[position])
+        return None
+
+    # Row of the snapshot user at a position
+    def _row(self, position):
+        row = {field: str(self.columns[field][position]) for field in USER_FIELDS}
+        row.update({field: None for field in OPTIONAL_FIELDS if self.missing[field][position]})
+        return row
+
+    def get(self, username, default=None):
+        row = self.changed.get(username)
+        if row is None:
+            position = self._position(username)
+            row = default if position is None else self._row(position)
+        return row
+
+    def __getitem__(self, username):
+        row = self.get(username)
+        if row is None:
+            raise KeyError(username)
+        return row
+
+    def __contains__(self, username):
+        return username in self.changed or self._position(username) is not None
+
+    def __setitem__(self, username, row):
+        self.changed[username] = row
+
+    # Copy sharing the mapped columns (what a snapshot captures under the write lock)
+    def copy(self):
+        return SnapshotUsers(self.columns, self.missing, self.keys, self.order, dict(self.changed))
+
+    # Field -> values of every user in creation order: the snapshot's users (replaced rows patched in),
+    # then the users added since
+    def to_columns(self):
+        columns = {field: self.columns[field].astype(object) for field in USER_FIELDS}
+        for field in OPTIONAL_FIELDS:
+            columns[field][self.missing[field]] = None
+        added = []
+        for username, row in self.changed.items():
+            position = self._position(username)
+            if position is None:
+                added.append(row)
+            else:
+                for field in USER_FIELDS:
+                    columns[field][position] = row[field]
+        return {field: list(values) + [row[field] for row in added] for field, values in columns.items()}
+
+
+# Fixed-width string array of values (None = '')
+def _strings(values):
+    return np.array(['' if value is None else value for value in values], dtype=str)
+
+
+# Write an array as an .npy file and force it to disk
+def _save(directory, name, array):
+    with open(os.path.join(directory, f'{name}.npy'), 'wb') as file:
+        np.save(file, array)
+        file.flush()
+        os.fsync(file.fileno())
+
+
+# Read an .npy file of a snapshot, mapped copy-on-write
+def _load(directory, name):
+    return np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='c')
+
+
+# Snapshot directories in `directory`, oldest first (incomplete ones are skipped)
+def snapshots(directory):
+    return sorted(path for path in glob.glob(os.path.join(directory, f'{PREFIX}*')) if not path.endswith('.tmp'))
+
+
+# Newest complete snapshot in `directory` (None if there is none)
+def latest(directory):
+    found = snapshots(directory)
+    return found[-1] if found else None
+
+
+# Journal sequence number a snapshot covers (from its directory name)
+def sequence(path):
+    return int(os.path.basename(path)[len(PREFIX):])
+
+
+# Field -> values of every user in creation order, from a MemoryStore's users table
+def _user_columns(users):
+    if isinstance(users, SnapshotUsers):
+        return users.to_columns()
+    return {field: [row[field] for row in users.values()] for field in USER_FIELDS}
+
+
+# Copy of everything a snapshot holds, taken under the store's write lock so it matches one journal position
+def _capture(store):
+    ledger = store.ledger
+    with store._write_lock:
+        return {
+            'seq': store.journal.appended if store.journal is not None else 0,
+            'ledger': {name: ledger.column(name).copy() for name in ledger.DTYPES},
+            'labels': {column: list(ledger.categories(column).labels) for column in ledger.CATEGORICAL},
+            'users': store._users.copy(),  # Rows are replaced, never changed in place, so a shallow copy is enough
+            'meta': {
+                'format': FORMAT,
+                'next_id': store._next_id,
+                'rows': len(ledger),
+                'plans': [plan.to_dict() for plan in store.plans()],
+                'price_changes': store.price_changes(),
+                'checkpoints': {source: list(checkpoint) for source, checkpoint in store._checkpoints.items()},
+            },
+        }
+
+
+# Write a snapshot of a MemoryStore into `directory` and return its path; older snapshots beyond the
+# newest `keep` are removed and the store's journal drops the events every kept snapshot covers
+def write(store, directory, keep=KEEP):
+    state = _capture(store)
+    store.usage.flush()
+    path = os.path.join(directory, f"{PREFIX}{state['seq']:012d}")
+    if os.path.exists(path):
+        return path  # Nothing was written since
+    temporary = path + '.tmp'
+    shutil.rmtree(temporary, ignore_errors=True)
+    os.makedirs(temporary)
+    for name, values in state['ledger'].items():
+        _save(temporary, f'ledger-{name}', values)
+    for column, labels in state['labels'].items():
+        labels = _strings(labels)
+        _save(temporary, f'labels-{column}', labels)
+        _save(temporary, f'labels-{column}-order', np.argsort(labels, kind='stable'))
+    columns = _user_columns(state['users'])
+    users = {field: _strings(values) for field, values in columns.items()}
+    for field, values in users.items():
+        _save(temporary, f'users-{field}', values)
+    for field in OPTIONAL_FIELDS:
+        _save(temporary, f'users-{field}-missing', np.array([value is None for value in columns[field]], dtype=bool))
+    order = np.argsort(users['username'], kind='stable')
+    _save(temporary, 'users-keys', users['username'][order])
+    _save(temporary, 'users-order', order)
+    roles = list(dict.fromkeys(users['role'].tolist()))  # In order of first appearance
+    with open(os.path.join(temporary, 'meta.json'), 'w') as file:
+        json.dump(dict(state['meta'], seq=state['seq'], roles=roles), file)
+    os.replace(temporary, path)  # Atomic: the snapshot appears complete or not at all
+    kept = snapshots(directory)
+    for old in kept[:-keep]:
+        shutil.rmtree(old, ignore_errors=True)
+    if store.journal is not None:
+        store.journal.compact(sequence(kept[-keep:][0]))
+    return path
+
+
+# Load a snapshot into a new MemoryStore (usage series kept in `usage_dir`); returns (store, journal
+# sequence number the snapshot covers). derived=False leaves the derived structures to the caller
+# (a journal replay attaches them once it is done)
+def load(path, usage_dir=None, derived=True):
+    with open(os.path.join(path, 'meta.json')) as file:
+        meta = json.load(file)
+    if meta['format'] != FORMAT:
+        raise ValueError(f"Snapshot {path} has format {meta['format']}, expected {FORMAT}")
+    categories = {column: Categories.from_array(_load(path, f'labels-{column}'), _load(path, f'labels-{column}-order'))
+                  for column in SubscriptionLedger.CATEGORICAL}
+    store = MemoryStore(usage_dir=usage_dir)
+    store.ledger = SubscriptionLedger.from_columns(
+        {name: _load(path, f'ledger-{name}') for name in SubscriptionLedger.DTYPES}, categories)
+    store.catalog = PlanCatalog([Plan.from_dict(plan) for plan in meta['plans']])
+    columns = {field: _load(path, f'users-{field}') for field in USER_FIELDS}
+    missing = {field: _load(path, f'users-{field}-missing') for field in OPTIONAL_FIELDS}
+    store._users = SnapshotUsers(columns, missing, _load(path, 'users-keys'), _load(path, 'users-order'))
+    store._roles = {role: columns['username'][columns['role'] == role].tolist() for role in meta['roles']}
+    store._price_changes = {(change['plan'], change['effective']): change['price'] for change in meta['price_changes']}
+    store._checkpoints = {source: (rows, bool(done)) for source, (rows, done) in meta['checkpoints'].items()}
+    store._next_id = meta['next_id']
+    if derived:
+        store._attach_derived(defer=DEFERRABLE)
+    return store, meta['seq']
+
+
+# Background thread that snapshots a journaled store periodically (when something was written since)
+class SnapshotWorker(threading.Thread):
+    def __init__(self, store, directory, interval=600):
+        super().__init__(name='store-snapshots', daemon=True)
+        self.store = store
+        self.directory = directory
+        self.interval = interval  # Seconds between checks
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                newest = latest(self.directory)
+                if newest is None or sequence(newest) < self.store.journal.appended:
+                    write(self.store, self.directory)
+            except Exception:  # Keep going; the journal still holds every event
+                logger.exception("Snapshot failed")
+
+    # Ask the worker to finish after the current snapshot
+    def stop(self):
+        self.stopped.set()
@@ -0,0 +1,810 @@
+# Storage layer for users, plans and subscriptions
+# The app talks to a Store; SQLiteStore is the process-wide backend shared by every session.
+import logging  # Reporting catalog rows that cannot be loaded
+import queue  # Pool of idle database connections
+import sqlite3  # Embedded database engine
+import threading  # Locks for the shared store
+from contextlib import contextmanager  # Context manager helper for pooled connections
+
+import numpy as np  # Numerical computations
+import pandas as pd  # Bulk loading of the subscriptions table
+
+from auth import cost_from_env, hash_password  # Salted password hashes for the demo users
+from catalog import SAMPLE_PLANS, Plan, PlanCatalog  # Typed plan records with lookup by name
+import datagen  # Seeded sample subscriptions
+from ledger import SubscriptionLedger  # Columnar in-memory view of the subscriptions table
+from revenue import RevenueAggregator  # Running revenue totals
+from rollups import SubscriptionRollups  # Day/week/month activity buckets
+from indexes import SubscriptionIndex  # Secondary indexes on status, plan, user and end date
+from search import CustomerSearchIndex  # Ranked customer search
+from summary import CustomerSummary  # Per-customer table rows for Customer Management
+from usage_store import UsageStore  # Per-subscription usage time series
+
+logger = logging.getLogger(__name__)
+
+# SQL statements are module-level constants so every pooled connection reuses
+# the same prepared statement from its statement cache
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL,
+    role TEXT NOT NULL,
+    name TEXT NOT NULL,
+    email TEXT,
+    phone TEXT,
+    address TEXT
+);
+CREATE TABLE IF NOT EXISTS plans (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE,
+    speed TEXT NOT NULL,
+    price REAL NOT NULL,
+    data_cap TEXT NOT NULL,
+    description TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS subscriptions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    plan TEXT NOT NULL,
+    status TEXT NOT NULL,
+    start_date TEXT NOT NULL,
+    end_date TEXT NOT NULL,
+    price REAL NOT NULL,
+    data_used REAL NOT NULL DEFAULT 0,
+    data_limit REAL
+);
+CREATE INDEX IF NOT EXISTS subscriptions_user ON subscriptions (user_id);
+CREATE TABLE IF NOT EXISTS price_changes (
+    plan TEXT NOT NULL,
+    price REAL NOT NULL,
+    effective TEXT NOT NULL,
+    PRIMARY KEY (plan, effective)
+);
+CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+    source TEXT PRIMARY KEY,
+    rows INTEGER NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0
+);
+"""
+SELECT_USER = "SELECT username, password, role, name, email, phone, address FROM users WHERE username = ?"
+SELECT_USERS_BY_ROLE = "SELECT username, password, role, name, email, phone, address FROM users WHERE role = ? ORDER BY rowid"
+SELECT_USERS_PAGE = "SELECT rowid, username, password, role, name, email, phone, address FROM users WHERE role = ? AND rowid > ? ORDER BY rowid LIMIT ?"
+COUNT_USERS_BY_ROLE = "SELECT COUNT(*) FROM users WHERE role = ?"
+INSERT_USER = "INSERT OR IGNORE INTO users (username, password, role, name, email, phone, address) VALUES (?, ?, ?, ?, ?, ?, ?)"
+SELECT_PLANS = "SELECT name, speed, price, data_cap, description FROM plans ORDER BY id"
+INSERT_PLAN = "INSERT INTO plans (name, speed, price, data_cap, description) VALUES (?, ?, ?, ?, ?)"
+DELETE_PLAN = "DELETE FROM plans WHERE name = ?"
+SELECT_SUBSCRIPTIONS = "SELECT id, user_id, plan, status, start_date, end_date, price, data_used, data_limit FROM subscriptions ORDER BY id"
+ADD_DATA_USED = "UPDATE subscriptions SET data_used = data_used + ? WHERE id = ?"
+EXPIRE_SUBSCRIPTION = "UPDATE subscriptions SET status = 'expired' WHERE id = ?"
+SELECT_CHECKPOINT = "SELECT rows, done FROM ingest_checkpoints WHERE source = ?"
+UPSERT_CHECKPOINT = "INSERT INTO ingest_checkpoints (source, rows, done) VALUES (?, ?, ?) ON CONFLICT (source) DO UPDATE SET rows = excluded.rows, done = excluded.done"
+INSERT_SUBSCRIPTION = "INSERT INTO subscriptions (user_id, plan, status, start_date, end_date, price, data_used, data_limit) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+INSERT_SUBSCRIPTION_WITH_ID = "INSERT INTO subscriptions (id, user_id, plan, status, start_date, end_date, price, data_used, data_limit) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+MAX_SUBSCRIPTION_ID = "SELECT COALESCE(MAX(id), 0) FROM subscriptions"
+SELECT_PRICE_CHANGES = "SELECT plan, price, effective FROM price_changes ORDER BY effective, plan"
+UPSERT_PRICE_CHANGE = "INSERT OR REPLACE INTO price_changes (plan, price, effective) VALUES (?, ?, ?)"
+DELETE_PRICE_CHANGE = "DELETE FROM price_changes WHERE plan = ? AND effective = ?"
+
+# Columns that may be changed on existing rows (guards the dynamic UPDATE statements)
+USER_COLUMNS = ('password', 'role', 'name', 'email', 'phone', 'address')
+PLAN_COLUMNS = ('speed', 'price', 'data_cap', 'description')
+SUBSCRIPTION_COLUMNS = ('user_id', 'plan', 'status', 'start_date', 'end_date', 'price', 'data_used', 'data_limit')
+# Columns of the users table in INSERT_USER order (bulk loads)
+USER_FIELDS = ('username', 'password', 'role', 'name', 'email', 'phone', 'address')
+
+
+# Derived structures a store can build on first use instead of up front (the costly ones)
+DEFERRABLE = ('index', 'search', 'summary')
+
+
+# Store attribute holding a derived structure that a store may build on first use instead of up front
+# (see Store._attach_derived); reading it while it is pending builds it from the current data
+class _Derived:
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, store, owner=None):
+        if store is None:
+            return self
+        value = store.__dict__.get(self.name)
+        if value is None and self.name in store._pending:
+            value = store._build(self.name)
+        return value
+
+    def __set__(self, store, value):
+        store.__dict__[self.name] = value
+
+
+# Interface every storage backend implements
+# Backends also keep `catalog`, the PlanCatalog mirroring the plans table,
+# and `ledger`, a SubscriptionLedger mirroring every subscription,
+# plus `revenue` (RevenueAggregator), `index` (SubscriptionIndex) and `rollups` (SubscriptionRollups) listening to it,
+# and `search`, a CustomerSearchIndex over customer records, and `summary`, a CustomerSummary
+# of every customer (it listens to the ledger too); `usage` is the UsageStore
+class Store:
+    version = 0  # Bumped on every committed mutation (used to invalidate cached views)
+    catalog = None
+    ledger = None
+    revenue = None
+    index = _Derived()
+    rollups = None
+    search = _Derived()
+    summary = _Derived()
+    usage = None
+    skipped_plans = ()  # (name, error) of plan rows that could not be loaded into the catalog
+    _pending = frozenset()  # Derived structures not built yet (built on first use)
+
+    # Build the structures derived from the ledger (call once the ledger is loaded)
+    # Those named in `defer` (from DEFERRABLE) are built on first use instead, from the data as it is
+    # then; until they are, writes do not maintain them
+    def _attach_derived(self, defer=()):
+        self.revenue = RevenueAggregator(self.catalog)
+        self.revenue.rebuild(self.ledger)
+        self.ledger.add_listener(self.revenue)
+        self.rollups = SubscriptionRollups()
+        self.rollups.rebuild(self.ledger)
+        self.ledger.add_listener(self.rollups)
+        self._pending = set(defer)
+        for name in DEFERRABLE:
+            self.__dict__.pop(name, None)
+            if name not in defer:
+                self.__dict__[name] = getattr(self, f'_build_{name}')()
+
+    # Subscription index over the ledger, kept in sync with it
+    def _build_index(self):
+        index = SubscriptionIndex()
+        index.rebuild(self.ledger)
+        self.ledger.add_listener(index)
+        return index
+
+    # Customer search index over the current customers
+    def _build_search(self):
+        search = CustomerSearchIndex()
+        search.rebuild(self.users_by_role('customer'))
+        return search
+
+    # Per-customer summary, kept in sync with the ledger
+    def _build_summary(self):
+        summary = CustomerSummary(self.index)  # Registered after the index, which it reads
+        summary.rebuild(self.users_by_role('customer'), self.ledger)
+        self.ledger.add_listener(summary)
+        return summary
+
+    # Build a pending derived structure (under the write lock, so no write interleaves)
+    def _build(self, name):
+        with self._write_lock:
+            if name in self._pending:
+                self.__dict__[name] = getattr(self, f'_build_{name}')()
+                self._pending.discard(name)
+        return self.__dict__[name]
+
+    # Add or refresh customers ((username, user) pairs) in the search index and summary, unless pending
+    def _customers_changed(self, items):
+        for name in ('search', 'summary'):
+            if name not in self._pending:
+                getattr(self, name).add_many(items)
+
+    # Build a user dict from a users table row (a database row or a dict with USER_FIELDS keys)
+    @staticmethod
+    def _user_from_row(row):
+        return {
+            'password': row['password'],
+            'role': row['role'],
+            'name': row['name'],
+            'subscriptions': [],  # Filled on demand through user_subscriptions()
+            'personal_details': {key: row[key] for key in ('email', 'phone', 'address') if row[key] is not None}
+        }
+
+    # Flatten a user dict into a users table row (dict with USER_FIELDS keys)
+    @staticmethod
+    def _row_from_user(username, user):
+        details = user.get('personal_details', {})
+        return {'username': username, 'password': user['password'], 'role': user.get('role', 'customer'),
+                'name': user.get('name', username), 'email': details.get('email'),
+                'phone': details.get('phone'), 'address': details.get('address')}
+
+    # Return one user as a dict (or None if the username is unknown)
+    def get_user(self, username):
+        raise NotImplementedError
+
+    # Return {username: user} for the given usernames (unknown ones are skipped), in the given order
+    def get_users(self, usernames):
+        users = {username: self.get_user(username) for username in usernames}
+        return {username: user for username, user in users.items() if user is not None}
+
+    # Create a user; returns False if the username is already taken
+    def add_user(self, username, user):
+        raise NotImplementedError
+
+    # Change fields of an existing user ('personal_details' is a nested dict)
+    def update_user(self, username, **fields):
+        raise NotImplementedError
+
+    # Return {username: user} for every user with the given role
+    def users_by_role(self, role):
+        raise NotImplementedError
+
+    # Return one page of users with the given role as ({username: user}, next_cursor)
+    # cursor is None for the first page; next_cursor is None on the last page
+    def users_page(self, role, cursor, limit):
+        raise NotImplementedError
+
+    # Count users with the given role
+    def count_users(self, role):
+        raise NotImplementedError
+
+    # Return the catalog plans (Plan records) in catalog order
+    def plans(self):
+        return self.catalog.plans()
+
+    # Return one plan by name (or None if it is not in the catalog)
+    def plan(self, name):
+        return self.catalog.get(name)
+
+    # Add a plan (a dict or Plan) to the catalog; raises ValueError if its speed or data cap is unreadable
+    def add_plan(self, plan):
+        raise NotImplementedError
+
+    # Remove a plan from the catalog by name
+    def delete_plan(self, name):
+        raise NotImplementedError
+
+    # Change fields of an existing plan (e.g. its price); raises ValueError like add_plan
+    def update_plan(self, name, **fields):
+        raise NotImplementedError
+
+    # Return every subscription as a list of dicts
+    def subscriptions(self):
+        return [self.ledger.record(row) for row in range(len(self.ledger))]
+
+    # Return one user's subscriptions, oldest first
+    def user_subscriptions(self, username):
+        return [self.ledger.record(row) for row in self.index.user_rows(self.ledger, username)]
+
+    # Return a user's first active subscription (or None)
+    def active_subscription(self, username):
+        active = self.ledger.statuses.find('active')
+        status_codes = self.ledger.column('status')
+        row = next((row for row in self.index.user_rows(self.ledger, username) if status_codes[row] == active), None)
+        return None if row is None else self.ledger.record(row)
+
+    # Record a new subscription and return its id
+    def add_subscription(self, sub):
+        raise NotImplementedError
+
+    # Change fields of an existing subscription (an unknown id changes nothing)
+    def update_subscription(self, sub_id, **fields):
+        raise NotImplementedError
+
+    # Change columns of many subscriptions in one transaction and one vectorized ledger update
+    # Each field is one value for every subscription or an array with one value per subscription;
+    # unknown ids are skipped. Returns the number of subscriptions changed
+    def update_subscriptions(self, sub_ids, **fields):
+        raise NotImplementedError
+
+    # (ledger rows, ids, fields) of an update_subscriptions call, without unknown ids and unchangeable columns
+    def _bulk_target(self, sub_ids, fields):
+        sub_ids = np.asarray(sub_ids, dtype=np.int64)
+        rows, found = self.ledger.rows_of(sub_ids)
+        fields = {column: value if np.ndim(value) == 0 else np.asarray(value)[found]
+                  for column, value in fields.items() if column in SUBSCRIPTION_COLUMNS}
+        return rows[found], sub_ids[found], fields
+
+    # Schedule a plan price change for a date ('YYYY-MM-DD'); replaces one already set for that plan and date
+    def add_price_change(self, plan, price, effective):
+        raise NotImplementedError
+
+    # Scheduled price changes as dicts with plan, price and effective, earliest first
+    def price_changes(self):
+        raise NotImplementedError
+
+    # Drop a scheduled price change (once applied or withdrawn)
+    def remove_price_change(self, plan, effective):
+        raise NotImplementedError
+
+    # Mark subscriptions expired if they are still active and ended before `today` (datetime64[D] or 'YYYY-MM-DD');
+    # checked under the write lock, so a renewal racing the expiry wins; returns the expired ids
+    def expire_subscriptions(self, sub_ids, today):
+        raise NotImplementedError
+
+    # Ledger rows and ids among sub_ids that are active and ended before `today`
+    def _expirable(self, sub_ids, today):
+        rows, found = self.ledger.rows_of(np.asarray(sub_ids, dtype=np.int64))
+        rows = rows[found]
+        rows = rows[(self.ledger.column('status')[rows] == self.ledger.statuses.find('active'))
+                    & (self.ledger.column('end_date')[rows] < np.datetime64(today, 'D'))]
+        return rows, self.ledger.column('id')[rows]
+
+    # Insert many users and subscriptions at once (e.g. generated load-test data)
+    # users is a DataFrame with USER_FIELDS columns (usernames must be new); subscriptions is a
+    # DataFrame with SUBSCRIPTION_COLUMNS; returns the ids assigned to the subscriptions, in order
+    def bulk_load(self, users=None, subscriptions=None):
+        raise NotImplementedError
+
+    # Add usage (GB) to the data_used of many subscriptions and record how far an ingestion source got,
+    # atomically; sub_ids must be unique
+    def apply_usage(self, sub_ids, deltas, source, rows, done=False):
+        raise NotImplementedError
+
+    # Return (rows processed, finished) for an ingestion source ((0, False) if never seen)
+    def get_checkpoint(self, source):
+        raise NotImplementedError
+
+    # True if the store holds no data yet (used to decide whether to seed it)
+    def is_empty(self):
+        return not self.plans()
+
+
+# Fixed-size pool of SQLite connections shared by all script threads
+class ConnectionPool:
+    def __init__(self, path, size=4, cached_statements=128):
+        self.path = path  # Database file
+        self._idle = queue.Queue()  # Connections waiting to be borrowed
+        for _ in range(size):
+            self._idle.put(self._connect(cached_statements))
+
+    # Open and configure one connection
+    def _connect(self, cached_statements):
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=cached_statements)
+        conn.row_factory = sqlite3.Row  # Rows behave like dicts
+        conn.execute("PRAGMA journal_mode=WAL")  # Readers never block each other or the writer
+        conn.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL and much cheaper than FULL
+        conn.execute("PRAGMA busy_timeout=5000")  # Wait instead of failing on a locked database
+        return conn
+
+    # Borrow a connection for the duration of a with-block
+    @contextmanager
+    def connection(self):
+        conn = self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    # Close every idle connection
+    def close(self):
+        while not self._idle.empty():
+            self._idle.get_nowait().close()
+
+
+# SQLite backend in WAL mode; one instance is shared by the whole process
+# Usage series are kept as segment files in a directory next to the database
+class SQLiteStore(Store):
+    def __init__(self, path, pool_size=4, usage_dir=None):
+        self.pool = ConnectionPool(path, pool_size)  # Pooled connections
+        self.usage = UsageStore(usage_dir or f'{path}-usage')  # Usage time series
+        self._write_lock = threading.Lock()  # SQLite allows a single writer at a time
+        with self._write() as conn:
+            conn.executescript(SCHEMA)
+        # Load the plans and the subscriptions table into memory once per process
+        with self._read() as conn:
+            self.catalog = PlanCatalog(self._plans_from_rows(conn.execute(SELECT_PLANS)))
+            subscriptions = pd.read_sql_query(SELECT_SUBSCRIPTIONS, conn)
+        self.ledger = SubscriptionLedger(capacity=max(len(subscriptions), 1024))
+        self.ledger.extend(subscriptions.fillna({'data_limit': float('inf')}))  # NULL stands for unlimited
+        self._attach_derived()
+
+    # Borrow a connection for reading
+    def _read(self):
+        return self.pool.connection()
+
+    # Borrow a connection and run the block as one serialised write transaction
+    @contextmanager
+    def _write(self):
+        with self._write_lock, self.pool.connection() as conn:
+            with conn:  # Commit on success, roll back on error
+                yield conn
+            self.version += 1  # Data changed: cached views are stale
+
+    # Typed plans from database rows; plans whose labels cannot be parsed are left out of the catalog,
+    # logged and listed in skipped_plans (shown to admins)
+    def _plans_from_rows(self, rows):
+        plans, skipped = [], []
+        for row in rows:
+            try:
+                plans.append(Plan.from_dict(dict(row)))
+            except ValueError as error:
+                logger.error("Plan %r cannot be loaded and is left out of the catalog: %s", row['name'], error)
+                skipped.append((row['name'], str(error)))
+        self.skipped_plans = tuple(skipped)
+        return plans
+
+    def get_user(self, username):
+        with self._read() as conn:
+            row = conn.execute(SELECT_USER, (username,)).fetchone()
+        return self._user_from_row(row) if row else None
+
+    def add_user(self, username, user):
+        details = user.get('personal_details', {})
+        with self._write() as conn:
+            cursor = conn.execute(INSERT_USER, (
+                username, user['password'], user.get('role', 'customer'), user.get('name', username),
+                details.get('email'), details.get('phone'), details.get('address')
+            ))
+            if cursor.rowcount == 1 and user.get('role', 'customer') == 'customer':
+                self._customers_changed([(username, user)])  # Make the new customer searchable
+        return cursor.rowcount == 1  # 0 rows means the username already existed
+
+    def update_user(self, username, **fields):
+        # Flatten the nested dicts into table columns
+        if 'personal_details' in fields:
+            fields.update(fields.pop('personal_details'))
+        columns = [column for column in USER_COLUMNS if column in fields]
+        if not columns:
+            return
+        sql = f"UPDATE users SET {', '.join(f'{column} = ?' for column in columns)} WHERE username = ?"
+        with self._write() as conn:
+            conn.execute(sql, [fields[column] for column in columns] + [username])
+            # Re-index the customer if a searchable field changed
+            if any(column in fields for column in ('name', 'email', 'phone', 'address')):
+                row = conn.execute(SELECT_USER, (username,)).fetchone()
+                if row is not None and row['role'] == 'customer':
+                    self._customers_changed([(username, self._user_from_row(row))])
+
+    def users_by_role(self, role):
+        with self._read() as conn:
+            rows = conn.execute(SELECT_USERS_BY_ROLE, (role,)).fetchall()
+        return {row['username']: self._user_from_row(row) for row in rows}
+
+    def users_page(self, role, cursor, limit):
+        # Keyset pagination on rowid; one extra row tells whether another page follows
+        with self._read() as conn:
+            rows = conn.execute(SELECT_USERS_PAGE, (role, cursor or 0, limit + 1)).fetchall()
+        users = {row['username']: self._user_from_row(row) for row in rows[:limit]}
+        return users, (rows[limit - 1]['rowid'] if len(rows) > limit else None)
+
+    def count_users(self, role):
+        with self._read() as conn:
+            return conn.execute(COUNT_USERS_BY_ROLE, (role,)).fetchone()[0]
+
+    def add_plan(self, plan):
+        if not isinstance(plan, Plan):
+            plan = Plan.from_dict(plan)  # Validates the labels before anything is written
+        with self._write() as conn:
+            conn.execute(INSERT_PLAN, (plan.name, plan.speed, plan.price, plan.data_cap, plan.description))
+            self.catalog.add(plan)
+            self.revenue.set_price(plan.name, plan.price_cents)
+
+    def delete_plan(self, name):
+        with self._write() as conn:
+            conn.execute(DELETE_PLAN, (name,))
+            self.catalog.remove(name)
+            self.revenue.remove_plan(name)
+
+    def update_plan(self, name, **fields):
+        columns = [column for column in PLAN_COLUMNS if column in fields]
+        if not columns:
+            return
+        plan = Plan.from_dict(dict(self.catalog[name].to_dict(), **{column: fields[column] for column in columns}))
+        sql = f"UPDATE plans SET {', '.join(f'{column} = ?' for column in columns)} WHERE name = ?"
+        with self._write() as conn:
+            conn.execute(sql, [fields[column] for column in columns] + [name])
+            self.catalog.add(plan)  # Replaces the old record
+            self.revenue.set_price(name, plan.price_cents)
+
+    def add_subscription(self, sub):
+        data_limit = sub.get('data_limit', float('inf'))
+        with self._write() as conn:
+            cursor = conn.execute(INSERT_SUBSCRIPTION, (
+                sub['user_id'], sub['plan'], sub['status'], sub['start_date'], sub['end_date'],
+                sub['price'], sub.get('data_used', 0), None if data_limit == float('inf') else data_limit
+            ))
+            # Mirror the new row into the ledger while still holding the write lock
+            self.ledger.append(dict(sub, id=cursor.lastrowid, data_used=sub.get('data_used', 0), data_limit=data_limit))
+        return cursor.lastrowid
+
+    def update_subscription(self, sub_id, **fields):
+        columns = [column for column in SUBSCRIPTION_COLUMNS if column in fields]
+        if not columns:
+            return
+        row = self.ledger.row_of(sub_id)
+        if row is None:
+            return
+        sql = f"UPDATE subscriptions SET {', '.join(f'{column} = ?' for column in columns)} WHERE id = ?"
+        values = [None if column == 'data_limit' and fields[column] == float('inf') else fields[column] for column in columns]  # Unlimited is stored as NULL
+        with self._write() as conn:
+            conn.execute(sql, values + [sub_id])
+            self.ledger.update(row, **{column: fields[column] for column in columns})
+
+    def update_subscriptions(self, sub_ids, **fields):
+        rows, sub_ids, fields = self._bulk_target(sub_ids, fields)
+        if not fields or not len(rows):
+            return 0
+        # One parameter list per column, in database form
+        params = []
+        for column, value in fields.items():
+            value = np.broadcast_to(np.asarray(value), rows.shape)
+            if column in ('start_date', 'end_date'):
+                params.append(np.datetime_as_string(value.astype('datetime64[D]')).tolist())
+            elif column == 'data_limit':
+                params.append([None if limit == float('inf') else limit for limit in value.astype(float).tolist()])  # Unlimited is stored as NULL
+            else:
+                params.append(value.tolist())
+        sql = f"UPDATE subscriptions SET {', '.join(f'{column} = ?' for column in fields)} WHERE id = ?"
+        with self._write() as conn:
+            conn.executemany(sql, zip(*params, sub_ids.tolist()))
+            self.ledger.update_rows(rows, **fields)
+        return len(rows)
+
+    def add_price_change(self, plan, price, effective):
+        with self._write() as conn:
+            conn.execute(UPSERT_PRICE_CHANGE, (plan, price, str(effective)))
+
+    def price_changes(self):
+        with self._read() as conn:
+            return [dict(row) for row in conn.execute(SELECT_PRICE_CHANGES)]
+
+    def remove_price_change(self, plan, effective):
+        with self._write() as conn:
+            conn.execute(DELETE_PRICE_CHANGE, (plan, str(effective)))
+
+    def expire_subscriptions(self, sub_ids, today):
+        with self._write() as conn:
+            rows, ids = self._expirable(sub_ids, today)
+            conn.executemany(EXPIRE_SUBSCRIPTION, ((sub_id,) for sub_id in ids.tolist()))
+            self.ledger.update_rows(rows, status='expired')
+        return ids
+
+    def bulk_load(self, users=None, subscriptions=None):
+        ids = np.empty(0, dtype=np.int64)
+        with self._write() as conn:
+            if users is not None and len(users):
+                users = users.reindex(columns=list(USER_FIELDS))
+                users = users.astype(object).where(users.notna(), None)  # Missing values are stored as NULL
+                conn.executemany(INSERT_USER, users.itertuples(index=False, name=None))
+                # Make the new customers searchable
+                customers = [(row.username, {'name': row.name, 'personal_details': {
+                    'email': row.email, 'phone': row.phone, 'address': row.address}})
+                    for row in users[users['role'] == 'customer'].itertuples(index=False)]
+                self._customers_changed(customers)
+            if subscriptions is not None and len(subscriptions):
+                # Ids continue after the largest existing one, so the ledger stays sorted by id
+                first = conn.execute(MAX_SUBSCRIPTION_ID).fetchone()[0] + 1
+                ids = np.arange(first, first + len(subscriptions), dtype=np.int64)
+                frame = subscriptions.reindex(columns=list(SUBSCRIPTION_COLUMNS)).assign(id=ids)
+                rows = frame[['id', *SUBSCRIPTION_COLUMNS]].astype(object)
+                for column in ('start_date', 'end_date'):
+                    rows[column] = np.datetime_as_string(np.asarray(frame[column], dtype='datetime64[D]'))
+                rows['data_limit'] = rows['data_limit'].where(np.isfinite(frame['data_limit'].astype(float)), None)  # Unlimited is stored as NULL
+                conn.executemany(INSERT_SUBSCRIPTION_WITH_ID, rows.itertuples(index=False, name=None))
+                self.ledger.extend(frame)
+        return ids
+
+    def apply_usage(self, sub_ids, deltas, source, rows, done=False):
+        sub_ids, deltas = np.asarray(sub_ids, dtype=np.int64), np.asarray(deltas, dtype=np.float64)
+        ledger_rows, found = self.ledger.rows_of(sub_ids)
+        ledger_rows, sub_ids, deltas = ledger_rows[found], sub_ids[found], deltas[found]  # Skip unknown subscriptions
+        with self._write() as conn:
+            # The usage and the checkpoint commit together, so a replayed chunk is never counted twice
+            conn.executemany(ADD_DATA_USED, zip(deltas.tolist(), sub_ids.tolist()))
+            conn.execute(UPSERT_CHECKPOINT, (source, rows, int(done)))
+            if len(ledger_rows):
+                self.ledger.bulk_update(ledger_rows, data_used=self.ledger.column('data_used')[ledger_rows] + deltas)
+
+    def get_checkpoint(self, source):
+        with self._read() as conn:
+            row = conn.execute(SELECT_CHECKPOINT, (source,)).fetchone()
+        return (row['rows'], bool(row['done'])) if row else (0, False)
+
+
+# In-memory backend (nothing is persisted unless a journal is attached, see journal.py)
+# Used as the process-wide read-only snapshot that session overlays build on (see overlay.py):
+# fill it, then freeze() it so no session can change it in place
+class MemoryStore(Store):
+    journal = None  # Journal every committed write is appended to (None = not persisted)
+
+    # defer names derived structures to build on first use (see DEFERRABLE), e.g. to bulk-load faster
+    def __init__(self, usage_dir=None, defer=()):
+        self.usage = UsageStore(usage_dir)  # Usage time series (memory only without a directory)
+        self.catalog = PlanCatalog()
+        self.ledger = SubscriptionLedger()
+        self._users = {}  # Username -> users table row
+        self._roles = {}  # Role -> usernames in creation order (pagination)
+        self._checkpoints = {}  # Ingestion source -> (rows, done)
+        self._price_changes = {}  # (plan, effective date) -> scheduled price
+        self._next_id = 1  # Id of the next subscription
+        # One writer at a time, like the database backend; reentrant, so a pending derived structure
+        # first used inside a write can be built under it
+        self._write_lock = threading.RLock()
+        self.frozen = False  # Set by freeze(); every write then raises
+        self._attach_derived(defer)
+
+    # Run the block as one serialised write; with a journal attached, the write is logged as an
+    # `event` with the given arguments and the block returns once the event is durable
+    @contextmanager
+    def _write(self, event=None, **data):
+        if self.frozen:
+            raise RuntimeError("The snapshot is read-only; write through a session overlay")
+        seq = None
+        with self._write_lock:
+            yield
+            self.version += 1  # Data changed: cached views are stale
+            if self.journal is not None and event is not None:
+                seq = self.journal.append(event, data)  # Logged in the order writes are applied
+        # Wait outside the lock, so concurrent writers share one flush (group commit)
+        if seq is not None:
+            self.journal.commit(seq)
+
+    # Make the store read-only (its ledger columns too) so it can be shared by every session
+    def freeze(self):
+        self.frozen = True
+        self.ledger.freeze()
+        self.usage.flush()
+
+    def get_user(self, username):
+        row = self._users.get(username)
+        return self._user_from_row(row) if row else None
+
+    def add_user(self, username, user):
+        # Checked before the write (under the same reentrant lock), so a duplicate is not logged and
+        # leaves the version alone
+        with self._write_lock:
+            if username in self._users:
+                return False
+            with self._write('add_user', username=username, user=user):
+                row = self._users[username] = self._row_from_user(username, user)
+                self._roles.setdefault(row['role'], []).append(username)
+                if row['role'] == 'customer':
+                    self._customers_changed([(username, user)])  # Make the new customer searchable
+        return True
+
+    def update_user(self, username, **fields):
+        if 'personal_details' in fields:
+            fields.update(fields.pop('personal_details'))
+        columns = [column for column in USER_COLUMNS if column in fields]
+        if not columns or username not in self._users:
+            return
+        with self._write('update_user', username=username, **{column: fields[column] for column in columns}):
+            # Rows are replaced rather than changed in place (a snapshot's rows are read-only)
+            row = self._users[username] = dict(self._users[username], **{column: fields[column] for column in columns})
+            if row['role'] == 'customer' and any(column in fields for column in ('name', 'email', 'phone', 'address')):
+                self._customers_changed([(username, self._user_from_row(row))])
+
+    def users_by_role(self, role):
+        return {username: self._user_from_row(self._users[username]) for username in self._roles.get(role, ())}
+
+    def users_page(self, role, cursor, limit):
+        # The cursor is the position in the role's creation order
+        usernames = self._roles.get(role, [])
+        start = cursor or 0
+        users = {username: self._user_from_row(self._users[username]) for username in usernames[start:start + limit]}
+        return users, (start + limit if start + limit < len(usernames) else None)
+
+    def count_users(self, role):
+        return len(self._roles.get(role, ()))
+
+    def add_plan(self, plan):
+        if not isinstance(plan, Plan):
+            plan = Plan.from_dict(plan)
+        with self._write('add_plan', plan=plan.to_dict()):
+            self.catalog.add(plan)
+            self.revenue.set_price(plan.name, plan.price_cents)
+
+    def delete_plan(self, name):
+        with self._write('delete_plan', name=name):
+            self.catalog.remove(name)
+            self.revenue.remove_plan(name)
+
+    def update_plan(self, name, **fields):
+        columns = [column for column in PLAN_COLUMNS if column in fields]
+        if not columns:
+            return
+        plan = Plan.from_dict(dict(self.catalog[name].to_dict(), **{column: fields[column] for column in columns}))
+        with self._write('update_plan', name=name, **{column: fields[column] for column in columns}):
+            self.catalog.add(plan)
+            self.revenue.set_price(name, plan.price_cents)
+
+    def add_subscription(self, sub):
+        with self._write('add_subscription', sub=sub):
+            sub_id, self._next_id = self._next_id, self._next_id + 1
+            self.ledger.append(dict(sub, id=sub_id, data_used=sub.get('data_used', 0),
+                                    data_limit=sub.get('data_limit', float('inf'))))
+        return sub_id
+
+    def update_subscription(self, sub_id, **fields):
+        columns = [column for column in SUBSCRIPTION_COLUMNS if column in fields]
+        row = self.ledger.row_of(sub_id)
+        if not columns or row is None:
+            return
+        with self._write('update_subscription', sub_id=sub_id, **{column: fields[column] for column in columns}):
+            self.ledger.update(row, **{column: fields[column] for column in columns})
+
+    def update_subscriptions(self, sub_ids, **fields):
+        rows, sub_ids, fields = self._bulk_target(sub_ids, fields)
+        if not fields or not len(rows):
+            return 0
+        with self._write('update_subscriptions', sub_ids=sub_ids, **fields):
+            self.ledger.update_rows(rows, **fields)
+        return len(rows)
+
+    def add_price_change(self, plan, price, effective):
+        with self._write('add_price_change', plan=plan, price=price, effective=str(effective)):
+            self._price_changes[(plan, str(effective))] = price
+
+    def price_changes(self):
+        return [{'plan': plan, 'price': price, 'effective': effective}
+                for (plan, effective), price in sorted(self._price_changes.items(), key=lambda item: (item[0][1], item[0][0]))]
+
+    def remove_price_change(self, plan, effective):
+        with self._write('remove_price_change', plan=plan, effective=str(effective)):
+            self._price_changes.pop((plan, str(effective)), None)
+
+    def expire_subscriptions(self, sub_ids, today):
+        with self._write('expire_subscriptions', sub_ids=sub_ids, today=today):
+            rows, ids = self._expirable(sub_ids, today)
+            self.ledger.update_rows(rows, status='expired')
+        return ids
+
+    def bulk_load(self, users=None, subscriptions=None):
+        ids = np.empty(0, dtype=np.int64)
+        with self._write('bulk_load', users=users, subscriptions=subscriptions):
+            if users is not None and len(users):
+                rows = users.reindex(columns=list(USER_FIELDS)).astype(object)
+                rows = rows.where(rows.notna(), None).to_dict('records')
+                for row in rows:
+                    self._users[row['username']] = row
+                    self._roles.setdefault(row['role'], []).append(row['username'])
+                customers = [(row['username'], self._user_from_row(row)) for row in rows if row['role'] == 'customer']
+                self._customers_changed(customers)
+            if subscriptions is not None and len(subscriptions):
+                ids = np.arange(self._next_id, self._next_id + len(subscriptions), dtype=np.int64)
+                self._next_id += len(subscriptions)
+                self.ledger.extend(subscriptions.reindex(columns=list(SUBSCRIPTION_COLUMNS)).assign(id=ids))
+        return ids
+
+    def apply_usage(self, sub_ids, deltas, source, rows, done=False):
+        sub_ids, deltas = np.asarray(sub_ids, dtype=np.int64), np.asarray(deltas, dtype=np.float64)
+        ledger_rows, found = self.ledger.rows_of(sub_ids)
+        ledger_rows, deltas = ledger_rows[found], deltas[found]  # Skip unknown subscriptions
+        with self._write('apply_usage', sub_ids=sub_ids[found], deltas=deltas, source=source, rows=rows, done=done):
+            self._checkpoints[source] = (rows, bool(done))
+            if len(ledger_rows):
+                self.ledger.bulk_update(ledger_rows, data_used=self.ledger.column('data_used')[ledger_rows] + deltas)
+
+    def get_checkpoint(self, source):
+        return self._checkpoints.get(source, (0, False))
+
+
+# Fill an empty store with the demo users, plans and sample subscriptions
+# The sample data is seeded, so every new store starts with the same data
+def seed_sample_data(store, seed=0):
+    rng = np.random.default_rng(seed)
+    # Subscription plans
+    for plan in SAMPLE_PLANS:
+        store.add_plan(plan)
+
+    # Seed passwords are hashed at the configured cost, like new signups
+    cost = cost_from_env()
+    # Pre-defined admin user
+    store.add_user('admin', {'password': hash_password('admin123', cost), 'role': 'admin', 'name': 'System Administrator'})
+
+    # Pre-defined customers with one active one-year subscription each, started this many days ago
+    # (dates are relative to today so the demo subscriptions are never already expired)
+    customers = [
+        ('customer1', 'John Doe', 'Premium', 290, 850, 1000, (5, 20),
+         {'email': 'john@example.com', 'phone': '123-456-7890', 'address': '123 Main St'}),
+        ('customer2', 'Alice Smith', 'Standard', 220, 450, 1000, (3, 15),
+         {'email': 'alice@example.com', 'phone': '234-567-8901', 'address': '456 Oak St'}),
+        ('customer3', 'Bob Johnson', 'Basic', 150, 300, 500, (2, 10),
+         {'email': 'bob@example.com', 'phone': '345-678-9012', 'address': '789 Pine St'})
+    ]
+    today = np.datetime64('today', 'D')
+    for username, name, plan_name, started, data_used, data_limit, usage_range, details in customers:
+        store.add_user(username, {
+            'password': hash_password(username, cost), 'role': 'customer', 'name': name,
+            'personal_details': details
+        })
+        sub_id = store.add_subscription({
+            'user_id': username, 'plan': plan_name, 'status': 'active',
+            'start_date': str(today - started), 'end_date': str(today - started + 364), 'price': store.plan(plan_name).price,
+            'data_used': data_used, 'data_limit': data_limit
+        })
+        # Daily usage for the last 30 days
+        days = today - np.arange(29, -1, -1)
+        store.usage.record_daily(sub_id, days, rng.integers(*usage_range, 30))
+
+    # 100 sample subscriptions for the admin dashboard
+    subscriptions = datagen.generate_subscriptions([f'user_{i}' for i in range(100)], store.catalog, rng)
+    store.bulk_load(subscriptions=subscriptions.assign(data_used=0.0))
+    store.usage.flush()  # Persist the sample usage
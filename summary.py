@@ -0,0 +1,149 @@
+# Materialized per-customer summary
+# One summary row per customer: contact details plus the ledger row of the customer's
+# current (first active) subscription. Details are updated by the store when a customer
+# is added or edited; the current subscription is kept in sync with the ledger
+# (registered as a listener after the index). Plan, status, dates, days remaining and
+# data usage are gathered from the ledger columns in one vectorized step, so a page of
+# the Customer Management table is a ready-made frame instead of a loop over users.
+import numpy as np  # Numerical computations
+import pandas as pd  # Data manipulation and analysis
+
+# Contact fields held per customer
+DETAILS = ('name', 'email', 'phone', 'address')
+# Columns of the summary frame, in display order
+COLUMNS = ('Username', 'Name', 'Email', 'Phone', 'Address', 'Current Plan', 'Plan Status',
+           'Start Date', 'End Date', 'Days Remaining', 'Data Used %')
+
+
+# Contact field values of a user dict
+def contact_details(user):
+    personal_details = user.get('personal_details', {})
+    return {'name': user.get('name', ''), **{field: personal_details.get(field) or '' for field in DETAILS[1:]}}
+
+
+# Summary table over the customers of a store
+class CustomerSummary:
+    def __init__(self, index):
+        self.index = index  # SubscriptionIndex of the ledger (finds a customer's subscriptions)
+        self.rows = {}  # Username -> summary row
+        self.usernames = []  # Summary row -> username
+        self.details = {field: [] for field in DETAILS}  # Field -> value per summary row
+        self.current = np.empty(0, dtype=np.int64)  # Ledger row of each customer's current subscription (-1 = none)
+
+    def __len__(self):
+        return len(self.usernames)
+
+    # Add or replace customers' details from (username, user) pairs (their subscriptions are kept)
+    def add_many(self, items):
+        added = 0
+        for username, user in items:
+            row = self.rows.get(username)
+            if row is None:
+                row = self.rows[username] = len(self.usernames)
+                self.usernames.append(username)
+                for values in self.details.values():
+                    values.append('')
+                added += 1
+            for field, value in contact_details(user).items():
+                self.details[field][row] = value
+        if added:
+            self.current = np.concatenate([self.current, np.full(added, -1, dtype=np.int64)])
+
+    # Add or replace one customer's details
+    def add(self, username, user):
+        self.add_many([(username, user)])
+
+    # Customer's first active ledger row (-1 if none), found through the index
+    def _first_active(self, ledger, username):
+        active = ledger.statuses.find('active')
+        status_codes = ledger.column('status')
+        return next((row for row in self.index.user_rows(ledger, username) if status_codes[row] == active), -1)
+
+    # Recompute the current subscription of one customer
+    def _refresh(self, ledger, username):
+        row = self.rows.get(username)
+        if row is not None:
+            self.current[row] = self._first_active(ledger, username)
+
+    # Ledger listener: a new subscription becomes current if its customer had no active one
+    def on_append(self, ledger, row):
+        row_of_customer = self.rows.get(ledger.users.label(ledger.column('user_id')[row]))
+        if row_of_customer is not None and self.current[row_of_customer] < 0 \
+                and ledger.column('status')[row] == ledger.statuses.find('active'):
+            self.current[row_of_customer] = row
+
+    # Ledger listener: many subscriptions were appended at once
+    def on_bulk_append(self, ledger, rows):
+        self._assign(ledger, rows[ledger.column('status')[rows] == ledger.statuses.find('active')], only_missing=True)
+
+    # Ledger listener: a status or owner change can change which subscription is current
+    def on_update(self, ledger, row, old):
+        if 'status' in old or 'user_id' in old:
+            self._refresh(ledger, ledger.users.label(ledger.column('user_id')[row]))
+            if 'user_id' in old:
+                self._refresh(ledger, ledger.users.label(old['user_id']))
+
+    # Ledger listener: many rows changed at once; recompute if statuses or owners moved
+    def on_bulk_update(self, ledger, rows, old):
+        if 'status' in old or 'user_id' in old:
+            self.rebuild_current(ledger)
+
+    # Point customers at the first of the given active rows they own (rows in ledger order)
+    # only_missing keeps the current subscription of customers that already have one
+    def _assign(self, ledger, rows, only_missing=False):
+        codes, first = np.unique(ledger.column('user_id')[rows], return_index=True)
+        targets = np.array([self.rows.get(ledger.users.label(code), -1) for code in codes.tolist()], dtype=np.int64)
+        keep = targets >= 0
+        targets, firsts = targets[keep], rows[first[keep]]
+        if only_missing:
+            missing = self.current[targets] < 0
+            targets, firsts = targets[missing], firsts[missing]
+        self.current[targets] = firsts
+
+    # Recompute every customer's current subscription in one vectorized pass over the ledger
+    def rebuild_current(self, ledger):
+        self.current[:] = -1
+        self._assign(ledger, np.flatnonzero(ledger.column('status') == ledger.statuses.find('active')))
+
+    # Rebuild the summary from a {username: user} mapping of customers and the ledger
+    def rebuild(self, users, ledger):
+        self.rows, self.usernames = {}, []
+        self.details = {field: [] for field in DETAILS}
+        self.current = np.empty(0, dtype=np.int64)
+        self.add_many(users.items())
+        self.rebuild_current(ledger)
+
+    # (usernames, {field: values}, current ledger rows) of the given customers (unknown ones are skipped)
+    def _lookup(self, usernames):
+        usernames = [username for username in usernames if username in self.rows]
+        rows = [self.rows[username] for username in usernames]
+        details = {field: [values[row] for row in rows] for field, values in self.details.items()}
+        return usernames, details, self.current[rows]
+
+    # Summary rows of the given customers (default every customer) as a DataFrame with COLUMNS
+    # Days remaining are counted from `today` (date or 'YYYY-MM-DD'; default today)
+    def frame(self, ledger, usernames=None, today=None):
+        usernames, details, current = self._lookup(self.usernames if usernames is None else usernames)
+        has = current >= 0
+        rows = np.where(has, current, 0)  # Any valid row where there is no subscription (masked below)
+        count = len(usernames)
+        frame = pd.DataFrame({'Username': usernames, 'Name': details['name'], 'Email': details['email'],
+                              'Phone': details['phone'], 'Address': details['address']})
+        if has.any():
+            plans = np.asarray(ledger.plans.labels, dtype=object)[ledger.column('plan')[rows]]
+            statuses = np.asarray(ledger.statuses.labels, dtype=object)[ledger.column('status')[rows]]
+            starts, ends = ledger.column('start_date')[rows], ledger.column('end_date')[rows]
+            remaining = (ends - np.datetime64('today' if today is None else today, 'D')).astype(np.int64)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                used = ledger.column('data_used')[rows] / ledger.column('data_limit')[rows] * 100  # 0 when unlimited
+        else:
+            plans = statuses = np.full(count, None, dtype=object)
+            starts = ends = np.full(count, np.datetime64('NaT'), dtype='datetime64[D]')
+            remaining = used = np.zeros(count)
+        frame['Current Plan'] = np.where(has, plans, 'None')
+        frame['Plan Status'] = np.where(has, statuses, 'None')
+        frame['Start Date'] = np.where(has, np.datetime_as_string(starts), 'N/A')
+        frame['End Date'] = np.where(has, np.datetime_as_string(ends), 'N/A')
+        frame['Days Remaining'] = pd.Series(np.where(has, remaining, 0), dtype='Int64').where(has)  # Missing without a plan
+        frame['Data Used %'] = pd.Series(np.round(np.where(has, used, np.nan), 1))
+        return frame
@@ -0,0 +1,270 @@
+# Compact usage time-series store
+# Usage is kept per subscription as (period, GB) points in three tiers:
+# hourly points for recent history plus daily and monthly rollups.
+# New points go to an in-memory columnar buffer; flush() seals the buffer into
+# sorted, append-only segments (optionally .npy files opened memory-mapped),
+# and compaction merges segments and applies the retention of each tier.
+# Points recorded from an ingestion source carry a watermark (records of the source
+# read so far) that is sealed with each segment, so a batch replayed after a crash
+# is not recorded twice.
+import glob  # Finding segment files on disk
+import json  # Watermarks stored next to segment files
+import os  # Paths of segment files
+import threading  # Lock for concurrent ingestion and queries
+
+import numpy as np  # Numerical computations
+import pandas as pd  # Data manipulation and analysis
+
+# Time tiers and the datetime64 unit of their periods
+TIERS = {'hour': 'h', 'day': 'D', 'month': 'M'}
+# How long each tier keeps points (in periods of that tier; None = forever)
+DEFAULT_RETENTION = {'hour': 24 * 90, 'day': 366 * 5, 'month': None}
+# One stored point: subscription id, period number since 1970 in the tier's unit, GB used
+POINT_DTYPE = np.dtype([('sub_id', '<i8'), ('period', '<i4'), ('value', '<f4')])
+# Buffered points per tier before they are sealed into a segment
+FLUSH_POINTS = 500_000
+# Segments per tier before they are merged into one
+MAX_SEGMENTS = 8
+
+
+# Convert datetimes/strings/period numbers to integer periods of a tier
+def to_periods(times, tier):
+    times = np.asarray(times)
+    if np.issubdtype(times.dtype, np.integer):
+        return times.astype(np.int64)
+    return times.astype(f'datetime64[{TIERS[tier]}]').astype(np.int64)
+
+
+# Sum values that share the same key; returns (unique keys, sums)
+def sum_by(keys, values):
+    unique, inverse = np.unique(keys, return_inverse=True)
+    return unique, np.bincount(inverse, weights=values, minlength=len(unique))
+
+
+# File holding the ingestion watermarks sealed with a segment file
+def _watermark_path(path):
+    return path[:-len('.npy')] + '.json'
+
+
+# Growable columnar buffer of points for one tier
+class _Buffer:
+    def __init__(self, capacity=1024):
+        self.points = np.empty(capacity, dtype=POINT_DTYPE)
+        self.size = 0
+
+    # Append arrays of points (amortised O(1) per point)
+    def extend(self, sub_ids, periods, values):
+        count = len(sub_ids)
+        if self.size + count > len(self.points):
+            grown = np.empty(max(2 * len(self.points), self.size + count), dtype=POINT_DTYPE)
+            grown[:self.size] = self.points[:self.size]
+            self.points = grown
+        chunk = self.points[self.size:self.size + count]
+        chunk['sub_id'], chunk['period'], chunk['value'] = sub_ids, periods, values
+        self.size += count
+
+    # Points in use
+    def view(self):
+        return self.points[:self.size]
+
+
+# Sealed segment: points sorted by (sub_id, period); the array may be memory-mapped
+class _Segment:
+    def __init__(self, points, path=None):
+        self.points = points
+        self.path = path  # File backing the segment (None if held in memory)
+
+    # Sort points and sum duplicates into a segment array
+    @staticmethod
+    def seal(points):
+        if not len(points):
+            return np.empty(0, dtype=POINT_DTYPE)
+        keys = np.stack([points['sub_id'], points['period'].astype(np.int64)])
+        unique, inverse = np.unique(keys, axis=1, return_inverse=True)
+        sealed = np.empty(unique.shape[1], dtype=POINT_DTYPE)
+        sealed['sub_id'], sealed['period'] = unique[0], unique[1]
+        sealed['value'] = np.bincount(inverse.ravel(), weights=points['value'], minlength=unique.shape[1])
+        return sealed
+
+    # Points of one subscription (binary search on the sorted sub_id column)
+    def slice(self, sub_id):
+        sub_ids = self.points['sub_id']
+        return self.points[np.searchsorted(sub_ids, sub_id, 'left'):np.searchsorted(sub_ids, sub_id, 'right')]
+
+
+# Usage store with hourly ingestion, daily/monthly rollups, retention and range queries
+class UsageStore:
+    def __init__(self, directory=None, retention=None, flush_points=FLUSH_POINTS, max_segments=MAX_SEGMENTS):
+        self.directory = directory  # Where segments are written (None = memory only)
+        self.retention = dict(DEFAULT_RETENTION, **(retention or {}))
+        self.flush_points = flush_points
+        self.max_segments = max_segments
+        self._lock = threading.RLock()
+        self._buffers = {tier: _Buffer() for tier in TIERS}  # Unsealed points per tier
+        self._segments = {tier: [] for tier in TIERS}  # Sealed segments per tier, oldest first
+        self._sequence = 0  # Number used for the next segment file
+        self._recorded = {tier: {} for tier in TIERS}  # Source -> records recorded per tier (buffered or sealed)
+        self._sealed = {tier: {} for tier in TIERS}  # Source -> records sealed into segments per tier
+        self.version = 0  # Bumped whenever usage is recorded (used to invalidate cached views)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._open_segments()
+
+    # Open existing segment files memory-mapped
+    def _open_segments(self):
+        for tier in TIERS:
+            for path in sorted(glob.glob(os.path.join(self.directory, f'{tier}-*.npy'))):
+                self._segments[tier].append(_Segment(np.load(path, mmap_mode='r'), path))
+                self._sequence = max(self._sequence, int(os.path.basename(path).split('-')[1].split('.')[0]) + 1)
+                if os.path.exists(_watermark_path(path)):
+                    with open(_watermark_path(path)) as f:
+                        self._sealed[tier].update(json.load(f))  # Later segments carry later watermarks
+            self._recorded[tier] = dict(self._sealed[tier])
+
+    # Record hourly usage for many subscriptions at once
+    # sub_ids, hours and values are equal-length arrays; hours are datetimes or hour numbers
+    # With a `source`, `position` is how many of its records have been read once this batch is in; tiers
+    # that already hold the source up to `position` (a batch replayed after a crash) are left alone
+    def record_batch(self, sub_ids, hours, values, source=None, position=None):
+        sub_ids = np.asarray(sub_ids, dtype=np.int64)
+        hours = to_periods(hours, 'hour')
+        values = np.asarray(values, dtype=np.float64)
+        if not len(sub_ids) and source is None:
+            return
+        # Roll the hourly points up into days and months in the same pass
+        days = hours // 24
+        months = days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+        with self._lock:
+            for tier, periods in (('hour', hours), ('day', days), ('month', months)):
+                if source is not None:
+                    if self._recorded[tier].get(source, 0) >= position:
+                        continue
+                    self._recorded[tier][source] = position
+                if not len(sub_ids):
+                    continue
+                # Pre-aggregate per (subscription, period) so the buffer stays small
+                keys = sub_ids * (1 << 32) + (periods - periods.min())
+                unique, sums = sum_by(keys, values)
+                self._buffers[tier].extend(unique >> 32, (unique & 0xFFFFFFFF) + periods.min(), sums)
+            if len(sub_ids):
+                self.version += 1
+            if self._buffers['hour'].size >= self.flush_points:
+                self.flush()
+
+    # Record hourly usage for one subscription
+    def record(self, sub_id, hours, values):
+        self.record_batch(np.full(len(values), sub_id), hours, values)
+
+    # Record daily totals for one subscription, spread evenly over the hours of each day
+    def record_daily(self, sub_id, days, totals):
+        days = to_periods(days, 'day')
+        hours = (days[:, None] * 24 + np.arange(24)).ravel()
+        self.record(sub_id, hours, np.repeat(np.asarray(totals, dtype=np.float64) / 24, 24))
+
+    # Seal buffered points into a new segment per tier (written to disk if a directory is set)
+    def flush(self):
+        with self._lock:
+            for tier, buffer in self._buffers.items():
+                if not buffer.size and self._sealed[tier] == self._recorded[tier]:
+                    continue
+                points = _Segment.seal(buffer.view())
+                self._buffers[tier] = _Buffer()
+                self._sealed[tier] = dict(self._recorded[tier])
+                self._segments[tier].append(self._write_segment(tier, points))
+                if len(self._segments[tier]) > self.max_segments:
+                    self.compact(tier)
+
+    # Persist a sealed array as a segment file and reopen it memory-mapped
+    def _write_segment(self, tier, points):
+        if not self.directory:
+            return _Segment(points)
+        path = os.path.join(self.directory, f'{tier}-{self._sequence:08d}.npy')
+        self._sequence += 1
+        if self._sealed[tier]:
+            # Written first, so a segment file never exists without its watermarks
+            with open(_watermark_path(path) + '.tmp', 'w') as f:
+                json.dump(self._sealed[tier], f)
+            os.replace(_watermark_path(path) + '.tmp', _watermark_path(path))
+        with open(path + '.tmp', 'wb') as f:
+            np.save(f, points)
+        os.replace(path + '.tmp', path)  # Atomic: a crash never leaves a partial segment
+        return _Segment(np.load(path, mmap_mode='r'), path)
+
+    # Merge every segment of a tier into one, dropping points older than the tier's retention
+    def compact(self, tier):
+        with self._lock:
+            segments = self._segments[tier]
+            if not segments:
+                return
+            points = _Segment.seal(np.concatenate([segment.points for segment in segments]))
+            keep = self.retention[tier]
+            if keep is not None:
+                now = to_periods(np.datetime64('now'), tier)
+                points = points[points['period'] > now - keep]
+            merged = self._write_segment(tier, points)
+            for segment in segments:
+                if segment.path:
+                    os.remove(segment.path)
+                    if os.path.exists(_watermark_path(segment.path)):
+                        os.remove(_watermark_path(segment.path))
+            self._segments[tier] = [merged]
+
+    # All stored points of one subscription in a tier, summed per period and sorted
+    def _points(self, sub_id, tier):
+        with self._lock:
+            parts = [segment.slice(sub_id) for segment in self._segments[tier]]
+            buffered = self._buffers[tier].view()
+            parts.append(buffered[buffered['sub_id'] == sub_id])
+        points = np.concatenate(parts) if parts else np.empty(0, dtype=POINT_DTYPE)
+        return sum_by(points['period'].astype(np.int64), points['value'].astype(np.float64))
+
+    # Usage of one subscription in a tier between start and end (inclusive), as a Series indexed by period start
+    def query(self, sub_id, tier='day', start=None, end=None):
+        periods, values = self._points(sub_id, tier)
+        mask = np.ones(len(periods), dtype=bool)
+        if start is not None:
+            mask &= periods >= to_periods(np.datetime64(start), tier)
+        if end is not None:
+            mask &= periods <= to_periods(np.datetime64(end), tier)
+        index = pd.DatetimeIndex(periods[mask].astype(f'datetime64[{TIERS[tier]}]'), name=tier)
+        return pd.Series(values[mask], index=index, name='usage_gb')
+
+    # Dense daily usage (GB) for the `days` days ending on `end` (default today), zeros where nothing was recorded
+    def daily(self, sub_id, days=30, end=None):
+        last = to_periods(np.datetime64(end or 'today', 'D'), 'day')
+        periods, values = self._points(sub_id, 'day')
+        dense = np.zeros(days)
+        mask = (periods > last - days) & (periods <= last)
+        dense[periods[mask] - (last - days + 1)] = values[mask]
+        return dense
+
+    # Total usage (GB) of one subscription between two dates (inclusive)
+    def total(self, sub_id, start, end):
+        return float(self.query(sub_id, 'day', start, end).sum())
+
+    # Every point of a tier as DataFrame chunks (sub_id, period start, usage_gb), sorted by subscription
+    # Read-only: segments and buffered points are merged one range of subscription ids at a time (about
+    # chunk_size points per segment) without sealing or compacting anything; points past retention are skipped
+    def iter_points(self, tier='day', chunk_size=100_000):
+        with self._lock:
+            sources = [segment.points for segment in self._segments[tier]]
+            sources.append(_Segment.seal(self._buffers[tier].view()))  # A sealed copy of the buffer
+        keep = self.retention[tier]
+        oldest = None if keep is None else to_periods(np.datetime64('now'), tier) - keep
+        # Ranges start at every chunk_size-th subscription id of each source
+        starts = np.unique(np.concatenate([points['sub_id'][::chunk_size] for points in sources])).tolist()
+        for low, high in zip(starts, starts[1:] + [None]):
+            parts = []
+            for points in sources:
+                sub_ids = points['sub_id']
+                end = len(points) if high is None else np.searchsorted(sub_ids, high, 'left')
+                parts.append(points[np.searchsorted(sub_ids, low, 'left'):end])
+            chunk = _Segment.seal(np.concatenate(parts))  # Sums a period split across segments
+            if oldest is not None:
+                chunk = chunk[chunk['period'] > oldest]
+            if len(chunk):
+                yield pd.DataFrame({
+                    'sub_id': chunk['sub_id'],
+                    'period': chunk['period'].astype(np.int64).astype(f'datetime64[{TIERS[tier]}]'),
+                    'usage_gb': chunk['value'],
+                })